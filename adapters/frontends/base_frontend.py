@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Optional, Set, Tuple
 from core.event_bus import EventBus
-from core.events import EventType
+from core.events import EventType, ResponseChunkEvent, StatusUpdateEvent
 from services.session_manager import SessionManager
 from utils.config_loader import ModelConfig
 
@@ -21,8 +21,9 @@ class BaseFrontend(ABC):
         self.event_bus = event_bus
         self.session_manager = session_manager
         self.config = config
+        # 处于 <think> 标签内的回复流（按correlation_id）；多个会话的回复可能同时输出，状态不能共用
+        self._thinking_streams: Set[str] = set()
         self._bootstrap_ui()
-        self.in_think = False  # 新增：用于标记是否在 <think> 标签内
 
     def _bootstrap_ui(self):
         """引导式UI初始化（模板方法模式）"""
@@ -64,17 +65,25 @@ class BaseFrontend(ABC):
 
     # ---------- 事件处理接口 ----------
     
+    @staticmethod
+    def _stream_target(data: dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        """从STREAM_START/STREAM_END数据中取出回复所属的 (session_id, correlation_id)"""
+        metadata = data.get("metadata", {})
+        return metadata.get("session_id"), data.get("correlation_id") or metadata.get("correlation_id")
+
     def handle_stream_start(self, data: dict[str, Any]):
         """处理输出内容更新事件"""
-        content_type = data.get("type", "text")
-        self.update_display("AI: \n\n", content_type='assistant')
+        session_id, correlation_id = self._stream_target(data)
+        self.update_stream_display("AI: \n\n", 'assistant', session_id, correlation_id)
     
     def handle_stream_end(self, data: dict[str, Any]):
         """处理输出内容更新事件"""
-        self.update_display("\n", content_type='assistant')
+        session_id, correlation_id = self._stream_target(data)
+        self._thinking_streams.discard(correlation_id)
+        self.update_stream_display("\n", 'assistant', session_id, correlation_id)
 
     @abstractmethod
-    def handle_status_update(self, data: dict[str, Any]):
+    def handle_status_update(self, data: StatusUpdateEvent):
         """处理系统状态更新事件"""
         pass
 
@@ -88,33 +97,44 @@ class BaseFrontend(ABC):
         """处理安全警报事件（权限校验/敏感操作拦截）"""
         pass
 
-    def handle_response_chunk(self, event_data: dict[str, Any]):
+    def handle_response_chunk(self, event_data: ResponseChunkEvent):
         """处理流式响应分块（支持 <think> 和 </think> 标签包裹的思考内容）"""
-        chunk = event_data["chunk"]
-        content = chunk["content"]
+        content = event_data.chunk.content
+        stream = event_data.correlation_id
+
+        def display(text: str, content_type: str):
+            self.update_stream_display(text, content_type, event_data.session_id, stream)
 
+        in_think = stream in self._thinking_streams
         # 处理内容中的 <think> 和 </think> 标签
         if "<think>" in content:
             before_think, rest = content.split("<think>", 1)
             if before_think:
-                self.update_display(before_think, content_type='response')
-            self.update_display("思考中...\n", content_type='think')  # 替换 <think> 标签
+                display(before_think, 'response')
+            display("思考中...\n", 'think')  # 替换 <think> 标签
             content = rest
-            self.in_think = True
+            in_think = True
 
-        if "</think>" in content and self.in_think:
+        if "</think>" in content and in_think:
             think_content, after_think = content.split("</think>", 1)
-            self.update_display(think_content, content_type='think')
-            self.update_display("思考完成.\n", content_type='think')  # 替换 </think> 标签
+            display(think_content, 'think')
+            display("思考完成.\n", 'think')  # 替换 </think> 标签
             content = after_think
-            self.in_think = False
+            in_think = False
 
         # 如果在 <think> 标签内，继续使用 think 标记
-        if self.in_think:
-            self.update_display(content, content_type='think')
+        if in_think:
+            self._thinking_streams.add(stream)
+            display(content, 'think')
         else:
+            self._thinking_streams.discard(stream)
             if content:
-                self.update_display(content, content_type='response')
+                display(content, 'response')
+
+    def update_stream_display(self, content: str, content_type: str,
+                              session_id: Optional[str] = None, correlation_id: Optional[str] = None):
+        """显示属于某个回复流的内容（默认直接显示；按会话/回复路由的前端重写）"""
+        self.update_display(content, content_type=content_type)
 
     # ---------- 用户交互接口 ----------
     @abstractmethod
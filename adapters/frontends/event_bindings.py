@@ -9,23 +9,25 @@ class TkinterEventBinder:
     }
 
     @classmethod
-    def bind_all(cls, master, event_bus):
+    def bind_all(cls, master, event_bus, session_id: str = None):
         """自动绑定所有预设事件"""
         for tk_event, std_event in cls._EVENT_MAP.items():
             master.bind_all(tk_event,
-                            lambda e, ev=std_event: cls._translate_event(e, ev, event_bus)
+                            lambda e, ev=std_event: cls._translate_event(e, ev, event_bus, session_id)
                             )
 
     @staticmethod
-    def _translate_event(tk_event: Event, std_event: EventType, bus):
+    def _translate_event(tk_event: Event, std_event: EventType, bus, session_id: str = None):
         """将Tkinter事件转换为标准事件"""
+        # 未携带session_id时由处理方使用当前会话
         event_data = {
-            "session_id": self.session_manager.get_current_session(),
             "source": "tkinter",
             "widget": tk_event.widget,
             "timestamp": tk_event.time,
             "coordinates": (tk_event.x, tk_event.y)
         }
+        if session_id:
+            event_data["session_id"] = session_id
 
         if std_event == EventType.USER_INPUT:
             event_data["text"] = tk_event.widget.get("1.0", "end-1c")
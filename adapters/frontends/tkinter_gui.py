@@ -1,11 +1,10 @@
-import asyncio
 import tkinter as tk
 from tkinter import ttk, scrolledtext
 from typing import Any, Dict
 from adapters.frontends.base_frontend import BaseFrontend
 from adapters.frontends.event_bindings import TkinterEventBinder
 from core.event_bus import EventBus
-from core.events import EventType
+from core.events import EventType, StatusUpdateEvent
 from services.session_manager import SessionManager
 
 class TkinterFrontend(BaseFrontend):
@@ -13,13 +12,14 @@ class TkinterFrontend(BaseFrontend):
         self.event_bus = event_bus
         self.session_manager = session_manager
         self.config = config
-        
-        self.loop = asyncio.new_event_loop()  # 初始化事件循环
 
         # 重新创建 root 主窗口
         self.root = tk.Tk()
         self.root.title("Smart Terminal")
         self.root.geometry("800x600")  # 设置初始窗口大小
+        self._draft_after_id = None  # 草稿防抖定时器
+        # 窗口持有自己的会话（启动时沿用最近的会话），发布的事件都携带该会话ID
+        self.session_id = session_manager.get_current_session()
         super().__init__(event_bus, session_manager, config)
         self._response_buffer = ""  # 新增：用于缓存流式输出内容
 
@@ -95,21 +95,34 @@ class TkinterFrontend(BaseFrontend):
 
     def _setup_event_system(self):
         """设置Tkinter事件系统"""
-        TkinterEventBinder.bind_all(self.root, self.event_bus)
+        TkinterEventBinder.bind_all(self.root, self.event_bus, self.session_id)
 
         # 自定义事件绑定
         self.root.bind("<Control-Return>", lambda e: self.event_bus.publish(EventType.USER_INPUT))
 
-    def async_poll(self):
-        self.loop.run_until_complete(asyncio.sleep(0))
-        self.root.after(50, self.async_poll)
-        
+        # 输入草稿（防抖后发布，用于检索预取）
+        if self.config.get("draft_input", {}).get("enabled", False):
+            self.input_area.bind("<KeyRelease>", self._on_draft_changed)
+
+    def _on_draft_changed(self, event=None):
+        """输入停顿超过防抖间隔后发布DRAFT_INPUT"""
+        if self._draft_after_id:
+            self.root.after_cancel(self._draft_after_id)
+        debounce_ms = self.config.get("draft_input", {}).get("debounce_ms", 400)
+        self._draft_after_id = self.root.after(debounce_ms, self._publish_draft)
+
+    def _publish_draft(self):
+        self._draft_after_id = None
+        text = self.input_area.get("1.0", "end-1c").strip()
+        if text:
+            self.event_bus.publish(EventType.DRAFT_INPUT, {
+                "text": text,
+                "session_id": self.session_id
+            })
+
     def start(self):
-        """启动前端主循环"""
-        print("事件循环1。")
-        self.async_poll()
+        """启动前端主循环（协程事件处理由EventBus的事件循环线程负责，无需轮询）"""
         self.root.mainloop()
-        self.loop.close()
             
 
     # ---------- 具体组件构建 ----------
@@ -183,13 +196,14 @@ class TkinterFrontend(BaseFrontend):
 
     # ---------- 事件处理接口实现 ----------
 
-    def handle_status_update(self, data: Dict[str, Any]):
+    def handle_status_update(self, data: StatusUpdateEvent):
         status_map = {
             "processing": "🔄 处理中...",
             "idle": "✅ 就绪",
-            "generating": "🤖 生成中"
+            "generating": "🤖 生成中",
+            "queued": f"⏳ 排队中（第{data.queue_position}位）"
         }
-        self.status_label.config(text=status_map.get(data.get("state"), "❓ 未知状态"))
+        self.status_label.config(text=status_map.get(data.state, "❓ 未知状态"))
 
     def handle_error(self, data: Dict[str, Any]):
         error_msg = f"⛔ 错误 [{data.get('stage', '未知阶段')}]: {data.get('message', '未知错误')}"
@@ -222,7 +236,7 @@ class TkinterFrontend(BaseFrontend):
         self.update_display(f"{user_input}\n", content_type='user_input')  # 使用现有的user_input样式
 
         # 显式验证会话ID
-        session_id = self.session_manager.get_current_session()
+        session_id = self.session_id
         if not session_id:
             self.handle_error({
                 "stage": "发送处理",
@@ -233,10 +247,11 @@ class TkinterFrontend(BaseFrontend):
         # 增加调试日志
         print(f"Publishing USER_INPUT: {user_input}")
 
-        self.loop.create_task(self._async_publish_event({
+        self.event_bus.publish(EventType.USER_INPUT, {
             "text": user_input,
             "session_id": session_id
-        }))
+        })
+        self.clear_user_input()
 
     # ---------- 私有方法 ----------
     def _append_history(self, content: str, tag: str = None):
@@ -263,14 +278,10 @@ class TkinterFrontend(BaseFrontend):
         if not user_input:
             return
         self.handle_user_input(self.get_user_input());
-    async def _async_publish_event(self, data):
-        await self.event_bus.publish_async(EventType.USER_INPUT, data)
-        self.clear_user_input()
     def _on_clear_button_click(self):
         """处理清空按钮点击事件"""
-        session_id = self.session_manager.get_current_session()
         self.event_bus.publish(EventType.CLEAR_HISTORY, {
-            "session_id": session_id
+            "session_id": self.session_id
         })
 
 
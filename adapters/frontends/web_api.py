@@ -1,17 +1,76 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Set
 from fastapi import FastAPI, WebSocket, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 from core.event_bus import EventBus
-from core.events import EventType
+from core.events import EventType, StatusUpdateEvent
+from core.stream_replay import ReplayConfig, StreamReplayBuffer
 from services.session_manager import SessionManager
 from adapters.frontends.base_frontend import BaseFrontend
+from collections import deque
 import json
 import asyncio
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class _ConnectionSender:
+    """
+    单个WebSocket连接的有界发送队列，由该连接自己的发送协程按序发送（只在服务器事件循环中使用）
+    状态帧只保留最新一条；队列满说明客户端跟不上，关闭连接让其重连后按序号从重放缓冲续传
+    """
+
+    def __init__(self, frontend: 'WebAPIFrontend', websocket: WebSocket, maxsize: int):
+        self.frontend = frontend
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self._frames: deque = deque()  # (是否状态帧, 消息)
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._closing = None
+        self.task = asyncio.create_task(self._run())
+
+    def put(self, message: str, is_status: bool):
+        if self._closed:
+            return
+        if is_status:
+            self._frames = deque(f for f in self._frames if not f[0])
+        if len(self._frames) >= self.maxsize:
+            logger.warning(f"WebSocket发送队列已满（{self.maxsize}），断开慢速连接")
+            self.close()
+            # 接收循环随之结束并注销连接，客户端重连后按序号续传
+            self._closing = asyncio.create_task(self._close_websocket())
+            return
+        self._frames.append((is_status, message))
+        self._ready.set()
+
+    def close(self):
+        self._closed = True
+        self.task.cancel()
+        self._frames.clear()
+
+    async def _run(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._frames:
+                    _, message = self._frames.popleft()
+                    await self.websocket.send_text(message)
+        except Exception:
+            self.frontend._unregister_connection(self.websocket)
+
+    async def _close_websocket(self):
+        try:
+            await self.websocket.close(code=1013)  # Try Again Later
+        except Exception:
+            pass
+
 
 class WebAPIFrontend(BaseFrontend):
     def __init__(self, event_bus: EventBus, session_manager: SessionManager, config: dict):
@@ -19,8 +78,16 @@ class WebAPIFrontend(BaseFrontend):
         self.templates = Jinja2Templates(directory="templates")
         self._setup_routes()
         self._response_buffer = ""
-        self.in_think = False
-        self.active_connections = set()
+        # 每个连接持有自己的会话：{websocket: session_id} 与反向索引 {session_id: {websocket}}
+        self.active_connections: Dict[WebSocket, str] = {}
+        self._session_connections: Dict[str, Set[WebSocket]] = {}
+        # 每个连接的有界发送队列，慢速客户端不会在服务器事件循环中堆积待发送的帧
+        self._senders: Dict[WebSocket, _ConnectionSender] = {}
+        self._send_queue_size = config.get("send_queue_size", 256)
+        self._draft_input_enabled = config.get("draft_input", {}).get("enabled", False)
+        self._server_loop = None  # uvicorn事件循环，WebSocket发送必须在该循环中执行
+        # 流式输出重放缓冲：断线重连的客户端按最后确认的序号续传
+        self.replay_buffer = StreamReplayBuffer(ReplayConfig.from_config(config.get("replay_buffer")))
         super().__init__(event_bus, session_manager, config)
 
     def _configure_theme(self):
@@ -47,58 +114,166 @@ class WebAPIFrontend(BaseFrontend):
         async def get_index(request: Request):
             return self.templates.TemplateResponse("index.html", {"request": request})
 
+        @self.app.get("/metrics", response_class=PlainTextResponse)
+        async def get_metrics():
+            """事件总线指标（Prometheus文本格式）"""
+            render = getattr(self.event_bus.metrics, "render_text", None)
+            return render() if render else ""
+
         @self.app.websocket("/ws")
         async def websocket_endpoint(websocket: WebSocket):
             await websocket.accept()
-            self.active_connections.add(websocket)
+            self._server_loop = asyncio.get_running_loop()
+            # 客户端重连时携带之前分配的session_id继续原会话，否则新建会话
+            session_id = await asyncio.to_thread(
+                self.session_manager.open_session, websocket.query_params.get("session_id"), "web"
+            )
+            self._register_connection(websocket, session_id)
             try:
+                await websocket.send_text(json.dumps({
+                    "type": "session", "session_id": session_id, "draft_input": self._draft_input_enabled
+                }))
                 while True:
                     data = await websocket.receive_text()
-                    self.handle_user_input()
-                    self.event_bus.publish(EventType.USER_INPUT, {"input": data})
+                    if not await self._handle_control_message(websocket, data):
+                        self.handle_user_input(data, session_id)
             except Exception as e:
                 print(f"WebSocket error: {e}")
             finally:
-                self.active_connections.remove(websocket)
+                self._unregister_connection(websocket)
 
     def start(self):
         """启动FastAPI服务"""
         uvicorn.run(self.app, host=self.config.get('host','127.0.0.0'), port=self.config.get('port',8080))
 
-    async def handle_status_update(self, data: Dict[str, Any]):
+    def handle_status_update(self, data: StatusUpdateEvent):
         """处理状态更新事件"""
         status_map = {
             "processing": "🔄 处理中...",
             "idle": "✅ 就绪",
-            "generating": "🤖 生成中"
+            "generating": "🤖 生成中",
+            "queued": f"⏳ 排队中（第{data.queue_position}位）"
         }
-        status_text = status_map.get(data.get("state"), "❓ 未知状态")
-        await self.update_display(status_text, content_type="status")
+        status_text = status_map.get(data.state, "❓ 未知状态")
+        self.update_display(status_text, content_type="status", session_id=data.session_id or None)
 
-    async def handle_error(self, data: Dict[str, Any]):
+    def handle_error(self, data: Dict[str, Any]):
         """处理错误事件"""
         error_msg = f"⛔ 错误 [{data.get('stage', '未知阶段')}]: {data.get('message', '未知错误')}"
-        await self.update_display(error_msg, content_type="error")
+        self.update_display(error_msg, content_type="error", session_id=data.get("session_id"))
 
-    async def handle_security_alert(self, data: Dict[str, Any]):
+    def handle_security_alert(self, data: Dict[str, Any]):
         """处理安全警报事件"""
         pass
 
-    async def update_display(self, content: str, content_type: str = "text"):
-        """通过WebSocket更新显示内容"""
-        for connection in self.active_connections:
-            await connection.send_text(json.dumps({
-                "type": content_type,
-                "content": content
-            }))
+    def handle_stream_end(self, data: dict[str, Any]):
+        super().handle_stream_end(data)
+        _, correlation_id = self._stream_target(data)
+        if correlation_id and self.replay_buffer.config.enabled:
+            self.replay_buffer.finish(correlation_id)
+
+    def update_stream_display(self, content: str, content_type: str,
+                              session_id: Optional[str] = None, correlation_id: Optional[str] = None):
+        """回复正文帧：带correlation_id/seq，只发送给所属会话的连接"""
+        self._send_frame(content, content_type, session_id, correlation_id)
+
+    def update_display(self, content: str, content_type: str = "text", session_id: Optional[str] = None):
+        """
+        通过WebSocket更新显示内容（可在任意线程调用，发送调度到服务器事件循环执行）
+        :param session_id: 只发送给该会话的连接，未指定时广播；状态/错误帧不归属任何回复
+        """
+        self._send_frame(content, content_type, session_id, None)
+
+    def _send_frame(self, content: str, content_type: str, session_id: Optional[str], correlation_id: Optional[str]):
+        frame = {
+            "type": content_type,
+            "content": content
+        }
+        if correlation_id and self.replay_buffer.config.enabled:
+            # 流式输出帧先写入重放缓冲，即使当前无连接也可在重连后续传
+            frame["correlation_id"] = correlation_id
+            frame["seq"] = self.replay_buffer.append(correlation_id, content_type, content)
+        if self._server_loop is None:
+            return
+        self._server_loop.call_soon_threadsafe(
+            self._enqueue_frame, json.dumps(frame), session_id, content_type == "status" and not correlation_id
+        )
+
+    async def _handle_control_message(self, websocket: WebSocket, data: str) -> bool:
+        """
+        处理客户端控制消息，返回是否已处理
+        续传: {"resume": {"correlation_id": str, "last_seq": int}}
+        草稿: {"draft": str}（客户端防抖后发送，用于检索预取）
+        """
+        try:
+            message = json.loads(data)
+        except json.JSONDecodeError:
+            return False
+        if not isinstance(message, dict):
+            return False
+        if "draft" in message:
+            # 草稿关闭时直接丢弃（仍视为已处理，不能当作用户输入）
+            if self._draft_input_enabled and isinstance(message["draft"], str) and message["draft"].strip():
+                self.event_bus.publish(EventType.DRAFT_INPUT, {
+                    "text": message["draft"],
+                    "session_id": self.active_connections.get(websocket)
+                })
+            return True
+        if "resume" not in message:
+            return False
+
+        resume = message["resume"] or {}
+        correlation_id = resume.get("correlation_id")
+        frames = self.replay_buffer.replay(correlation_id, int(resume.get("last_seq", 0)))
+        if frames is None:
+            # 流已淘汰或不存在，客户端只能保留已收到的部分
+            await websocket.send_text(json.dumps({"type": "resume_expired", "correlation_id": correlation_id}))
+            return True
+        for frame in frames:
+            await websocket.send_text(json.dumps({**frame, "correlation_id": correlation_id}))
+        return True
+
+    def _register_connection(self, websocket: WebSocket, session_id: str):
+        self.active_connections[websocket] = session_id
+        self._session_connections.setdefault(session_id, set()).add(websocket)
+        self._senders[websocket] = _ConnectionSender(self, websocket, self._send_queue_size)
+
+    def _unregister_connection(self, websocket: WebSocket):
+        sender = self._senders.pop(websocket, None)
+        if sender is not None:
+            sender.close()
+        session_id = self.active_connections.pop(websocket, None)
+        connections = self._session_connections.get(session_id)
+        if connections is not None:
+            connections.discard(websocket)
+            if not connections:
+                del self._session_connections[session_id]
+
+    def _enqueue_frame(self, message: str, session_id: Optional[str] = None, is_status: bool = False):
+        """
+        放入指定会话的连接（同一会话可能在多个标签页打开）的发送队列，未指定会话时发送给全部连接
+        在服务器事件循环中执行
+        """
+        if session_id is None:
+            targets = list(self.active_connections)
+        else:
+            targets = list(self._session_connections.get(session_id, ()))
+        for connection in targets:
+            sender = self._senders.get(connection)
+            if sender is not None:
+                sender.put(message, is_status)
 
     def clear_display(self, data: dict[str, Any]):
         """清空显示内容"""
         pass
 
-    def handle_user_input(self,user_input:str):
-        """处理用户输入"""
-        self.event_bus.publish(EventType.USER_INPUT, {"input": user_input})
+    def handle_user_input(self, user_input: str, session_id: Optional[str] = None):
+        """处理用户输入（客户端发送 {"input": 文本} 格式的JSON）"""
+        try:
+            text = json.loads(user_input).get("input", "")
+        except (json.JSONDecodeError, AttributeError):
+            text = user_input
+        self.event_bus.publish(EventType.USER_INPUT, {"text": text, "session_id": session_id})
         
     async def get_user_input(self) -> str:
         """获取用户输入"""
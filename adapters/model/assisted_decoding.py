@@ -0,0 +1,67 @@
+from typing import Any, Dict, Optional
+
+import torch
+from transformers import AutoModelForCausalLM
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class AssistedDecoding:
+    """
+    辅助（推测）解码配置
+    - draft_model: 小草稿模型先行生成lookahead个token，由目标模型一次前向验证
+    - prompt_lookup: 从提示词（含检索到的知识文本）中按n-gram匹配提取草稿，适合回答大段引用代码片段的场景
+    """
+
+    MODES = ("draft_model", "prompt_lookup")
+
+    def __init__(self, config: Dict[str, Any], device: str, torch_dtype: Optional[torch.dtype] = None):
+        """
+        :param config: model_providers.huggingface.assisted_generation 配置
+        :param device: 运行设备
+        :param torch_dtype: 草稿模型计算类型，应与目标模型一致
+        """
+        self.mode = config.get("mode", "draft_model")
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unsupported assisted generation mode: {self.mode}")
+
+        self.num_assistant_tokens = config.get("num_assistant_tokens", 5)
+        self.confidence_threshold = config.get("assistant_confidence_threshold", 0.4)
+        self.max_matching_ngram_size = config.get("max_matching_ngram_size", 3)
+        self.draft_model = None
+        if self.mode == "draft_model":
+            self.draft_model = self._load_draft_model(config["draft_model_name"], device, torch_dtype)
+
+    def _load_draft_model(self, model_name: str, device: str, torch_dtype: Optional[torch.dtype]):
+        """加载草稿模型（需与目标模型共用分词器）"""
+        try:
+            draft_model = AutoModelForCausalLM.from_pretrained(
+                model_name,
+                torch_dtype=torch_dtype,
+                low_cpu_mem_usage=True
+            ).to(device)
+        except Exception as e:
+            logger.error(f"草稿模型加载失败: {str(e)}")
+            raise
+
+        draft_model.eval()
+        draft_model.generation_config.num_assistant_tokens = self.num_assistant_tokens
+        draft_model.generation_config.assistant_confidence_threshold = self.confidence_threshold
+        logger.info(f"辅助解码草稿模型已加载: {model_name}, lookahead={self.num_assistant_tokens}")
+        return draft_model
+
+    @property
+    def lookahead(self) -> int:
+        """每个验证步最多提议的草稿token数"""
+        return self.num_assistant_tokens
+
+    def generate_kwargs(self) -> Dict[str, Any]:
+        """传给model.generate的辅助解码参数"""
+        if self.mode == "prompt_lookup":
+            return {
+                "prompt_lookup_num_tokens": self.num_assistant_tokens,
+                "max_matching_ngram_size": self.max_matching_ngram_size
+            }
+        return {"assistant_model": self.draft_model}
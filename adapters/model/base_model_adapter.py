@@ -1,6 +1,9 @@
+import re
 from abc import ABC, abstractmethod
 from typing import List, Dict, AsyncGenerator
 
+_CJK_PATTERN = re.compile(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
 class BaseModelAdapter(ABC):
     def __init__(self, config: dict, event_bus):
         self.config = config
@@ -15,3 +18,21 @@ class BaseModelAdapter(ABC):
     ) -> AsyncGenerator[str, None]:
         pass
 
+    def count_tokens(self, text: str) -> int:
+        """估算文本token数（默认按中日韩字符1个token、其余约4字符1个token估算，有分词器的适配器应重写）"""
+        cjk = len(_CJK_PATTERN.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def truncate_tokens(self, text: str, max_tokens: int) -> str:
+        """将文本截断到不超过max_tokens个token"""
+        if max_tokens <= 0:
+            return ""
+        total = self.count_tokens(text)
+        while total > max_tokens and text:
+            text = text[:max(int(len(text) * max_tokens / total), 1) - 1]
+            total = self.count_tokens(text)
+        return text
+
+    def close(self):
+        """释放模型占用的资源（默认无操作，本地模型适配器需重写）"""
+        pass
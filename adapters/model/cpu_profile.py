@@ -0,0 +1,149 @@
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+import torch
+
+from utils.logger import get_logger
+
+try:
+    import psutil  # 可选依赖，用于获取物理核心数
+except ImportError:
+    psutil = None
+
+logger = get_logger(__name__)
+
+
+def _cpu_flags() -> Set[str]:
+    """读取CPU指令集标志（仅Linux，其它平台返回空集）"""
+    cpuinfo = Path("/proc/cpuinfo")
+    if not cpuinfo.exists():
+        return set()
+    for line in cpuinfo.read_text(errors="ignore").splitlines():
+        if line.startswith("flags"):
+            return set(line.split(":", 1)[1].split())
+    return set()
+
+
+def physical_core_count() -> int:
+    """物理核心数（超线程对矩阵乘法无收益，线程数应与物理核心一致）"""
+    if psutil:
+        count = psutil.cpu_count(logical=False)
+        if count:
+            return count
+    cpuinfo = Path("/proc/cpuinfo")
+    if cpuinfo.exists():
+        cores, physical_id = set(), None
+        for line in cpuinfo.read_text(errors="ignore").splitlines():
+            key, _, value = line.partition(":")
+            if key.strip() == "physical id":
+                physical_id = value.strip()
+            elif key.strip() == "core id":
+                cores.add((physical_id, value.strip()))
+        if cores:
+            return len(cores)
+    return os.cpu_count() or 1
+
+
+class CPUInferenceProfile:
+    """
+    CPU推理配置
+    - 按CPU是否支持AMX/AVX512-BF16自动选择bf16或fp32，不支持时bf16矩阵乘法会退化为慢速路径
+    - 可选线性层动态int8量化（替代需要CUDA的bitsandbytes 4bit）
+    - SDPA注意力、可选torch.compile
+    - 计算线程数固定为物理核心数
+    """
+
+    _BF16_FLAGS = {"amx_bf16", "avx512_bf16"}
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        :param config: model_providers.huggingface.cpu_profile 配置
+        """
+        self.config = config
+        self.num_threads = config.get("num_threads") or physical_core_count()
+        self.int8_dynamic = config.get("int8_dynamic_quantization", True)
+        self.attn_implementation = config.get("attn_implementation", "sdpa")
+        self.torch_compile = config.get("torch_compile", False)
+        self.torch_dtype = self._resolve_dtype(config.get("dtype", "auto"))
+
+    def _resolve_dtype(self, dtype: str) -> torch.dtype:
+        if dtype == "auto":
+            # 动态int8量化只支持fp32权重；无原生bf16指令时fp32更快
+            if self.int8_dynamic or not (_cpu_flags() & self._BF16_FLAGS):
+                return torch.float32
+            return torch.bfloat16
+        return getattr(torch, dtype)
+
+    def apply_threads(self):
+        """固定计算线程数到物理核心"""
+        torch.set_num_threads(self.num_threads)
+        try:
+            torch.set_num_interop_threads(min(self.num_threads, 4))
+        except RuntimeError:
+            # 并行任务已启动后不允许再修改inter-op线程数
+            pass
+
+    def load_kwargs(self) -> Dict[str, Any]:
+        """from_pretrained的CPU加载参数"""
+        return {
+            "torch_dtype": self.torch_dtype,
+            "attn_implementation": self.attn_implementation,
+        }
+
+    def optimize(self, model):
+        """加载后的模型优化：动态int8量化与编译"""
+        if self.int8_dynamic:
+            # 原地替换Linear层：默认会深拷贝整个模型，量化期间峰值内存翻倍
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8,
+                                                           inplace=True)
+        if self.torch_compile:
+            model.forward = torch.compile(model.forward, dynamic=True)
+        return model
+
+    def describe(self) -> str:
+        return (f"threads={self.num_threads}, dtype={self.torch_dtype}, int8_dynamic={self.int8_dynamic}, "
+                f"attn={self.attn_implementation}, torch_compile={self.torch_compile}")
+
+    def benchmark(self, model, tokenizer, prompt_tokens: int = 128, decode_tokens: int = 32) -> Optional[Dict[str, float]]:
+        """启动自检：测量当前配置下的prefill与decode速度"""
+        try:
+            input_ids = torch.randint(100, min(tokenizer.vocab_size, 30000), (1, prompt_tokens))
+            attention_mask = torch.ones_like(input_ids)
+            with torch.no_grad():
+                # 不计时的预热：首次调用包含torch.compile编译与内存分配，计入会使解码耗时被扣成负值
+                model.generate(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    max_new_tokens=2,
+                    do_sample=False,
+                    pad_token_id=tokenizer.eos_token_id
+                )
+
+                start = time.perf_counter()
+                model(input_ids=input_ids, use_cache=True)
+                prefill_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                model.generate(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    max_new_tokens=decode_tokens,
+                    min_new_tokens=decode_tokens,
+                    do_sample=False,
+                    pad_token_id=tokenizer.eos_token_id
+                )
+                # generate包含一次prefill，扣除后得到纯解码耗时
+                decode_seconds = max(time.perf_counter() - start - prefill_seconds, 1e-6)
+        except Exception as e:
+            logger.warning(f"CPU推理自检失败: {str(e)}")
+            return None
+
+        result = {
+            "prefill_tokens_per_sec": prompt_tokens / prefill_seconds,
+            "decode_tokens_per_sec": decode_tokens / decode_seconds,
+        }
+        logger.info(f"CPU推理自检 [{self.describe()}]: prefill {result['prefill_tokens_per_sec']:.1f} tokens/s, "
+                    f"decode {result['decode_tokens_per_sec']:.1f} tokens/s")
+        return result
@@ -0,0 +1,108 @@
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Optional, Iterator
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class GenerationRun:
+    """单次generate调用的统计"""
+    prompt_tokens: int
+    started_at: float
+    forward_calls: int = 0
+    decode_started_at: Optional[float] = None
+    new_tokens: int = 0
+
+
+class GenerationMetrics:
+    """
+    解码吞吐与辅助解码接受率统计
+    - 通过目标模型的forward前置钩子按线程统计前向次数（首次为prefill，其余为解码/验证步）
+    - 辅助解码时每个验证步产出 接受数+1 个token，据此推算草稿接受率
+    """
+
+    def __init__(self, model, lookahead: Optional[int] = None):
+        """
+        :param model: 目标模型（torch.nn.Module）
+        :param lookahead: 辅助解码每步草稿token数，未启用辅助解码时为None
+        """
+        self.lookahead = lookahead
+        self._active: Dict[int, GenerationRun] = {}
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._new_tokens = 0
+        self._decode_steps = 0
+        self._decode_seconds = 0.0
+        self._accepted_tokens = 0
+        self._hook = model.register_forward_pre_hook(self._on_forward)
+
+    def _on_forward(self, module, args):
+        run = self._active.get(threading.get_ident())
+        if run is None:
+            return
+        run.forward_calls += 1
+        if run.forward_calls == 2:
+            run.decode_started_at = time.perf_counter()
+
+    @contextmanager
+    def track(self, prompt_tokens: int) -> Iterator[GenerationRun]:
+        """在生成线程内包裹一次generate调用，调用方需在结束前填写run.new_tokens"""
+        run = GenerationRun(prompt_tokens=prompt_tokens, started_at=time.perf_counter())
+        ident = threading.get_ident()
+        self._active[ident] = run
+        try:
+            yield run
+        finally:
+            self._active.pop(ident, None)
+            self._record(run, time.perf_counter())
+
+    def _record(self, run: GenerationRun, finished_at: float):
+        decode_steps = max(run.forward_calls - 1, 0)
+        decode_seconds = finished_at - (run.decode_started_at or finished_at)
+        # prefill产出第1个token，之后每个验证步产出 接受数+1 个token
+        accepted = max(run.new_tokens - 1 - decode_steps, 0) if self.lookahead else 0
+
+        with self._lock:
+            self._requests += 1
+            self._new_tokens += run.new_tokens
+            self._decode_steps += decode_steps
+            self._decode_seconds += decode_seconds
+            self._accepted_tokens += accepted
+
+        tokens_per_sec = (run.new_tokens - 1) / decode_seconds if decode_seconds > 0 else 0.0
+        message = (f"生成完成: prompt {run.prompt_tokens} tokens, 新生成 {run.new_tokens} tokens, "
+                   f"解码 {tokens_per_sec:.1f} tokens/s, 总耗时 {finished_at - run.started_at:.2f}s")
+        if self.lookahead and decode_steps:
+            message += (f", 平均每步接受 {accepted / decode_steps:.2f} tokens, "
+                        f"接受率≈{accepted / (decode_steps * self.lookahead):.0%}")
+        logger.info(message)
+
+    def stats(self) -> Dict[str, float]:
+        """累计指标快照"""
+        with self._lock:
+            stats = {
+                "requests": self._requests,
+                "new_tokens": self._new_tokens,
+                "decode_steps": self._decode_steps,
+                "decode_tokens_per_sec": (
+                    (self._new_tokens - self._requests) / self._decode_seconds if self._decode_seconds > 0 else 0.0
+                ),
+            }
+            if self.lookahead:
+                stats["accepted_tokens"] = self._accepted_tokens
+                stats["mean_accepted_per_step"] = (
+                    self._accepted_tokens / self._decode_steps if self._decode_steps else 0.0
+                )
+                stats["acceptance_rate"] = (
+                    self._accepted_tokens / (self._decode_steps * self.lookahead) if self._decode_steps else 0.0
+                )
+            return stats
+
+    def close(self):
+        """移除forward钩子"""
+        self._hook.remove()
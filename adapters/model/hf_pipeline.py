@@ -1,7 +1,10 @@
 import asyncio
+import contextvars
+import copy
+import gc
 import os
 import time
-from typing import List, Dict, Optional, AsyncGenerator
+from typing import List, Dict, Optional, AsyncGenerator, Set
 
 import torch
 from transformers import (
@@ -9,19 +12,44 @@ from transformers import (
     BitsAndBytesConfig,
     AsyncTextIteratorStreamer,
     AutoModelForCausalLM,
+    DynamicCache,
+    StoppingCriteria,
+    StoppingCriteriaList,
 )
 
+from adapters.model.assisted_decoding import AssistedDecoding
 from adapters.model.base_model_adapter import BaseModelAdapter
+from adapters.model.cpu_profile import CPUInferenceProfile
+from adapters.model.generation_metrics import GenerationMetrics
+from adapters.model.kv_cache import PrefixKVCache, SessionKVCache, common_prefix_len
+from core.events import EventType
 from utils.logger import get_logger
+from utils.tracing import span
 import threading
 
 logger = get_logger(__name__)
 
 
+class StopSignalCriteria(StoppingCriteria):
+    """每个解码步检查一次停止信号，使取消的请求在一个解码步内释放模型"""
+
+    def __init__(self, stop_event: threading.Event):
+        self.stop_event = stop_event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full(
+            (input_ids.shape[0],),
+            self.stop_event.is_set(),
+            dtype=torch.bool,
+            device=input_ids.device
+        )
+
+
 class HuggingFacePipeline(BaseModelAdapter):
     def __init__(self, config: dict, event_bus):
         super().__init__(config, event_bus)
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.cpu_profile = self._init_cpu_profile()
         self.quant_config = self._init_quant_config()
         self.tokenizer = AutoTokenizer.from_pretrained(config['model_name'])
 
@@ -31,14 +59,41 @@ class HuggingFacePipeline(BaseModelAdapter):
             self.tokenizer.padding_side = "right"
 
         self.model = self._load_model()
+        if self.cpu_profile and self.config.get('cpu_profile', {}).get('self_benchmark', True):
+            self.cpu_profile.benchmark(self.model, self.tokenizer)
+        self.prefix_cache = self._init_prefix_cache()
+        self.session_cache = self._init_session_cache()
+        self.assisted_decoding = self._init_assisted_decoding()
+        self.generation_metrics = GenerationMetrics(
+            self.model,
+            lookahead=self.assisted_decoding.lookahead if self.assisted_decoding else None
+        )
+
+        # 进行中请求的停止信号 {session_id: {threading.Event}}
+        self._stop_events: Dict[Optional[str], Set[threading.Event]] = {}
+        self._stop_lock = threading.Lock()
+        self.event_bus.subscribe(EventType.CANCEL_OPERATION, self.handle_cancel_operation)
+        self.event_bus.subscribe(EventType.CLEAR_HISTORY, self.handle_clear_history)
         # 验证模板格式
         test_template = self._build_input_text(
             [{"role": "user", "content": "test"}]
         )
 
+    def _init_cpu_profile(self) -> Optional[CPUInferenceProfile]:
+        if self.device != "cpu":
+            return None
+        profile = CPUInferenceProfile(self.config.get('cpu_profile', {}))
+        profile.apply_threads()
+        logger.info(f"使用CPU推理配置: {profile.describe()}")
+        return profile
+
     def _init_quant_config(self) -> Optional[BitsAndBytesConfig]:
         if not self.config['quantization']['enabled']:
             return None
+        if self.cpu_profile:
+            # bitsandbytes 4bit依赖CUDA，CPU上由cpu_profile的动态int8量化替代
+            logger.warning("CPU环境不支持bitsandbytes 4bit量化，已跳过")
+            return None
         return BitsAndBytesConfig(
             load_in_4bit=True,
             bnb_4bit_quant_type=self.config['quantization']['type'],
@@ -46,20 +101,53 @@ class HuggingFacePipeline(BaseModelAdapter):
             bnb_4bit_use_double_quant=True
         )
 
+    def _init_prefix_cache(self) -> Optional[PrefixKVCache]:
+        cache_config = self.config.get('prefix_cache', {})
+        if not cache_config.get('enabled', False):
+            return None
+        return PrefixKVCache(
+            max_bytes=int(cache_config.get('max_memory_mb', 512)) * 1024 * 1024,
+            min_prefix_tokens=cache_config.get('min_prefix_tokens', 32)
+        )
+
+    def _init_session_cache(self) -> Optional[SessionKVCache]:
+        cache_config = self.config.get('session_cache', {})
+        if not cache_config.get('enabled', False):
+            return None
+        return SessionKVCache(
+            max_bytes=int(cache_config.get('max_memory_mb', 2048)) * 1024 * 1024,
+            min_reuse_tokens=cache_config.get('min_reuse_tokens', 32)
+        )
+
+    def _init_assisted_decoding(self) -> Optional[AssistedDecoding]:
+        assisted_config = self.config.get('assisted_generation', {})
+        if not assisted_config.get('enabled', False):
+            return None
+        return AssistedDecoding(assisted_config, self.device, torch_dtype=self.model.dtype)
+
     def _load_model(self):
         model = None
+        load_kwargs = {
+            "torch_dtype": torch.bfloat16,  # 显式设置计算类型
+            **self.config.get('model_args', {})
+        }
+        if self.cpu_profile:
+            load_kwargs.update(self.cpu_profile.load_kwargs())
         try:
             model =  AutoModelForCausalLM.from_pretrained(
                 self.config['model_name'],  # 支持本地路径（如：/path/to/local/model）
                 device_map="auto" if self.device == "cuda" else None,
                 quantization_config=self.quant_config,
-                torch_dtype=torch.bfloat16,  # 显式设置计算类型
-                low_cpu_mem_usage=True
+                low_cpu_mem_usage=True,
+                **load_kwargs
             )
         except Exception as e:
             logger.error(f"模型加载失败: {str(e)}")
             raise
 
+        if self.cpu_profile:
+            model = self.cpu_profile.optimize(model)
+
         print(model.config.sliding_window)         # 应为 None 或 4096 等数值
         print(model.config._attn_implementation)   # 应为 eager/sdpa/flash_attention_2
         return model
@@ -70,14 +158,12 @@ class HuggingFacePipeline(BaseModelAdapter):
             stream: bool = False,
             **kwargs
     ) -> AsyncGenerator[str, None]:
+        session_id = kwargs.pop("session_id", None)
+        stop_event = threading.Event()
+        self._register_stop_event(session_id, stop_event)
         try:
-            input_text = self._build_input_text(messages)
-            inputs = self.tokenizer(
-                input_text,
-                return_tensors="pt",
-                padding=True,
-                truncation=True
-            ).to(self.device)
+            # 分词与缓存未命中时的前缀预填充都是同步计算，在线程池中执行，不阻塞共享的事件循环
+            inputs, past_key_values = await asyncio.to_thread(self._prepare_inputs, messages, session_id)
 
             params = {
                 **self.config['generation'],
@@ -85,8 +171,17 @@ class HuggingFacePipeline(BaseModelAdapter):
                # "do_sample": True,
                 "eos_token_id": self.tokenizer.eos_token_id,
                 "pad_token_id": self.tokenizer.eos_token_id,
-                "bos_token_id": self.tokenizer.bos_token_id
+                "bos_token_id": self.tokenizer.bos_token_id,
+                "stopping_criteria": StoppingCriteriaList([StopSignalCriteria(stop_event)])
             }
+            if self.assisted_decoding:
+                params.update(self.assisted_decoding.generate_kwargs())
+
+            if past_key_values is not None:
+                params["past_key_values"] = past_key_values
+            if self.session_cache and session_id:
+                # 需要取回生成结束时的KV状态写入会话缓存
+                params["return_dict_in_generate"] = True
 
             if stream:
                 # 初始化异步队列
@@ -100,7 +195,11 @@ class HuggingFacePipeline(BaseModelAdapter):
                 params["streamer"] = streamer
 
                 # 启动生成线程
-                generate_thread = threading.Thread(target=lambda: self.model.generate(**inputs, **params), daemon=True)
+                # 复制当前上下文，生成线程中的span归属到本请求的trace
+                context = contextvars.copy_context()
+                generate_thread = threading.Thread(
+                    target=lambda: context.run(self._generate, inputs, params, session_id), daemon=True
+                )
                 generate_thread.start()
                 try:
                     generated_text = ""
@@ -116,9 +215,12 @@ class HuggingFacePipeline(BaseModelAdapter):
                                 yield output
                             generated_text = assistant_marker  # 保留标记作为锚点
                 finally:
-                    generate_thread.join()  # 确保即使发生异常也等待线程退出
+                    # 取消或调用方断开时通知生成线程，下一个解码步即退出，避免join长时间阻塞
+                    stop_event.set()
+                    # 确保即使发生异常也等待线程退出；在线程池中等待，不阻塞事件循环
+                    await asyncio.to_thread(generate_thread.join)
             else:
-                outputs = self.model.generate(**inputs, **params)
+                outputs = await asyncio.to_thread(self._generate, inputs, params, session_id)
                 yield self.tokenizer.decode(
                     outputs[0][inputs.input_ids.shape[-1]:],
                     skip_special_tokens=True
@@ -127,6 +229,157 @@ class HuggingFacePipeline(BaseModelAdapter):
         except Exception as e:
             logger.error(f"生成失败: {str(e)}")
             yield "生成失败，请检查模型配置"
+        finally:
+            stop_event.set()
+            self._unregister_stop_event(session_id, stop_event)
+
+    def _prepare_inputs(self, messages: List[Dict], session_id: Optional[str]):
+        """分词并取得可复用的KV缓存：(inputs, past_key_values或None)"""
+        with span("tokenize"):
+            input_text = self._build_input_text(messages)
+            inputs = self.tokenizer(
+                input_text,
+                return_tensors="pt",
+                padding=True,
+                truncation=True
+            ).to(self.device)
+        past_key_values = self._reuse_kv_cache(messages, inputs.input_ids[0].tolist(), session_id)
+        return inputs, past_key_values
+
+    def _generate(self, inputs, params: Dict, session_id: Optional[str] = None):
+        """执行generate并记录吞吐/接受率指标，返回生成的token序列"""
+        prompt_len = inputs.input_ids.shape[-1]
+        with self.generation_metrics.track(prompt_len) as run, span("model.generate", prompt_tokens=prompt_len) as attrs:
+            outputs = self.model.generate(**inputs, **params)
+            sequences = outputs.sequences if hasattr(outputs, "sequences") else outputs
+            run.new_tokens = sequences.shape[-1] - prompt_len
+            attrs["new_tokens"] = int(run.new_tokens)
+
+        past_key_values = getattr(outputs, "past_key_values", None)
+        if self.session_cache and session_id and past_key_values is not None:
+            # 最后一个生成的token尚未计算KV，按缓存实际长度对齐token序列
+            cache_len = past_key_values.get_seq_length() if hasattr(past_key_values, "get_seq_length") \
+                else sequences.shape[-1] - 1
+            self.session_cache.store(session_id, sequences[0][:cache_len].tolist(), past_key_values)
+        return sequences
+
+    def handle_clear_history(self, data: Optional[Dict] = None):
+        """响应CLEAR_HISTORY事件：清除会话KV缓存"""
+        if self.session_cache:
+            self.session_cache.clear(data.get("session_id") if isinstance(data, dict) else None)
+
+    def handle_cancel_operation(self, data: Optional[Dict] = None):
+        """响应CANCEL_OPERATION事件：停止指定会话（未指定时为全部）的进行中生成"""
+        session_id = data.get("session_id") if isinstance(data, dict) else None
+        with self._stop_lock:
+            if session_id is None:
+                events = [e for group in self._stop_events.values() for e in group]
+            else:
+                events = list(self._stop_events.get(session_id, ()))
+        for event in events:
+            event.set()
+        if events:
+            logger.info(f"已通知 {len(events)} 个生成任务停止: session_id={session_id}")
+
+    def _register_stop_event(self, session_id: Optional[str], stop_event: threading.Event):
+        with self._stop_lock:
+            self._stop_events.setdefault(session_id, set()).add(stop_event)
+
+    def _unregister_stop_event(self, session_id: Optional[str], stop_event: threading.Event):
+        with self._stop_lock:
+            events = self._stop_events.get(session_id)
+            if events is not None:
+                events.discard(stop_event)
+                if not events:
+                    del self._stop_events[session_id]
+
+    def _reuse_kv_cache(self, messages: List[Dict], input_ids: List[int], session_id: Optional[str]):
+        """优先复用本会话上一轮的KV状态，其次复用共享前缀缓存"""
+        if self.session_cache and session_id:
+            cached = self.session_cache.take(session_id, input_ids)
+            if cached:
+                reuse_len, past_key_values = cached
+                logger.debug(f"会话KV缓存命中: 复用 {reuse_len}/{len(input_ids)} tokens, {self.session_cache.stats()}")
+                return past_key_values
+        return self._reuse_prefix_cache(messages, input_ids)
+
+    def _reuse_prefix_cache(self, messages: List[Dict], input_ids: List[int]):
+        """复用共享前缀（系统提示词）的KV缓存，未命中时预填充并写入缓存"""
+        if self.prefix_cache is None:
+            return None
+
+        cached = self.prefix_cache.lookup(input_ids)
+        if cached:
+            prefix_len, past_key_values = cached
+            logger.debug(f"前缀KV缓存命中: 复用 {prefix_len}/{len(input_ids)} tokens, {self.prefix_cache.stats()}")
+            return past_key_values
+
+        prefix_ids = self._system_prefix_ids(messages, input_ids)
+        if not prefix_ids:
+            return None
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=torch.tensor([prefix_ids], device=self.model.device),
+                past_key_values=DynamicCache(),
+                use_cache=True
+            )
+        past_key_values = outputs.past_key_values
+        if self.prefix_cache.store(prefix_ids, past_key_values):
+            # 缓存保存原件；generate会原地追加KV，本次请求使用副本（不经lookup，避免计为命中）
+            past_key_values = copy.deepcopy(past_key_values)
+        return past_key_values
+
+    def _system_prefix_ids(self, messages: List[Dict], input_ids: List[int]) -> Optional[List[int]]:
+        """计算开头system消息对应的token前缀（以实际输入为准，避免分词边界差异）"""
+        system_messages = []
+        for msg in messages:
+            if msg.get("role") != "system":
+                break
+            system_messages.append(msg)
+        if not system_messages:
+            return None
+
+        prefix_text = self.tokenizer.apply_chat_template(
+            system_messages,
+            tokenize=False,
+            add_generation_prompt=False
+        )
+        prefix_ids = self.tokenizer(prefix_text).input_ids
+        # 最后一个token可能与后续文本合并分词，只取与实际输入一致的部分，且至少留一个token给generate
+        prefix_len = min(common_prefix_len(prefix_ids, input_ids), len(input_ids) - 1)
+        if prefix_len < self.prefix_cache.min_prefix_tokens:
+            return None
+        return input_ids[:prefix_len]
+
+    def count_tokens(self, text: str) -> int:
+        """使用模型分词器精确计数"""
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    def truncate_tokens(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        ids = self.tokenizer(text, add_special_tokens=False).input_ids
+        if len(ids) <= max_tokens:
+            return text
+        return self.tokenizer.decode(ids[:max_tokens], skip_special_tokens=True)
+
+    def close(self):
+        """卸载模型与分词器，释放内存/显存"""
+        self.event_bus.unsubscribe(EventType.CANCEL_OPERATION, self.handle_cancel_operation)
+        self.event_bus.unsubscribe(EventType.CLEAR_HISTORY, self.handle_clear_history)
+        self.handle_cancel_operation()
+        self.generation_metrics.close()
+        if self.prefix_cache:
+            self.prefix_cache.clear()
+        if self.session_cache:
+            self.session_cache.clear()
+        self.model = None
+        self.tokenizer = None
+        self.assisted_decoding = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
     def _build_input_text(self, messages: List[Dict]) -> str:
         """使用tokenizer的对话模板构建输入文本"""
         input_text = self.tokenizer.apply_chat_template(
@@ -0,0 +1,228 @@
+import copy
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def cache_nbytes(past_key_values: Any) -> int:
+    """估算past_key_values占用的字节数（兼容新旧版本transformers的Cache结构）"""
+    tensors = []
+    if hasattr(past_key_values, "layers"):
+        # transformers >= 4.56：按层保存keys/values
+        for layer in past_key_values.layers:
+            tensors.extend(t for t in (getattr(layer, "keys", None), getattr(layer, "values", None)) if t is not None)
+    elif hasattr(past_key_values, "key_cache"):
+        tensors.extend(past_key_values.key_cache)
+        tensors.extend(past_key_values.value_cache)
+    else:
+        # 旧版tuple格式: ((k, v), (k, v), ...)
+        for layer in past_key_values or ():
+            tensors.extend(layer)
+    return sum(t.numel() * t.element_size() for t in tensors if hasattr(t, "numel"))
+
+
+def common_prefix_len(a: Sequence[int], b: Sequence[int]) -> int:
+    """计算两个token序列的公共前缀长度"""
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+
+@dataclass
+class _CacheEntry:
+    past_key_values: Any
+    nbytes: int
+
+
+class PrefixKVCache:
+    """
+    提示词前缀的KV缓存
+    - 以token id序列为键保存预填充(prefill)后的past_key_values
+    - 新请求命中最长公共前缀时直接复用，跳过该部分的注意力计算
+    - 超出内存上限时按LRU淘汰
+    """
+
+    def __init__(self, max_bytes: int, min_prefix_tokens: int = 32):
+        """
+        :param max_bytes: 缓存总内存上限（字节）
+        :param min_prefix_tokens: 可缓存前缀的最少token数，过短的前缀不值得缓存
+        """
+        self.max_bytes = max_bytes
+        self.min_prefix_tokens = min_prefix_tokens
+        self._entries: "OrderedDict[Tuple[int, ...], _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._saved_prefill_tokens = 0
+
+    def lookup(self, input_ids: Sequence[int]) -> Optional[Tuple[int, Any]]:
+        """
+        查找与input_ids匹配的最长缓存前缀
+        :return: (前缀长度, past_key_values副本)；未命中返回None
+        """
+        input_ids = tuple(input_ids)
+        with self._lock:
+            best_key = None
+            for key in self._entries:
+                # 至少保留一个未缓存的token交给generate计算
+                if len(key) < len(input_ids) and input_ids[:len(key)] == key:
+                    if best_key is None or len(key) > len(best_key):
+                        best_key = key
+            if best_key is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            entry = self._entries[best_key]
+            self._hits += 1
+            self._saved_prefill_tokens += len(best_key)
+        # generate会原地追加KV，必须返回副本
+        return len(best_key), copy.deepcopy(entry.past_key_values)
+
+    def store(self, token_ids: Sequence[int], past_key_values: Any) -> bool:
+        """保存前缀KV，必要时按LRU淘汰旧条目"""
+        key = tuple(token_ids)
+        if len(key) < self.min_prefix_tokens:
+            return False
+        nbytes = cache_nbytes(past_key_values)
+        if nbytes > self.max_bytes:
+            logger.warning(f"前缀KV缓存条目过大({nbytes} bytes)，超过上限，跳过缓存")
+            return False
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._total_bytes -= old.nbytes
+            while self._entries and self._total_bytes + nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.nbytes
+                self._evictions += 1
+            self._entries[key] = _CacheEntry(past_key_values, nbytes)
+            self._total_bytes += nbytes
+        return True
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """缓存指标快照"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self._total_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "saved_prefill_tokens": self._saved_prefill_tokens,
+            }
+
+
+@dataclass
+class _SessionEntry:
+    token_ids: Tuple[int, ...]
+    past_key_values: Any
+    nbytes: int
+
+
+class SessionKVCache:
+    """
+    会话级KV缓存
+    - 以session_id为键保存上一轮生成结束时的KV状态及其对应的token序列
+    - 新一轮提示词与缓存序列存在公共前缀时复用（必要时裁剪到公共前缀），只需预填充新增部分
+    - 总内存超出上限时淘汰最久未活跃的会话
+    """
+
+    def __init__(self, max_bytes: int, min_reuse_tokens: int = 32):
+        """
+        :param max_bytes: 所有会话缓存的总内存上限（字节）
+        :param min_reuse_tokens: 公共前缀少于该token数时不复用
+        """
+        self.max_bytes = max_bytes
+        self.min_reuse_tokens = min_reuse_tokens
+        self._entries: "OrderedDict[str, _SessionEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._saved_prefill_tokens = 0
+
+    def take(self, session_id: str, input_ids: Sequence[int]) -> Optional[Tuple[int, Any]]:
+        """
+        取出会话缓存供本轮使用（本轮结束后会写回新的状态，因此无需复制）
+        :return: (可复用的前缀长度, past_key_values)；无法复用返回None
+        """
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry:
+                self._total_bytes -= entry.nbytes
+
+        reuse_len = 0
+        if entry:
+            # 至少保留一个未缓存的token交给generate计算
+            reuse_len = min(common_prefix_len(entry.token_ids, input_ids), len(input_ids) - 1)
+            if reuse_len < len(entry.token_ids):
+                if hasattr(entry.past_key_values, "crop"):
+                    entry.past_key_values.crop(reuse_len)
+                else:
+                    reuse_len = 0
+
+        with self._lock:
+            if reuse_len < self.min_reuse_tokens:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._saved_prefill_tokens += reuse_len
+        return reuse_len, entry.past_key_values
+
+    def store(self, session_id: str, token_ids: Sequence[int], past_key_values: Any):
+        """写回会话本轮结束时的KV状态，必要时淘汰最久未活跃的会话"""
+        nbytes = cache_nbytes(past_key_values)
+        if nbytes > self.max_bytes:
+            logger.warning(f"会话 {session_id} 的KV缓存过大({nbytes} bytes)，超过上限，跳过缓存")
+            return
+
+        with self._lock:
+            old = self._entries.pop(session_id, None)
+            if old:
+                self._total_bytes -= old.nbytes
+            while self._entries and self._total_bytes + nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.nbytes
+                self._evictions += 1
+            self._entries[session_id] = _SessionEntry(tuple(token_ids), past_key_values, nbytes)
+            self._total_bytes += nbytes
+
+    def clear(self, session_id: Optional[str] = None):
+        """清除指定会话（未指定时为全部）的缓存"""
+        with self._lock:
+            if session_id is None:
+                self._entries.clear()
+                self._total_bytes = 0
+                return
+            entry = self._entries.pop(session_id, None)
+            if entry:
+                self._total_bytes -= entry.nbytes
+
+    def stats(self) -> Dict[str, int]:
+        """缓存指标快照"""
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "memory_bytes": self._total_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "saved_prefill_tokens": self._saved_prefill_tokens,
+            }
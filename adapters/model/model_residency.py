@@ -0,0 +1,186 @@
+import asyncio
+import gc
+import threading
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional, Type
+
+from adapters.model.base_model_adapter import BaseModelAdapter
+from utils.logger import get_logger
+
+try:
+    import psutil  # 可选依赖，用于统计进程常驻内存
+except ImportError:
+    psutil = None
+
+logger = get_logger(__name__)
+
+
+class ModelResidencyManager(BaseModelAdapter):
+    """
+    模型驻留管理器（包装任意BaseModelAdapter实现）
+    - 首次请求时才加载模型，也可在启动时后台预加载
+    - 加载后执行预热提示词，避免首个用户承担JIT编译与内存分配开销
+    - 空闲超时后卸载模型，下一次请求时透明重新加载
+    """
+
+    def __init__(self, adapter_class: Type[BaseModelAdapter], config: dict, event_bus):
+        """
+        :param adapter_class: 被管理的模型适配器类
+        :param config: 模型提供者配置（含residency段）
+        :param event_bus: 事件总线实例
+        """
+        super().__init__(config, event_bus)
+        residency = config.get('residency', {})
+        self.adapter_class = adapter_class
+        self.idle_timeout = residency.get('idle_unload_seconds', 0)  # 0表示从不卸载
+        self.warmup = residency.get('warmup', {})
+
+        self._adapter: Optional[BaseModelAdapter] = None
+        self._load_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._active_requests = 0
+        self._last_used = time.monotonic()
+        self._idle_timer: Optional[threading.Timer] = None
+
+        self._loads = 0
+        self._unloads = 0
+        self._load_seconds = 0.0
+        self._warmup_seconds = 0.0
+
+        if residency.get('preload', False):
+            threading.Thread(target=self.ensure_loaded, name="model-preload", daemon=True).start()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._adapter is not None
+
+    def ensure_loaded(self) -> BaseModelAdapter:
+        """确保模型已加载（阻塞调用，线程安全）"""
+        with self._load_lock:
+            if self._adapter is not None:
+                return self._adapter
+
+            logger.info(f"开始加载模型: {self.config.get('model_name')}")
+            start = time.perf_counter()
+            adapter = self.adapter_class(self.config, self.event_bus)
+            self._load_seconds = time.perf_counter() - start
+            self._loads += 1
+
+            self._warm_up(adapter)
+            self._adapter = adapter
+            self._last_used = time.monotonic()
+            logger.info(f"模型加载完成: 耗时 {self._load_seconds:.2f}s, 预热 {self._warmup_seconds:.2f}s, {self.stats()}")
+            return adapter
+
+    def _warm_up(self, adapter: BaseModelAdapter):
+        """执行预热提示词（在加载线程中运行独立事件循环）"""
+        prompt = self.warmup.get('prompt')
+        if not prompt:
+            return
+
+        async def _consume():
+            async for _ in adapter.chat(
+                    messages=[{"role": "user", "content": prompt}],
+                    stream=False,
+                    **self.warmup.get('generate_kwargs', {})
+            ):
+                pass
+
+        start = time.perf_counter()
+        try:
+            asyncio.run(_consume())
+        except Exception as e:
+            logger.warning(f"模型预热失败: {str(e)}")
+        self._warmup_seconds = time.perf_counter() - start
+
+    async def chat(
+            self,
+            messages: List[Dict],
+            stream: bool = False,
+            **kwargs
+    ) -> AsyncGenerator[str, None]:
+        # 在状态锁内登记请求并取得适配器引用，空闲卸载在同一把锁内检查请求数，不会卸载使用中的模型
+        adapter = self._begin_use()
+        try:
+            adapter = adapter or await asyncio.to_thread(self.ensure_loaded)
+            async for chunk in adapter.chat(messages, stream, **kwargs):
+                yield chunk
+        finally:
+            self._end_use()
+
+    def count_tokens(self, text: str) -> int:
+        # 未加载时退化为估算，避免为计数触发模型加载
+        if self._adapter is not None:
+            return self._adapter.count_tokens(text)
+        return super().count_tokens(text)
+
+    def truncate_tokens(self, text: str, max_tokens: int) -> str:
+        if self._adapter is not None:
+            return self._adapter.truncate_tokens(text, max_tokens)
+        return super().truncate_tokens(text, max_tokens)
+
+    def _begin_use(self) -> Optional[BaseModelAdapter]:
+        with self._state_lock:
+            self._active_requests += 1
+            if self._idle_timer:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            return self._adapter
+
+    def _end_use(self):
+        with self._state_lock:
+            self._active_requests -= 1
+            self._last_used = time.monotonic()
+            if self._active_requests == 0 and self.idle_timeout > 0:
+                self._idle_timer = threading.Timer(self.idle_timeout, self._unload_if_idle)
+                self._idle_timer.daemon = True
+                self._idle_timer.start()
+
+    def _unload_if_idle(self):
+        self.unload(only_if_idle=True)
+
+    def unload(self, only_if_idle: bool = False):
+        """
+        卸载模型，下一次请求时重新加载
+        :param only_if_idle: 仅在没有进行中的请求且空闲超时时卸载（检查与摘除适配器在同一把锁内完成）
+        """
+        with self._load_lock:
+            with self._state_lock:
+                if self._adapter is None:
+                    return
+                if only_if_idle:
+                    idle = time.monotonic() - self._last_used
+                    if self._active_requests > 0 or idle < self.idle_timeout:
+                        return
+                    self._idle_timer = None
+                    logger.info(f"模型空闲 {idle:.0f}s，卸载以释放内存")
+                adapter, self._adapter = self._adapter, None
+            adapter.close()
+            # 每次加载都会创建新的适配器并订阅事件，卸载时移除其订阅与队列线程
+            self.event_bus.remove_subscriber(adapter)
+            del adapter
+            gc.collect()
+            self._unloads += 1
+        logger.info(f"模型已卸载: {self.stats()}")
+
+    def close(self):
+        with self._state_lock:
+            if self._idle_timer:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+        self.unload()
+
+    def stats(self) -> Dict[str, Any]:
+        """驻留状态与内存指标"""
+        model = getattr(self._adapter, 'model', None)
+        return {
+            "loaded": self.is_loaded,
+            "loads": self._loads,
+            "unloads": self._unloads,
+            "load_seconds": round(self._load_seconds, 3),
+            "warmup_seconds": round(self._warmup_seconds, 3),
+            "active_requests": self._active_requests,
+            "idle_seconds": round(time.monotonic() - self._last_used, 1),
+            "model_memory_bytes": model.get_memory_footprint() if hasattr(model, 'get_memory_footprint') else None,
+            "process_rss_bytes": psutil.Process().memory_info().rss if psutil else None,
+        }
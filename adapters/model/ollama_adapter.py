@@ -1,8 +1,10 @@
 import json
+import time
 import requests
 from typing import AsyncGenerator
 from adapters.model.base_model_adapter import BaseModelAdapter
 from utils.logger import get_logger
+from utils.tracing import record_span, span
 import aiohttp
 
 logger = get_logger(__name__)
@@ -34,6 +36,7 @@ class OllamaAdapter(BaseModelAdapter):
             stream: bool = False,
             **kwargs
     ) -> AsyncGenerator[str, None]:
+        kwargs.pop("session_id", None)  # 仅用于本地适配器的取消控制，不发送给Ollama
         url = f"{self.endpoint}/api/chat"
         payload = {
             "model": self.model_name,
@@ -44,12 +47,19 @@ class OllamaAdapter(BaseModelAdapter):
         }
 
         try:
+            request_at = time.time()
             async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=self.headers, json=payload) as response:
+                with span("ollama.request"):
+                    response = await session.post(url, headers=self.headers, json=payload)
+                async with response:
                     response.raise_for_status()
 
                     if stream:
+                        first = True
                         async for line in response.content:
+                            if first:
+                                record_span("ollama.first_byte", request_at, time.time())
+                                first = False
                             if line:
                                 decoded = json.loads(line.decode("utf-8"))
                                 if 'message' in decoded and 'content' in decoded['message']:
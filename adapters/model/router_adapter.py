@@ -0,0 +1,304 @@
+import asyncio
+import json
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import AsyncGenerator, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+
+from adapters.model.base_model_adapter import BaseModelAdapter
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class BackendState:
+    """单个Ollama后端的运行状态与指标"""
+    endpoint: str
+    outstanding: int = 0
+    requests: int = 0
+    errors: int = 0
+    consecutive_failures: int = 0
+    ejections: int = 0
+    ejected_until: float = 0.0
+    hedges_won: int = 0
+    ttft_ewma: Optional[float] = None          # 首token延迟（秒）
+    latency_ewma: Optional[float] = None       # 完整请求耗时（秒）
+    tokens_per_sec_ewma: Optional[float] = None
+
+    @property
+    def ejected(self) -> bool:
+        return self.ejected_until > time.monotonic()
+
+
+def _ewma(old: Optional[float], value: float, alpha: float = 0.3) -> float:
+    return value if old is None else alpha * value + (1 - alpha) * old
+
+
+class ModelRouterAdapter(BaseModelAdapter):
+    """
+    多后端模型路由适配器（Ollama API）
+    - 按 (未完成请求数+1)/实测tokens每秒 选择预计最快完成的后端
+    - 周期性健康检查，连续失败的后端被摘除，冷却期后或健康检查通过时重新接入
+    - 首token超过hedge_delay仍未返回时向另一后端发起对冲请求，先返回者胜出
+    """
+
+    def __init__(self, config: dict, event_bus):
+        super().__init__(config, event_bus)
+        self.model_name = config["model_name"]
+        self.backends = [BackendState(self._normalize_endpoint(e)) for e in config["backends"]]
+        self.health_check_interval = config.get("health_check_interval", 10)
+        self.failure_threshold = config.get("failure_threshold", 3)
+        self.eject_seconds = config.get("eject_seconds", 30)
+        self.hedge_delay = config.get("hedge_delay", 2.0)
+        self.max_attempts = config.get("max_attempts", 2)
+        self.request_timeout = config.get("request_timeout", 300)
+        self.headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        }
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._closed = False
+        self._health_future: Optional[Future] = None
+        if self.health_check_interval > 0:
+            # 健康检查随适配器启动，在总线事件循环中运行（与chat共用连接池），不依赖首个请求
+            self._health_future = event_bus.submit(self._health_check_loop())
+
+    @staticmethod
+    def _normalize_endpoint(endpoint: str) -> str:
+        if not endpoint.startswith(("http://", "https://")):
+            endpoint = f"http://{endpoint}"
+        return endpoint.rstrip("/")
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """复用连接池（会话与当前事件循环绑定）"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(headers=self.headers)
+        return self._session
+
+    def _get_model_params(self) -> dict:
+        """从配置获取模型参数（max_tokens映射为Ollama的num_predict）"""
+        options = dict(self.config.get("generation", {}))
+        if "max_tokens" in options:
+            options["num_predict"] = options.pop("max_tokens")
+        return {"options": options}
+
+    async def chat(
+            self,
+            messages: List[Dict],
+            stream: bool = False,
+            **kwargs
+    ) -> AsyncGenerator[str, None]:
+        kwargs.pop("session_id", None)
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": stream,
+            **self._get_model_params(),
+            **kwargs
+        }
+
+        try:
+            backend, agen, first_chunk = await self._race_first_chunk(payload, stream)
+        except Exception as e:
+            logger.error(f"所有模型后端请求失败: {str(e)}")
+            yield f"请求失败: {str(e)}"
+            return
+
+        try:
+            if first_chunk:
+                yield first_chunk
+            async for chunk in agen:
+                yield chunk
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError, RuntimeError) as e:
+            # 已开始输出后无法无缝切换后端，只能报告错误
+            logger.error(f"模型后端 {backend.endpoint} 流式响应中断: {str(e)}")
+            yield f"请求失败: {str(e)}"
+        finally:
+            await agen.aclose()
+
+    async def _race_first_chunk(self, payload: dict, stream: bool) -> Tuple[BackendState, AsyncGenerator, str]:
+        """发起请求并在首token超时时对冲，返回胜出的 (后端, 剩余流, 首块内容)"""
+        tried: Set[str] = set()
+        pending: Dict[asyncio.Task, Tuple[BackendState, AsyncGenerator]] = {}
+        last_error: Optional[Exception] = None
+
+        def launch() -> bool:
+            backend = self._pick_backend(exclude=tried)
+            if backend is None:
+                return False
+            tried.add(backend.endpoint)
+            agen = self._stream_backend(backend, payload, stream)
+            pending[asyncio.create_task(self._first_chunk(agen))] = (backend, agen)
+            return True
+
+        can_hedge = launch()
+        try:
+            while pending:
+                hedge = can_hedge and self.hedge_delay > 0 and len(tried) < self.max_attempts
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_delay if hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.info(f"首token超过 {self.hedge_delay}s 未返回，发起对冲请求")
+                    can_hedge = launch()
+                    continue
+
+                for task in done:
+                    backend, agen = pending.pop(task)
+                    try:
+                        first_chunk = task.result()
+                    except Exception as e:
+                        last_error = e
+                        await agen.aclose()
+                        if len(tried) < self.max_attempts:
+                            launch()
+                        continue
+                    if len(tried) > 1:
+                        backend.hedges_won += 1
+                    return backend, agen, first_chunk
+            raise last_error or RuntimeError("没有可用的模型后端")
+        finally:
+            # 取消落败的请求，释放后端连接
+            for task, (_, agen) in pending.items():
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for _, agen in pending.values():
+                await agen.aclose()
+
+    @staticmethod
+    async def _first_chunk(agen: AsyncGenerator) -> str:
+        try:
+            return await agen.__anext__()
+        except StopAsyncIteration:
+            return ""
+
+    def _pick_backend(self, exclude: Set[str] = frozenset()) -> Optional[BackendState]:
+        """选择预计最快完成的后端：(未完成请求数+1) / tokens每秒"""
+        candidates = [b for b in self.backends if b.endpoint not in exclude and not b.ejected]
+        if not candidates:
+            return None
+        known = [b.tokens_per_sec_ewma for b in candidates if b.tokens_per_sec_ewma]
+        default_tps = sum(known) / len(known) if known else 1.0
+        return min(candidates, key=lambda b: (b.outstanding + 1) / (b.tokens_per_sec_ewma or default_tps))
+
+    async def _stream_backend(self, backend: BackendState, payload: dict, stream: bool) -> AsyncGenerator[str, None]:
+        """向单个后端发起请求并逐块产出内容，失败时抛出异常由路由层处理"""
+        backend.outstanding += 1
+        backend.requests += 1
+        start = time.perf_counter()
+        first_at = None
+        tokens_per_sec = None
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+            async with self._get_session().post(f"{backend.endpoint}/api/chat", json=payload, timeout=timeout) as response:
+                response.raise_for_status()
+                if stream:
+                    async for line in response.content:
+                        if not line.strip():
+                            continue
+                        decoded = json.loads(line.decode("utf-8"))
+                        if "error" in decoded:
+                            raise RuntimeError(decoded["error"])
+                        if decoded.get("done"):
+                            tokens_per_sec = self._eval_rate(decoded)
+                        content = decoded.get("message", {}).get("content", "")
+                        if first_at is None:
+                            first_at = time.perf_counter()
+                        if content:
+                            yield content
+                else:
+                    result = await response.json()
+                    if "error" in result:
+                        raise RuntimeError(result["error"])
+                    first_at = time.perf_counter()
+                    tokens_per_sec = self._eval_rate(result)
+                    yield result["message"]["content"]
+            self._record_success(backend, start, first_at, tokens_per_sec)
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError, KeyError, RuntimeError) as e:
+            self._record_failure(backend, e)
+            raise
+        finally:
+            backend.outstanding -= 1
+
+    @staticmethod
+    def _eval_rate(result: dict) -> Optional[float]:
+        """根据Ollama返回的eval_count/eval_duration(纳秒)计算解码速度"""
+        count, duration = result.get("eval_count"), result.get("eval_duration")
+        if count and duration:
+            return count / (duration / 1e9)
+        return None
+
+    def _record_success(self, backend: BackendState, start: float, first_at: Optional[float],
+                        tokens_per_sec: Optional[float]):
+        end = time.perf_counter()
+        backend.consecutive_failures = 0
+        backend.latency_ewma = _ewma(backend.latency_ewma, end - start)
+        if first_at is not None:
+            backend.ttft_ewma = _ewma(backend.ttft_ewma, first_at - start)
+        if tokens_per_sec:
+            backend.tokens_per_sec_ewma = _ewma(backend.tokens_per_sec_ewma, tokens_per_sec)
+
+    def _record_failure(self, backend: BackendState, error: Exception):
+        backend.errors += 1
+        backend.consecutive_failures += 1
+        logger.warning(f"模型后端 {backend.endpoint} 请求失败({backend.consecutive_failures}): {str(error)}")
+        if backend.consecutive_failures >= self.failure_threshold and not backend.ejected:
+            backend.ejected_until = time.monotonic() + self.eject_seconds
+            backend.ejections += 1
+            logger.warning(f"模型后端 {backend.endpoint} 已摘除 {self.eject_seconds}s")
+
+    async def _health_check_loop(self):
+        """周期性健康检查：失败计入连续失败次数，成功则重新接入被摘除的后端"""
+        while not self._closed:
+            await asyncio.sleep(self.health_check_interval)
+            await asyncio.gather(*(self._check_backend(b) for b in self.backends))
+
+    async def _check_backend(self, backend: BackendState):
+        if self._closed:
+            return  # 关闭后连接池已释放，不再重建
+        try:
+            timeout = aiohttp.ClientTimeout(total=min(self.health_check_interval, 5))
+            async with self._get_session().get(f"{backend.endpoint}/api/tags", timeout=timeout) as response:
+                response.raise_for_status()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._record_failure(backend, e)
+            return
+        if backend.ejected or backend.consecutive_failures:
+            logger.info(f"模型后端 {backend.endpoint} 健康检查通过，重新接入")
+        backend.consecutive_failures = 0
+        backend.ejected_until = 0.0
+
+    def stats(self) -> Dict[str, Dict]:
+        """各后端延迟与错误指标"""
+        return {
+            b.endpoint: {
+                "available": not b.ejected,
+                "outstanding": b.outstanding,
+                "requests": b.requests,
+                "errors": b.errors,
+                "ejections": b.ejections,
+                "hedges_won": b.hedges_won,
+                "ttft_ms": round(b.ttft_ewma * 1000, 1) if b.ttft_ewma is not None else None,
+                "latency_ms": round(b.latency_ewma * 1000, 1) if b.latency_ewma is not None else None,
+                "tokens_per_sec": round(b.tokens_per_sec_ewma, 1) if b.tokens_per_sec_ewma else None,
+            }
+            for b in self.backends
+        }
+
+    def close(self):
+        self._closed = True
+        if self._health_future:
+            self._health_future.cancel()
+            self._health_future = None
+        if self._session and not self._session.closed:
+            session, self._session = self._session, None
+            try:
+                # 连接池绑定在总线事件循环上，可从任意线程调用
+                self.event_bus.submit(session.close())
+            except RuntimeError:
+                logger.warning("事件循环未运行，无法关闭模型后端连接池")
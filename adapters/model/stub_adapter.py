@@ -0,0 +1,135 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Deque, Dict, List, Optional
+
+from adapters.model.base_model_adapter import BaseModelAdapter
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_VOCABULARY = [
+    "系统", "命令", "执行", "文件", "目录", "配置", "参数", "结果", "检查", "进程",
+    " the", " file", " command", " run", " config", " output", " path", " error", " value", " check",
+]
+
+
+@dataclass
+class EmissionRecord:
+    """单次请求的token发出时间记录（perf_counter_ns）"""
+    request_index: int
+    session_id: Optional[str]
+    requested_at_ns: int
+    token_times_ns: List[int] = field(default_factory=list)
+
+    @property
+    def ttft_ms(self) -> Optional[float]:
+        if not self.token_times_ns:
+            return None
+        return (self.token_times_ns[0] - self.requested_at_ns) / 1e6
+
+
+class StubModelAdapter(BaseModelAdapter):
+    """
+    确定性的本地桩模型适配器（用于延迟/吞吐测试）
+    - 按配置的首token延迟、token间隔、回答长度分布流式产出合成token，可选<think>段
+    - 相同种子与相同提示词产出完全相同的内容
+    - 记录每个token的精确发出时间，与前端收到时间对比即可得到流水线自身开销
+    """
+
+    def __init__(self, config: dict, event_bus):
+        super().__init__(config, event_bus)
+        self.seed = config.get("seed", 42)
+        self.ttft_ms = config.get("ttft_ms", 200)
+        self.inter_token_ms = config.get("inter_token_ms", 20)
+        self.length_config = config.get("length", {})
+        self.think_tokens = config.get("think_tokens", 0)
+        self._records: Deque[EmissionRecord] = deque(maxlen=config.get("max_records", 1000))
+        self._request_counter = 0
+        self._lock = threading.Lock()
+
+    async def chat(
+            self,
+            messages: List[Dict],
+            stream: bool = False,
+            **kwargs
+    ) -> AsyncGenerator[str, None]:
+        record = self._new_record(kwargs.pop("session_id", None))
+        prompt = messages[-1].get("content", "") if messages else ""
+        rng = random.Random(f"{self.seed}:{prompt}")
+        tokens = self._synthesize(rng)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        if not stream:
+            await asyncio.sleep((self.ttft_ms + self.inter_token_ms * (len(tokens) - 1)) / 1000)
+            record.token_times_ns.append(time.perf_counter_ns())
+            yield "".join(tokens)
+            return
+
+        for i, token in enumerate(tokens):
+            # 按绝对时间表调度，避免sleep误差累积
+            deadline = start + (self.ttft_ms + self.inter_token_ms * i) / 1000
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            record.token_times_ns.append(time.perf_counter_ns())
+            yield token
+
+    def _new_record(self, session_id: Optional[str]) -> EmissionRecord:
+        with self._lock:
+            self._request_counter += 1
+            record = EmissionRecord(self._request_counter, session_id, time.perf_counter_ns())
+            self._records.append(record)
+        return record
+
+    def _synthesize(self, rng: random.Random) -> List[str]:
+        """生成合成token序列（可选<think>段 + 回答）"""
+        tokens = []
+        if self.think_tokens > 0:
+            tokens.append("<think>")
+            tokens.extend(rng.choice(_VOCABULARY) for _ in range(self.think_tokens))
+            tokens.append("</think>")
+        tokens.extend(rng.choice(_VOCABULARY) for _ in range(self._sample_length(rng)))
+        return tokens
+
+    def _sample_length(self, rng: random.Random) -> int:
+        """按配置的分布采样回答长度（token数）"""
+        distribution = self.length_config.get("distribution", "fixed")
+        mean = self.length_config.get("mean", 200)
+        low = self.length_config.get("min", 1)
+        high = self.length_config.get("max", mean * 2)
+        if distribution == "fixed":
+            length = mean
+        elif distribution == "uniform":
+            length = rng.randint(low, high)
+        elif distribution == "normal":
+            length = round(rng.gauss(mean, self.length_config.get("stddev", mean / 4)))
+        else:
+            raise ValueError(f"Unsupported length distribution: {distribution}")
+        return max(low, min(high, length))
+
+    def records(self) -> List[EmissionRecord]:
+        """最近请求的token发出时间记录"""
+        with self._lock:
+            return list(self._records)
+
+    def stats(self) -> Dict[str, float]:
+        """汇总实际发出节奏，可与配置值对比得到调度误差"""
+        records = [r for r in self.records() if r.token_times_ns]
+        if not records:
+            return {"requests": 0}
+        gaps = [
+            (b - a) / 1e6
+            for r in records
+            for a, b in zip(r.token_times_ns, r.token_times_ns[1:])
+        ]
+        return {
+            "requests": len(records),
+            "tokens": sum(len(r.token_times_ns) for r in records),
+            "mean_ttft_ms": sum(r.ttft_ms for r in records) / len(records),
+            "mean_inter_token_ms": sum(gaps) / len(gaps) if gaps else 0.0,
+        }
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 
 from utils.text_processing import TextProcessor
 
@@ -13,8 +13,9 @@ class BaseVectorDBAdapter(ABC):
         self.text_processor = TextProcessor()
         
     @abstractmethod
-    def create_dense_search_request(self, query_text: str, top_k: int) -> Any:
-        """创建稠密向量搜索请求"""
+    def create_dense_search_request(self, query_text: str, top_k: int,
+                                    query_vector: Optional[List[float]] = None) -> Any:
+        """创建稠密向量搜索请求（已有查询向量时直接使用，不再重复向量化）"""
         pass
     
     @abstractmethod
@@ -9,6 +9,7 @@ from pymilvus import (
 import time
 from adapters.vectordb.base_vector_db import BaseVectorDBAdapter
 from utils.text_processing import TextProcessor
+from utils.tracing import span
 
 class MilvusAdapter(BaseVectorDBAdapter):
     """Milvus向量数据库适配器，封装所有向量数据库操作"""
@@ -150,8 +151,11 @@ class MilvusAdapter(BaseVectorDBAdapter):
         self.collection.flush()
         print(f"[Milvus] 成功插入 {len(entities)} 条数据")
 
-    def create_dense_search_request(self, query_text, top_k):
-        embeddings = self.text_processor.embeddings.embed_query(query_text)
+    def create_dense_search_request(self, query_text, top_k, query_vector=None):
+        embeddings = query_vector
+        if embeddings is None:
+            with span("embed_query"):
+                embeddings = self.text_processor.embeddings.embed_query(query_text)
         return AnnSearchRequest(
             data=[embeddings],
             anns_field="embedding",
@@ -172,12 +176,13 @@ class MilvusAdapter(BaseVectorDBAdapter):
         :param requests: 检索请求列表
         :param top_k: 返回结果数量
         """
-        search_results = self.collection.hybrid_search(
-            reqs=requests,
-            rerank=reranker,
-            limit=top_k,
-            output_fields=["filename", "text"]
-        )
+        with span("milvus.hybrid_search", requests=len(requests)):
+            search_results = self.collection.hybrid_search(
+                reqs=requests,
+                rerank=reranker,
+                limit=top_k,
+                output_fields=["filename", "text"]
+            )
         return search_results
     
     async def async_search(self, requests: List[AnnSearchRequest], top_k: int, reranker= None) -> List[Any]:
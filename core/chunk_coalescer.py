@@ -0,0 +1,86 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Optional
+
+
+@dataclass
+class CoalescingConfig:
+    """响应分片合并配置（可按前端单独配置）"""
+    enabled: bool = True
+    max_chars: int = 64             # 缓冲内容达到该长度立即发送
+    flush_interval_ms: float = 16   # 缓冲内容最长等待时间
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any] = None) -> 'CoalescingConfig':
+        config = config or {}
+        return cls(**{k: v for k, v in config.items() if k in cls.__dataclass_fields__})
+
+
+async def coalesce_chunks(stream: AsyncIterator[str], config: CoalescingConfig) -> AsyncGenerator[str, None]:
+    """
+    将逐token的流合并为较大的帧
+    - 第一个token立即发送，保证首token延迟不退化
+    - 之后按长度(max_chars)或时间(flush_interval_ms)触发发送，先到者为准
+    - 源流结束时发送剩余内容
+    """
+    if not config.enabled:
+        async for content in stream:
+            yield content
+        return
+
+    loop = asyncio.get_running_loop()
+    interval = config.flush_interval_ms / 1000
+    iterator = stream.__aiter__()
+    buffer, size = [], 0
+    deadline: Optional[float] = None
+    first = True
+    next_task: Optional[asyncio.Task] = None
+
+    try:
+        while True:
+            if next_task is None and deadline is None:
+                # 缓冲区为空时无需计时，直接等待下一个token
+                try:
+                    content = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+            else:
+                if next_task is None:
+                    next_task = asyncio.ensure_future(iterator.__anext__())
+                timeout = None if deadline is None else max(deadline - loop.time(), 0)
+                done, _ = await asyncio.wait({next_task}, timeout=timeout)
+                if not done:
+                    # 等待超时：发送缓冲内容，继续等待同一个token
+                    yield "".join(buffer)
+                    buffer, size, deadline = [], 0, None
+                    continue
+                task, next_task = next_task, None
+                try:
+                    content = task.result()
+                except StopAsyncIteration:
+                    break
+
+            if not content:
+                continue
+            if first:
+                first = False
+                yield content
+                continue
+
+            buffer.append(content)
+            size += len(content)
+            if size >= config.max_chars:
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+            elif deadline is None:
+                deadline = loop.time() + interval
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if next_task is not None and not next_task.done():
+            next_task.cancel()
+            await asyncio.gather(next_task, return_exceptions=True)
+        aclose = getattr(iterator, "aclose", None)
+        if aclose:
+            await aclose()
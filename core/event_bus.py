@@ -1,14 +1,18 @@
 # core/event_bus.py
-from collections import defaultdict
-from typing import Callable, Any
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Any, Coroutine, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError, TimeoutError as FutureTimeoutError
 from utils.logger import get_logger
 import threading  # _lock的使用依赖
 import asyncio    # 异步执行依赖
 import inspect    # 函数类型检查依赖
 import os         # 线程数计算依赖
+import time       # 分发延迟统计依赖
 import traceback  # 错误堆栈跟踪依赖
 from core.events import EventType
+from core.event_metrics import MetricsSink, InMemoryMetricsSink
 
 logger = get_logger(__name__)
 """
@@ -17,71 +21,365 @@ logger = get_logger(__name__)
 - 支持`UserInputEvent`/`QueryResultEvent`/`ErrorEvent`等事件类型（需配合core/events.py使用）
 
 2. **关键功能特性**
-✅ 异步事件处理（ThreadPoolExecutor线程池）
+✅ 异步事件处理（每个订阅者独立的有界队列+工作线程，保证投递顺序；协程处理器逐个等待完成）
+✅ 队列满时按事件类型选择策略：阻塞(背压)/丢弃最旧/合并为最新值
 ✅ 同步/异步双模式发布（async_exec开关）
+✅ 协程处理器统一运行在总线自有的事件循环线程中（线程安全调度）
 ✅ 错误事件自动捕获与重发布
-✅ 线程安全的订阅管理（with _lock）
+✅ 按事件类型/处理器的指标：分发次数、执行耗时、排队等待、订阅者队列深度、溢出与异常次数
+✅ 写时复制的订阅表：订阅/取消订阅时在锁内整体替换不可变元组，发布路径无锁读取
 """
+class QueuePolicy(str, Enum):
+    """订阅者队列满时的处理策略"""
+    BLOCK = "block"              # 发布方等待队列空出（超时后丢弃最旧事件；事件循环线程内从不阻塞）
+    DROP_OLDEST = "drop_oldest"  # 丢弃队列中同类型最旧的事件
+    COALESCE = "coalesce"        # 同一处理器、同一会话只保留最新事件（入队即替换，不受容量限制）
+
+
+# 默认策略：流式片段必须有序完整，状态更新只需最新值
+DEFAULT_POLICIES = {
+    EventType.RESPONSE_CHUNK: QueuePolicy.BLOCK,
+    EventType.STATUS_UPDATE: QueuePolicy.COALESCE,
+}
+
+
+@dataclass
+class _QueuedEvent:
+    event_type: EventType
+    handler: Callable
+    data: Any
+    published_at: float
+
+    @property
+    def coalesce_key(self) -> Tuple:
+        """合并键：按会话区分，避免不同会话的状态互相覆盖"""
+        data = self.data
+        session_id = data.get("session_id") if isinstance(data, dict) else getattr(data, "session_id", None)
+        return self.event_type, self.handler, session_id
+
+
+class _SubscriberQueue:
+    """单个订阅者（同一对象的所有处理器）的有界队列，由专用工作线程按序消费"""
+
+    def __init__(self, bus: 'EventBus', name: str, maxsize: int):
+        self.bus = bus
+        self.name = name
+        self.maxsize = maxsize
+        self._items: deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.thread = threading.Thread(target=self._run, name=f"event-bus-{name}", daemon=True)
+        self.thread.start()
+
+    def put(self, item: _QueuedEvent, policy: QueuePolicy, block_timeout: float):
+        with self._cond:
+            if self._closed:
+                return
+            if policy == QueuePolicy.COALESCE:
+                stale = [i for i in self._items if i.coalesce_key == item.coalesce_key]
+                for i in stale:
+                    self._items.remove(i)
+                if stale:
+                    self.bus.metrics.inc("eventbus_coalesced_total", len(stale),
+                                         event_type=item.event_type.value, subscriber=self.name)
+            # 合并策略下每个处理器、每个会话至多一条待处理事件，无需占用容量上限
+            if policy != QueuePolicy.COALESCE and len(self._items) >= self.maxsize:
+                # 工作线程向自身队列发布时不能等待，否则会死锁；
+                # 总线事件循环线程也不能等待，否则所有协程一起停顿（应使用publish_backpressured）
+                if policy == QueuePolicy.BLOCK and threading.current_thread() is not self.thread \
+                        and not self.bus.in_loop_thread():
+                    self._cond.wait_for(lambda: len(self._items) < self.maxsize or self._closed, block_timeout)
+                if len(self._items) >= self.maxsize:
+                    self._drop_oldest(item.event_type)
+                    self.bus.metrics.inc("eventbus_queue_overflow_total", event_type=item.event_type.value,
+                                         subscriber=self.name, policy=policy.value)
+            self._items.append(item)
+            self._cond.notify_all()
+            depth = len(self._items)
+        self.bus.metrics.set_gauge("eventbus_subscriber_queue_depth", depth, subscriber=self.name)
+
+    def is_full(self) -> bool:
+        with self._cond:
+            return not self._closed and len(self._items) >= self.maxsize
+
+    def _drop_oldest(self, event_type: EventType):
+        """优先丢弃同类型最旧事件，避免挤掉其他类型（如STREAM_END）"""
+        for i in self._items:
+            if i.event_type == event_type:
+                self._items.remove(i)
+                return
+        self._items.popleft()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._items or self._closed)
+                if not self._items:
+                    return
+                item = self._items.popleft()
+                self._cond.notify_all()
+                depth = len(self._items)
+            self.bus.metrics.set_gauge("eventbus_subscriber_queue_depth", depth, subscriber=self.name)
+            if inspect.iscoroutinefunction(item.handler):
+                # 协程处理器调度到总线事件循环并等待完成后再取下一条：
+                # 慢订阅者的事件积压在本队列中，受容量上限与溢出策略约束
+                self._wait(self.bus.submit(self.bus._run_coroutine_handler(
+                    item.event_type, item.handler, item.data, item.published_at)))
+            else:
+                self.bus._run_sync_handler(item.event_type, item.handler, item.data, item.published_at)
+
+    def _wait(self, future: Future):
+        """等待协程处理器结束；队列关闭（总线停止）后不再等待"""
+        while not self._closed:
+            try:
+                future.result(timeout=0.5)
+                return
+            except FutureTimeoutError:
+                continue
+            except CancelledError:
+                return
+
+    def close(self):
+        """停止工作线程，丢弃未处理事件"""
+        with self._cond:
+            self._closed = True
+            self._items.clear()
+            self._cond.notify_all()
+
+
 class EventBus:
-    def __init__(self):
-        self._subscriptions = defaultdict(list)
+    def __init__(self, metrics_sink: MetricsSink = None, queue_size: int = 1024, block_timeout: float = 5.0,
+                 policies: Optional[Dict[EventType, QueuePolicy]] = None):
+        """
+        :param metrics_sink: 指标输出，默认使用内存存储（可通过snapshot/render_text读取）
+        :param queue_size: 每个订阅者队列的最大长度
+        :param block_timeout: BLOCK策略下发布方的最长等待时间（秒）
+        :param policies: 按事件类型覆盖队列满时的策略，未指定的类型使用BLOCK
+        """
+        self.metrics = metrics_sink or InMemoryMetricsSink()
+        self.queue_size = queue_size
+        self.block_timeout = block_timeout
+        self.policies = {**DEFAULT_POLICIES, **(policies or {})}
+        # 写时复制：以下两个字典只会在_lock内被整体替换，不会原地修改，发布时可无锁读取
+        self._queues: Dict[int, _SubscriberQueue] = {}
+        self._subscriptions: Dict[EventType, Tuple[Callable, ...]] = {}
         self._executor = ThreadPoolExecutor(
             max_workers=min(32, (os.cpu_count() or 1) + 4)  # 动态线程数
         )
         self._lock = threading.RLock()
-        self._async_loop = asyncio.new_event_loop()  # 独立事件循环
+        self._async_loop = asyncio.new_event_loop()  # 独立事件循环，由专用线程运行
+        self._loop_ready = threading.Event()
+        self._loop_thread = threading.Thread(target=self._run_loop, name="event-bus-loop", daemon=True)
+        self._loop_thread.start()
+        self._loop_ready.wait()
+        self._closed = False
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any] = None, metrics_sink: MetricsSink = None) -> 'EventBus':
+        """从process_config.event_bus创建"""
+        config = config or {}
+        return cls(
+            metrics_sink=metrics_sink,
+            queue_size=config.get("queue_size", 1024),
+            block_timeout=config.get("block_timeout", 5.0),
+            policies={EventType(k): QueuePolicy(v) for k, v in config.get("policies", {}).items()}
+        )
+
+    # ---------- 事件循环运行时 ----------
+    def _run_loop(self):
+        """专用线程：运行总线事件循环直到shutdown"""
+        asyncio.set_event_loop(self._async_loop)
+        self._async_loop.call_soon(self._loop_ready.set)
+        try:
+            self._async_loop.run_forever()
+        finally:
+            # 取消残留任务并等待其结束，再关闭事件循环
+            pending = asyncio.all_tasks(self._async_loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                self._async_loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._async_loop.run_until_complete(self._async_loop.shutdown_asyncgens())
+            self._async_loop.close()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """总线事件循环（协程处理器均在此循环中执行）"""
+        return self._async_loop
+
+    def in_loop_thread(self) -> bool:
+        return threading.current_thread() is self._loop_thread
 
+    def submit(self, coro: Coroutine) -> Future:
+        """从任意线程向总线事件循环提交协程"""
+        return asyncio.run_coroutine_threadsafe(coro, self._async_loop)
+
+    def call_soon(self, callback: Callable, *args):
+        """从任意线程在总线事件循环中调度回调"""
+        self._async_loop.call_soon_threadsafe(callback, *args)
+
+    def shutdown(self, timeout: float = 5.0):
+        """停止事件循环线程与线程池"""
+        if self._closed:
+            return
+        self._closed = True
+        with self._lock:
+            for queue in self._queues.values():
+                queue.close()
+        self._async_loop.call_soon_threadsafe(self._async_loop.stop)
+        if not self.in_loop_thread():
+            self._loop_thread.join(timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logger.info("EventBus已关闭")
+
+    # ---------- 订阅管理 ----------
     def subscribe(self, event_type: EventType, handler: Callable[[Any], None]):
         """订阅事件类型"""
         with self._lock:
-            self._subscriptions[event_type].append(handler)
+            owner = getattr(handler, "__self__", handler)
+            if id(owner) not in self._queues:
+                queue = _SubscriberQueue(self, self._subscriber_name(handler), self.queue_size)
+                self._queues = {**self._queues, id(owner): queue}
+            self._subscriptions = {
+                **self._subscriptions,
+                event_type: (*self._subscriptions.get(event_type, ()), handler)
+            }
             logger.debug(f"Subscribed to {event_type} with {handler.__name__}")
 
     def unsubscribe(self, event_type: EventType, handler: Callable[[Any], None]):
         """取消订阅"""
         with self._lock:
-            if handler in self._subscriptions[event_type]:
-                self._subscriptions[event_type].remove(handler)
+            handlers = self._subscriptions.get(event_type, ())
+            if handler in handlers:
+                index = handlers.index(handler)
+                self._subscriptions = {
+                    **self._subscriptions,
+                    event_type: handlers[:index] + handlers[index + 1:]
+                }
                 logger.debug(f"Unsubscribed {handler.__name__} from {event_type}")
-                
+
+    def remove_subscriber(self, owner: Any):
+        """取消某个对象的全部订阅并停止其队列工作线程（对象被丢弃前调用）"""
+        with self._lock:
+            self._subscriptions = {
+                event_type: tuple(h for h in handlers if getattr(h, "__self__", h) is not owner)
+                for event_type, handlers in self._subscriptions.items()
+            }
+            queue = self._queues.get(id(owner))
+            if queue is not None:
+                self._queues = {k: v for k, v in self._queues.items() if k != id(owner)}
+                queue.close()
+
+    # ---------- 发布 ----------
     async def publish_async(self, event_type: EventType, data: Any):
-        """原生异步发布方法"""
-        handlers = self._subscriptions.get(event_type, [])
-        try:
-            await asyncio.gather(*[
-                handler(data)
-                for handler in handlers
-                if inspect.iscoroutinefunction(handler)
-            ])
-        except Exception as e:
-            self.publish(EventType.ERROR, {"error": str(e)})
+        """原生异步发布方法：等待所有处理器（同步处理器在线程池中执行）完成"""
+        handlers = self._subscriptions.get(event_type, ())
+        published_at = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        awaitables = []
+        for handler in handlers:
+            if inspect.iscoroutinefunction(handler):
+                coro = self._run_coroutine_handler(event_type, handler, data, published_at)
+                # 协程处理器始终在总线事件循环中执行
+                awaitables.append(coro if loop is self._async_loop else asyncio.wrap_future(self.submit(coro)))
+            else:
+                awaitables.append(loop.run_in_executor(
+                    self._executor, self._run_sync_handler, event_type, handler, data, published_at
+                ))
+        await asyncio.gather(*awaitables)
+
     def publish(self, event_type: EventType, data: Any = None, async_exec: bool = True):
         """发布事件"""
-        handlers = self._subscriptions.get(event_type, [])
+        handlers = self._subscriptions.get(event_type, ())
         logger.debug(f"Dispatching {event_type} to {len(handlers)} handlers")
+        published_at = time.perf_counter()
 
-        def _execute_handler(handler):
-            try:
-                if inspect.iscoroutinefunction(handler):
-                    asyncio.run_coroutine_threadsafe(handler(data), self._async_loop)
-                else:
-                    handler(data)
-            except Exception as e:
-                logger.error(f"Error handling {event_type}: {str(e)}")
-                self.publish(EventType.ERROR, {
-                    "event_type": event_type,
-                    "error": str(e),
-                    "stack_trace": traceback.format_exc()
-                })
-
-        if async_exec:
-            for handler in handlers:
-                self._executor.submit(_execute_handler, handler)
-        else:
-            for handler in handlers:
-                _execute_handler(handler)
+        for handler in handlers:
+            if async_exec or inspect.iscoroutinefunction(handler):
+                # 经订阅者队列按序投递（协程处理器由工作线程调度到总线事件循环并等待完成）
+                self._enqueue(event_type, handler, data, published_at)
+            else:
+                self._run_sync_handler(event_type, handler, data, published_at)
+
+    async def publish_backpressured(self, event_type: EventType, data: Any):
+        """
+        在总线事件循环中按序发布需要背压的事件（如RESPONSE_CHUNK）
+        BLOCK策略的队列已满时在线程池中等待空位：只挂起当前协程，事件循环上的其它请求照常运行
+        """
+        handlers = self._subscriptions.get(event_type, ())
+        published_at = time.perf_counter()
+        policy = self.policies.get(event_type, QueuePolicy.BLOCK)
+        for handler in handlers:
+            queue = self._queues.get(id(getattr(handler, "__self__", handler)))
+            if queue is None:
+                continue
+            item = _QueuedEvent(event_type, handler, data, published_at)
+            if policy == QueuePolicy.BLOCK and queue.is_full():
+                await asyncio.to_thread(queue.put, item, policy, self.block_timeout)
+            else:
+                queue.put(item, policy, self.block_timeout)
+
+    def _enqueue(self, event_type: EventType, handler: Callable, data: Any, published_at: float):
+        """投递到处理器所属订阅者的队列"""
+        queue = self._queues.get(id(getattr(handler, "__self__", handler)))
+        if queue is None:
+            return  # 已关闭
+        policy = self.policies.get(event_type, QueuePolicy.BLOCK)
+        queue.put(_QueuedEvent(event_type, handler, data, published_at), policy, self.block_timeout)
+
+    def _run_sync_handler(self, event_type: EventType, handler: Callable, data: Any, published_at: float):
+        name = self._handler_name(handler)
+        started_at = self._record_start(event_type, name, published_at)
+        try:
+            handler(data)
+        except Exception as e:
+            self._handle_error(event_type, e, name)
+        finally:
+            self.metrics.observe("eventbus_handler_seconds", time.perf_counter() - started_at,
+                                 event_type=event_type.value, handler=name)
+
+    async def _run_coroutine_handler(self, event_type: EventType, handler: Callable, data: Any, published_at: float):
+        name = self._handler_name(handler)
+        started_at = self._record_start(event_type, name, published_at)
+        try:
+            await handler(data)
+        except Exception as e:
+            self._handle_error(event_type, e, name)
+        finally:
+            self.metrics.observe("eventbus_handler_seconds", time.perf_counter() - started_at,
+                                 event_type=event_type.value, handler=name)
+
+    @staticmethod
+    def _handler_name(handler: Callable) -> str:
+        return getattr(handler, "__qualname__", None) or repr(handler)
+
+    def _record_start(self, event_type: EventType, handler_name: str, published_at: float) -> float:
+        """记录分发次数与发布到开始执行的等待时间"""
+        started_at = time.perf_counter()
+        self.metrics.inc("eventbus_dispatch_total", event_type=event_type.value, handler=handler_name)
+        self.metrics.observe("eventbus_queue_wait_seconds", started_at - published_at,
+                             event_type=event_type.value, handler=handler_name)
+        return started_at
+
+    @staticmethod
+    def _subscriber_name(handler: Callable) -> str:
+        owner = getattr(handler, "__self__", None)
+        if owner is not None:
+            return type(owner).__name__
+        return getattr(handler, "__qualname__", None) or repr(handler)
+
+    def _handle_error(self, event_type: EventType, error: Exception, handler_name: str = ""):
+        logger.error(f"Error handling {event_type}: {str(error)}")
+        self.metrics.inc("eventbus_handler_errors_total", event_type=event_type.value, handler=handler_name)
+        if event_type == EventType.ERROR:
+            return  # 避免错误处理器自身出错导致递归发布
+        self.publish(EventType.ERROR, {
+            "event_type": event_type,
+            "error": str(error),
+            "stack_trace": traceback.format_exc()
+        })
 
     def clear_subscriptions(self):
         """清空所有订阅"""
         with self._lock:
-            self._subscriptions.clear()
+            self._subscriptions = {}
@@ -0,0 +1,144 @@
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+# 默认直方图分桶（秒）：覆盖从微秒级分发到数秒级阻塞处理器
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(**labels) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """固定分桶直方图（非线程安全，由sink加锁）"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为+Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.counts)),
+        }
+
+
+class MetricsSink(ABC):
+    """指标输出接口：EventBus只依赖该接口，可替换为Prometheus/StatsD等实现"""
+
+    @abstractmethod
+    def inc(self, name: str, amount: float = 1, **labels):
+        """计数器累加"""
+        pass
+
+    @abstractmethod
+    def observe(self, name: str, value: float, **labels):
+        """直方图观测（秒）"""
+        pass
+
+    @abstractmethod
+    def set_gauge(self, name: str, value: float, **labels):
+        """设置瞬时值"""
+        pass
+
+
+class NullMetricsSink(MetricsSink):
+    """关闭指标采集"""
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        pass
+
+    def observe(self, name: str, value: float, **labels):
+        pass
+
+    def set_gauge(self, name: str, value: float, **labels):
+        pass
+
+
+class InMemoryMetricsSink(MetricsSink):
+    """内存指标存储，提供快照API与文本展示格式（Prometheus exposition）"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+        self._gauges: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = defaultdict(dict)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _labels(**labels)
+        with self._lock:
+            self._counters[name][key] += amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(**labels)
+        with self._lock:
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = Histogram(self._buckets)
+            histogram.observe(value)
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = _labels(**labels)
+        with self._lock:
+            self._gauges[name][key] = value
+
+    def snapshot(self) -> Dict[str, List[Dict]]:
+        """所有指标的快照：{指标名: [{"labels": {...}, "value"/直方图字段...}]}"""
+        with self._lock:
+            result = {}
+            for name, series in self._counters.items():
+                result[name] = [{"labels": dict(k), "value": v} for k, v in series.items()]
+            for name, series in self._gauges.items():
+                result[name] = [{"labels": dict(k), "value": v} for k, v in series.items()]
+            for name, series in self._histograms.items():
+                result[name] = [{"labels": dict(k), **h.snapshot()} for k, h in series.items()]
+            return result
+
+    def top_handlers(self, name: str = "eventbus_handler_seconds", by: str = "sum", limit: int = 10) -> List[Dict]:
+        """按累计耗时(或max/mean)排序的处理器，用于定位热点或阻塞的订阅者"""
+        return sorted(self.snapshot().get(name, []), key=lambda s: s[by], reverse=True)[:limit]
+
+    def render_text(self) -> str:
+        """Prometheus文本展示格式"""
+        def fmt(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{fmt(k)} {v}" for k, v in series.items())
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{fmt(k)} {v}" for k, v in series.items())
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for k, h in series.items():
+                    cumulative = 0
+                    for bound, count in zip([*map(str, h.buckets), "+Inf"], h.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt(k, (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{fmt(k)} {h.sum}")
+                    lines.append(f"{name}_count{fmt(k)} {h.count}")
+        return "\n".join(lines) + "\n"
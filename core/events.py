@@ -1,13 +1,17 @@
 # core/events.py
+import sys
+from dataclasses import dataclass, field
 from enum import Enum
+from typing import Dict, List
 
 class EventType(str, Enum):
     # 用户交互事件
     USER_INPUT = "user_input"             # 数据格式: str
+    DRAFT_INPUT = "draft_input"           # 输入框草稿（防抖后发送）, 数据格式: {"text": str, "session_id": str(可选)}
     CLEAR_HISTORY = "clear_history"       # 数据格式: None
 
     # 系统状态事件
-    STATUS_UPDATE = "status_update"       # 数据格式: {"state": "processing"/"idle"}
+    STATUS_UPDATE = "status_update"       # 数据格式: StatusUpdateEvent
     SECURITY_ALERT = "security_alert"     # 数据格式: {"type": alert_type, "details": ...}
 
     # 知识检索事件
@@ -17,8 +21,8 @@ class EventType(str, Enum):
     KNOWLEDGE_READY = "knowledge_ready"  # 到知识检索事件部
 
     # 问答生成事件
-    GENERATION_START = "generation_start"       # 数据格式: {"question": str}
-    GENERATION_COMPLETE = "generation_complete" # 数据格式: {"answer": str, "sources": list}
+    GENERATION_START = "generation_start"       # 数据格式: GenerationStartEvent
+    GENERATION_COMPLETE = "generation_complete" # 数据格式: GenerationCompleteEvent
 
     # 命令执行事件
     COMMAND_START = "command_start"       # 数据格式: str (command)
@@ -33,10 +37,57 @@ class EventType(str, Enum):
 
     # 输出事件
     STREAM_START = "stream_start"           # 流式开始
-    RESPONSE_CHUNK = "response_chunk"       # 流式响应片段
+    RESPONSE_CHUNK = "response_chunk"       # 流式响应片段, 数据格式: ResponseChunkEvent
     STREAM_END = "stream_end"               # 流式结束
 
     CANCEL_OPERATION = "cancel_operation"
 
     CONTEXT_MENU = "context_menu"
 
+
+# ---------- 高频事件负载（slots数据类：避免每个事件构建dict及ISO时间字符串） ----------
+# 时间戳统一为time.time()浮点秒，需要展示/持久化时再格式化
+# dataclass(slots=True)需要Python 3.10+，3.9下退化为普通数据类（字段与行为相同）
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_SLOTS)
+class ResponseChunk:
+    """模型输出的一个响应片段"""
+    content: str
+    start_time: float
+
+
+@dataclass(**_SLOTS)
+class ResponseChunkEvent:
+    chunk: ResponseChunk
+    session_id: str
+    correlation_id: str
+
+
+@dataclass(**_SLOTS)
+class StatusUpdateEvent:
+    state: str  # "processing" / "idle" / "generating" / "queued"
+    session_id: str = ""
+    queue_position: int = 0  # state为queued时的排队位置（从1开始）
+
+
+@dataclass(**_SLOTS)
+class GenerationStartEvent:
+    question: str
+    session_id: str
+    start_time: float
+    model_name: str
+    correlation_id: str
+    sources: List[str] = field(default_factory=list)
+    prompt_tokens: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass(**_SLOTS)
+class GenerationCompleteEvent:
+    session_id: str
+    status: str  # "success" / "cancelled"
+    start_time: float
+    response_time: float
+    model_name: str
+    correlation_id: str
+    sources: List[str] = field(default_factory=list)
@@ -1,15 +1,21 @@
 # core/process_controller.py
 import asyncio
 import uuid
+from collections import OrderedDict
 from datetime import datetime
-from time import time
-from typing import Dict, Any, Optional, Tuple
+from time import time, perf_counter
+from typing import Dict, Any, Optional, Tuple, Union
 from dataclasses import dataclass, field
 
 from core.event_bus import EventBus
+from core.query_router import QueryRouter, RouteAction, RouterConfig
+from core.request_scheduler import FairRequestScheduler, RequestPriority, SchedulerConfig, SchedulerRejected
+from core.retrieval_prefetch import PrefetchConfig, RetrievalPrefetcher
 from core.retrieval_service import RetrievalService
+from core.task_registry import TaskRegistry
 from utils.logger import get_logger
-from core.events import EventType
+from utils.tracing import record_span, span, start_trace
+from core.events import EventType, ResponseChunk, ResponseChunkEvent, GenerationStartEvent, GenerationCompleteEvent
 from services.command_processor import CommandProcessor
 from services.session_manager import SessionManager
 from core.qa_engine import QAEngine
@@ -24,6 +30,7 @@ class PipelineContext:
     correlation_id: str = None
     task: Optional[asyncio.Task] = None  # 添加任务引用
     knowledge: list = field(default_factory=list)
+    history: list = field(default_factory=list)  # 本轮提问之前的对话历史快照
 
 class ProcessController:
     def __init__(
@@ -40,10 +47,37 @@ class ProcessController:
         self.qa_engine = qa_engine
         self.command_processor = command_processor
         self.session_manager = session_manager
-        self._active_tasks = set()
-        
         self.process_config = process_config  # 修改: 使用传入的 process_config
-        self._task_semaphore = asyncio.Semaphore(self.process_config.task_control().get("max_concurrent_tasks", 5))
+        # 进行中请求（含排队中）的任务登记表，用于按会话/correlation_id取消
+        self.task_registry = TaskRegistry(event_bus.metrics)
+        # 输入过程中的检索预取
+        self.prefetcher = RetrievalPrefetcher(
+            self._search_knowledge,
+            PrefetchConfig.from_config(self.process_config.get("retrieval_prefetch", {}))
+        )
+        # 检索前的提问路由（跳过/复用/按需确定检索条数）
+        router_config = {
+            "max_top_k": self.process_config.get("max_knowledge_results", 5),
+            **(self.process_config.get("query_router", {}) or {})
+        }
+        self.query_router = QueryRouter(
+            RouterConfig.from_config(router_config),
+            embed=self.retrieval_service.embed_queries if self.retrieval_service else None,
+            metrics=event_bus.metrics
+        )
+        # 各会话上一轮检索到的知识，追问时复用
+        self._last_knowledge: "OrderedDict[str, list]" = OrderedDict()
+        self._max_last_knowledge = 256
+        # 各阶段耗时（秒），按correlation_id保存最近的请求
+        self._stage_timings: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._max_stage_timings = 256
+
+        # 按会话公平调度（替代全局信号量），未单独配置并发数时沿用task_control.max_concurrent_tasks
+        scheduler_config = {
+            "max_concurrent": self.process_config.task_control().get("max_concurrent_tasks", 5),
+            **(self.process_config.get("scheduler", {}) or {})
+        }
+        self.scheduler = FairRequestScheduler(SchedulerConfig.from_config(scheduler_config), event_bus)
     
         self._register_event_handlers()
 
@@ -57,6 +91,8 @@ class ProcessController:
             EventType.GENERATION_COMPLETE: self.handle_generation_complete,
             EventType.RETRIEVE_KNOWLEDGE: self.handle_retrieve_knowledge
         }
+        if self.prefetcher.config.enabled and self.retrieval_service:
+            event_mapping[EventType.DRAFT_INPUT] = self.handle_draft_input
 
         for event_type, handler in event_mapping.items():
             self.event_bus.subscribe(event_type, handler)
@@ -70,33 +106,63 @@ class ProcessController:
     def handle_clear_history(self, data=None):
     
         # 需要同步清理会话
-        self.session_manager.clear_history(data.get("session_id") if data else self.session_manager.get_current_session())
+        session_id = data.get("session_id") if data else self.session_manager.get_current_session()
+        self.session_manager.clear_history(session_id)
+        self._last_knowledge.pop(session_id, None)
+
+    async def handle_draft_input(self, data: Dict[str, Any]):
+        """输入框草稿：后台预取检索结果"""
+        session_id = data.get("session_id") or self.session_manager.get_current_session()
+        self.prefetcher.submit(session_id, data.get("text", ""))
+
     async def handle_user_input(self, data: Dict[str, Any]):
-        """处理用户输入主流程"""
+        """
+        处理用户输入主流程
+        只负责登记请求任务后立即返回：总线按序等待协程处理器完成，
+        排队与并发上限由调度器负责，不占住本订阅者的事件队列
+        """
         ctx = PipelineContext(
-            session_id=self.session_manager.get_current_session(),
-            question=data.get("text", "").strip()
+            session_id=data.get("session_id") or self.session_manager.get_current_session(),
+            question=data.get("text", "").strip(),
+            correlation_id=str(uuid.uuid4())
         )
 
         if not ctx.question:
             return
 
         try:
-            async with self._task_semaphore:
-                async with asyncio.TaskGroup() as tg:
-                    process_task = tg.create_task(self._process_input(ctx))
-                    ctx.task = process_task
-                    self._active_tasks.add(process_task)
-                    process_task.add_done_callback(
-                        lambda t: self._active_tasks.discard(t)
-                    )
+            priority = RequestPriority(data.get("priority", RequestPriority.INTERACTIVE))
+        except ValueError as e:
+            self._publish_error("input_processing", str(e), ctx.question, ctx.session_id)
+            return
+        # 排队阶段也登记，取消时可直接移出调度队列
+        ctx.task = asyncio.create_task(self._run_request(ctx, priority))
+        self.task_registry.register(ctx.session_id, ctx.correlation_id, ctx.task)
+
+    async def _run_request(self, ctx: PipelineContext, priority: RequestPriority):
+        """单个请求任务：排队、执行并处理取消与错误"""
+        try:
+            await self._run_scheduled(ctx, priority)
+        except asyncio.CancelledError:
+            logger.info(f"请求已取消: correlation_id={ctx.correlation_id}")
+        except SchedulerRejected as e:
+            self._publish_error("overloaded", str(e), ctx.question, ctx.session_id)
         except Exception as e:
-            self._publish_error("input_processing", str(e), ctx.question)
+            self._publish_error("input_processing", str(e), ctx.question, ctx.session_id)
+
+    async def _run_scheduled(self, ctx: PipelineContext, priority: RequestPriority):
+        start_trace(ctx.correlation_id)
+        with span("request", session_id=ctx.session_id, priority=priority.value):
+            queued_at = time()
+            async with self.scheduler.slot(ctx.session_id, priority):
+                record_span("queue_wait", queued_at, time())
+                await self._process_input(ctx)
 
     async def _process_input(self, ctx: PipelineContext):
         """输入处理流水线"""
         try:
-            sanitized = self.command_processor.sanitize_input(ctx.question)
+            with span("sanitize"):
+                sanitized = self.command_processor.sanitize_input(ctx.question)
 
             if self.command_processor.is_dangerous_command(sanitized):
                 await self._handle_command(sanitized, ctx)
@@ -105,8 +171,9 @@ class ProcessController:
 
         except asyncio.CancelledError:
             logger.info("Processing cancelled")
+            raise
         except Exception as e:
-            self._publish_error("processing", str(e), ctx.question)
+            self._publish_error("processing", str(e), ctx.question, ctx.session_id)
 
     async def _handle_command(self, command: str, ctx: PipelineContext):
         """命令执行处理"""
@@ -119,8 +186,8 @@ class ProcessController:
             return
 
         try:
-            result = await asyncio.wait_for(
-                self.command_processor.execute_async(command),
+            result = await self.command_processor.execute_async(
+                command,
                 timeout=self.process_config.task_control().get("command_timeout", 30)
             )
 
@@ -131,51 +198,93 @@ class ProcessController:
             })
 
         except asyncio.TimeoutError:
-            self._publish_error("command_timeout", "Command execution timed out", command)
+            self._publish_error("command_timeout", "Command execution timed out", command, ctx.session_id)
 
     async def _handle_qa_flow(self, ctx: PipelineContext):
         """问答流程处理"""
-        ctx.correlation_id = str(uuid.uuid4())
+        ctx.correlation_id = ctx.correlation_id or str(uuid.uuid4())
         try:
             async with asyncio.TaskGroup() as tg:
-                # 创建并自动管理任务
-                pipeline_task = tg.create_task(self._execute_qa_pipeline(ctx))
-                ctx.task = pipeline_task  # 建立反向引用
-                self._active_tasks.add(pipeline_task)
-                pipeline_task.add_done_callback(
-                    lambda t: self._active_tasks.discard(t)
-                )
-            # 任务完成后自动移除
-            self._active_tasks.discard(pipeline_task)
-    
+                tg.create_task(self._execute_qa_pipeline(ctx))
+
         except asyncio.CancelledError:
             logger.info(f"QA flow cancelled: {ctx.correlation_id}")
             raise
         except ExceptionGroup as eg:
             for e in eg.exceptions:
-                self._publish_error("qa_flow", str(e), ctx.question)
+                self._publish_error("qa_flow", str(e), ctx.question, ctx.session_id)
 
     async def _execute_qa_pipeline(self, ctx: PipelineContext):
-        """封装完整的QA处理流水线"""
-        # 保存用户提问
+        """
+        封装完整的QA处理流水线（阶段图）
+        - 历史快照+保存提问、提问摘要、知识检索三者并发，阻塞调用均在线程池中执行
+        - 历史与知识就绪后立即开始生成，不等待摘要
+        - 摘要完成后回填到已保存的提问消息
+        """
+        pipeline_start = perf_counter()
+        summary_task = asyncio.create_task(self._timed_stage(ctx, "summarize", asyncio.to_thread(
+            self.retrieval_service.vectordb.text_processor.summarize_text, ctx.question
+        )))
+        try:
+            ctx.history, knowledge = await asyncio.gather(
+                self._timed_stage(ctx, "history", asyncio.to_thread(self._snapshot_history_and_save_question, ctx)),
+                self._timed_stage(ctx, "retrieval", self._retrieve_knowledge(ctx))
+            )
+            ctx.knowledge = self._enrich_knowledge(knowledge)  # 新增知识增强处理
+
+            # 生成响应
+            await self._timed_stage(ctx, "generation", self._generate_response(ctx))
 
-        summary = self.retrieval_service.vectordb.text_processor.summarize_text(ctx.question)
+            try:
+                summary = await summary_task
+            except Exception as e:
+                logger.warning(f"提问摘要失败，历史中将不含该提问摘要: {str(e)}")
+            else:
+                await asyncio.to_thread(
+                    self.session_manager.update_message_summary, ctx.session_id, ctx.correlation_id, summary
+                )
+        finally:
+            if not summary_task.done():
+                summary_task.cancel()
+            self._record_stage(ctx, "total", perf_counter() - pipeline_start)
+            logger.info(f"QA流水线阶段耗时: correlation_id={ctx.correlation_id}, "
+                        f"{self.get_stage_timings(ctx.correlation_id)}")
+
+    def _snapshot_history_and_save_question(self, ctx: PipelineContext) -> list:
+        """先获取历史快照再保存本轮提问，提示词中的历史不会包含当前问题"""
+        history = self.session_manager.get_history(
+            ctx.session_id,
+            self.process_config.get("max_history_messages", 5))
         self.session_manager.add_message(
             ctx.session_id,
             "user",
             ctx.question,
             thought="",
-            summary=summary,
+            summary="",
             metadata={"correlation_id": ctx.correlation_id}
         )
-    
-        # 知识检索
-        knowledge = await self._retrieve_knowledge(ctx)
-        ctx.knowledge = self._enrich_knowledge(knowledge)  # 新增知识增强处理
+        return history
 
-    # 生成响应
-       
-        await self._generate_response(ctx)
+    async def _timed_stage(self, ctx: PipelineContext, stage: str, awaitable):
+        """执行一个阶段并记录耗时"""
+        start = perf_counter()
+        try:
+            with span(stage):
+                return await awaitable
+        finally:
+            self._record_stage(ctx, stage, perf_counter() - start)
+
+    def _record_stage(self, ctx: PipelineContext, stage: str, seconds: float):
+        timings = self._stage_timings.get(ctx.correlation_id)
+        if timings is None:
+            timings = self._stage_timings[ctx.correlation_id] = {}
+            while len(self._stage_timings) > self._max_stage_timings:
+                self._stage_timings.popitem(last=False)
+        timings[stage] = round(seconds, 4)
+
+    def get_stage_timings(self, correlation_id: str) -> Dict[str, float]:
+        """获取指定请求的各阶段耗时（秒）"""
+        return dict(self._stage_timings.get(correlation_id, {}))
 
     def _enrich_knowledge(self, raw_knowledge: list) -> list:
         # 1. 添加时效性过滤
@@ -201,71 +310,100 @@ class ProcessController:
     
     async def _retrieve_knowledge(self, ctx: PipelineContext) -> list:
         if not self.retrieval_service: 
-            self._publish_error("retrieval_error", "VectorDB adapter not initialized")
+            self._publish_error("retrieval_error", "VectorDB adapter not initialized", session_id=ctx.session_id)
             return []
         
         """知识检索处理"""
         try:
-            # 通过服务层进行检索
-            raw_results = await self.retrieval_service.hybrid_search(
-                query=ctx.question,
-                top_k=self.process_config.get("max_knowledge_results", 5)  # 修改: 使用 process_config 替代 db_config
-            )
-
-            return self._filter_knowledge(raw_results)
+            previous = self._last_knowledge.get(ctx.session_id)
+            with span("route") as attrs:
+                decision = await self.query_router.route(ctx.question, has_previous_knowledge=bool(previous))
+                attrs.update(label=decision.label, action=decision.action.value, top_k=decision.top_k)
+            self.query_router.record(decision, ctx.session_id, ctx.correlation_id, ctx.question)
+
+            if decision.action is RouteAction.SKIP:
+                self.prefetcher.discard(ctx.session_id)
+                return []
+            if decision.action is RouteAction.REUSE:
+                self.prefetcher.discard(ctx.session_id)
+                return previous
+
+            # 优先复用输入过程中预取的结果
+            raw_results = None
+            if self.prefetcher.config.enabled:
+                with span("prefetch_lookup") as attrs:
+                    raw_results = await self.prefetcher.take(ctx.session_id, ctx.question)
+                    attrs["hit"] = raw_results is not None
+            if raw_results is None:
+                # 路由已计算的提问向量直接用于稠密检索，避免重复向量化
+                raw_results = await self._search_knowledge(ctx.question, decision.top_k, decision.query_vector)
+
+            knowledge = self._filter_knowledge(raw_results[:decision.top_k])
+            self._remember_knowledge(ctx.session_id, knowledge)
+            return knowledge
 
         except asyncio.TimeoutError:
-            self._publish_error("retrieval_timeout", "Knowledge retrieval timed out", ctx.question)
+            self._publish_error("retrieval_timeout", "Knowledge retrieval timed out", ctx.question, ctx.session_id)
             return []
 
 
+    def _remember_knowledge(self, session_id: str, knowledge: list):
+        self._last_knowledge[session_id] = knowledge
+        self._last_knowledge.move_to_end(session_id)
+        while len(self._last_knowledge) > self._max_last_knowledge:
+            self._last_knowledge.popitem(last=False)
+
+    async def _search_knowledge(self, query: str, top_k: int = None, query_vector: list = None) -> list:
+        """通过服务层进行检索"""
+        return await self.retrieval_service.hybrid_search(
+            query=query,
+            top_k=top_k or self.process_config.get("max_knowledge_results", 5),  # 修改: 使用 process_config 替代 db_config
+            query_vector=query_vector
+        )
+
     async def _generate_response(self, ctx: PipelineContext):
         """生成响应流"""
         try:
-            messages = self.session_manager.get_history(
-                ctx.session_id,
-                self.process_config.get("max_history_messages", 5))
-            
-                
             response_stream = self.qa_engine.generate_response(
                 question=ctx.question,
                 session_id=ctx.session_id,
                 knowledge=ctx.knowledge,
                 correlation_id=ctx.correlation_id,
-                dialog_history=messages,
+                dialog_history=ctx.history,
                 stream=True  # 添加流式开关
             )
 
+            # 分片投递（过滤/缓冲/发布）按整体汇总为一个span，避免每个分片一个span
+            delivery_start, busy, chunks = time(), 0.0, 0
             async for chunk in response_stream:
-                self._process_response_chunk(chunk, ctx)
+                chunk_start = perf_counter()
+                await self._process_response_chunk(chunk, ctx)
+                busy += perf_counter() - chunk_start
+                chunks += 1
+            record_span("stream_delivery", delivery_start, time(), chunks=chunks, busy_ms=round(busy * 1000, 3))
 
         except Exception as e:
-            self._publish_error("response_generation", str(e), ctx.question)
-
-    def _process_response_chunk(self, chunk: Dict, ctx: PipelineContext):
-        if not isinstance(chunk, dict):
-            raise ValueError(f"无效的响应块类型: {type(chunk)}")
-        # 新增安全过滤
-        chunk["content"] = self.command_processor.filter_response(
-            chunk.get("content", "")
-        )
+            self._publish_error("response_generation", str(e), ctx.question, ctx.session_id)
 
+    async def _process_response_chunk(self, chunk: ResponseChunk, ctx: PipelineContext):
         """处理响应分片"""
         valid_chunk = self._validate_chunk(chunk)
-                            
-        self.session_manager.append_chunk(ctx.session_id, valid_chunk)
+        # 新增安全过滤
+        valid_chunk.content = self.command_processor.filter_response(valid_chunk.content)
 
-        self.event_bus.publish(EventType.RESPONSE_CHUNK, {
-            "chunk": valid_chunk,
-            "session_id": ctx.session_id,
-            "correlation_id": ctx.correlation_id
-        })
+        self.session_manager.append_chunk(ctx.session_id, valid_chunk.content)
+
+        # 在总线事件循环中运行：慢订阅者只挂起本请求的流，不阻塞事件循环
+        await self.event_bus.publish_backpressured(EventType.RESPONSE_CHUNK, ResponseChunkEvent(
+            chunk=valid_chunk,
+            session_id=ctx.session_id,
+            correlation_id=ctx.correlation_id
+        ))
 
-    def _validate_chunk(self, chunk: Dict) -> Dict:
+    def _validate_chunk(self, chunk: ResponseChunk) -> ResponseChunk:
         """验证响应块有效性"""
-        required_keys = ["content"]
-        if not all(k in chunk for k in required_keys):
-            raise ValueError("Invalid response chunk format")
+        if not isinstance(chunk, ResponseChunk) or not isinstance(chunk.content, str):
+            raise ValueError(f"无效的响应块类型: {type(chunk)}")
         return chunk
     
     def _split_response(self, response: str) -> Tuple[str, str]:
@@ -281,24 +419,24 @@ class ProcessController:
             final_answer = response[think_end+8:].strip()
         return thought, final_answer
     
-    def handle_generation_start(self, data: Dict):
+    def handle_generation_start(self, data: GenerationStartEvent):
         """处理生成开始事件"""
 
         metadata = self._build_metadata(data)
         self.event_bus.publish(EventType.STREAM_START, {
             "type": "ai_response",
-            "correlation_id": data.get("correlation_id", ""),
+            "correlation_id": data.correlation_id,
             "metadata" : metadata
         })
-    def handle_generation_complete(self, data: Dict):
+    def handle_generation_complete(self, data: GenerationCompleteEvent):
         """处理生成完成事件"""
         try:
             metadata = self._build_metadata(data)
-            full_response = self._finalize_response(data["session_id"])
+            full_response = self._finalize_response(data.session_id)
             thought, final_answer = self._split_response(full_response)
 
             self._save_response_to_session(
-                session_id=data["session_id"],
+                session_id=data.session_id,
                 response=final_answer,
                 thought=thought,
                 metadata=metadata
@@ -309,22 +447,24 @@ class ProcessController:
         except KeyError as e:
             self._publish_error("metadata_error", f"Missing key: {str(e)}", data)
 
-    def _build_metadata(self, data: Dict) -> Dict:
-        """构建响应元数据"""
+    def _build_metadata(self, data: Union[GenerationStartEvent, GenerationCompleteEvent]) -> Dict:
+        """构建响应元数据（时间戳在此处格式化为ISO字符串，用于展示与持久化）"""
+        response_time = getattr(data, "response_time", None)
         return { 
-            "model": data.get("model_name", "default_model"), 
+            "model": data.model_name or "default_model",
             "generated_at": datetime.now().isoformat(),
-            "start_time": data.get("start_time", 0),
-            "response_time": data.get("response_time", 0), 
-            "sources": data.get("sources", []),  
-            "correlation_id": data.get("correlation_id", ""),
-            "session_id": data.get("session_id", "unknown")
+            "start_time": datetime.fromtimestamp(data.start_time).isoformat(),
+            "response_time": datetime.fromtimestamp(response_time).isoformat() if response_time else 0,
+            "sources": data.sources,
+            "correlation_id": data.correlation_id or "",
+            "session_id": data.session_id or "unknown",
+            "stage_timings": self.get_stage_timings(data.correlation_id)
         }
 
     def _finalize_response(self, session_id: str) -> str:
         """组装最终响应"""
         buffer = self.session_manager.get_response_buffer(session_id)
-        return "".join(chunk.get("content", "") for chunk in buffer)
+        return "".join(buffer)
 
     def _save_response_to_session(self, session_id: str, response: str, thought: str, metadata: Dict):
         """保存响应到会话"""
@@ -349,30 +489,25 @@ class ProcessController:
             "metadata": metadata
         })
 
-    def handle_cancel_operation(self, data: Dict):
-        """按会话取消任务"""
-        target_session = data.get("session_id")
-    
-        remaining_tasks = set()
-        for task in self._active_tasks:
-            try:
-                # 获取任务关联的session_id
-                ctx = getattr(task, 'ctx', None)
-                if ctx and ctx.session_id == target_session:
-                    task.cancel()
-                else:
-                    remaining_tasks.add(task)
-            except:
-                remaining_tasks.add(task)
-    
-        self._active_tasks = remaining_tasks
-    def _publish_error(self, stage: str, message: str, context: Any = None):
-        """统一错误处理"""
+    def handle_cancel_operation(self, data: Dict = None):
+        """
+        取消请求：指定correlation_id时只取消该请求，否则取消会话（默认当前会话）的全部请求
+        取消会传播到检索、生成流与子进程
+        """
+        data = data or {}
+        correlation_id = data.get("correlation_id")
+        session_id = data.get("session_id") or (None if correlation_id else self.session_manager.get_current_session())
+        cancelled = self.task_registry.cancel(session_id=session_id, correlation_id=correlation_id)
+        logger.info(f"取消操作: session_id={session_id}, correlation_id={correlation_id}, 任务数={cancelled}")
+    def _publish_error(self, stage: str, message: str, context: Any = None, session_id: str = None):
+        """统一错误处理（指定session_id时前端只通知该会话的客户端）"""
         error_data = {
             "stage": stage,
             "message": message,
             "context": context if isinstance(context, (str, dict)) else str(context)  # 修改：增加对 context 类型的检查
         }
+        if session_id:
+            error_data["session_id"] = session_id
         logger.error(f"{stage} error: {message}")
         self.event_bus.publish(EventType.ERROR, error_data)
         
@@ -0,0 +1,113 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+from adapters.model.base_model_adapter import BaseModelAdapter
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class PromptBudget:
+    """提示词token预算配置"""
+    max_context_tokens: int = 8192      # 模型上下文窗口
+    reserve_output_tokens: int = 2048   # 为生成预留的token数
+    history_ratio: float = 0.3          # 可用预算中分配给历史消息的上限比例
+    min_knowledge_tokens: int = 64      # 知识条目压缩后的最少token数，低于此值直接丢弃
+    item_overhead_tokens: int = 16      # 每条知识在模板中的格式开销（来源/可信度等）
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any] = None) -> 'PromptBudget':
+        config = config or {}
+        return cls(**{k: v for k, v in config.items() if k in cls.__dataclass_fields__})
+
+
+class TokenBudgetPromptBuilder:
+    """
+    按token预算组装提示词
+    - 使用当前模型适配器的分词器计数
+    - 系统提示词与问题始终保留，剩余预算在历史与知识之间分配
+    - 历史从最近的消息开始保留；知识按 权重×相关性 从高到低保留，低优先级的条目先被压缩或丢弃
+    """
+
+    def __init__(self, model_adapter: BaseModelAdapter, budget: PromptBudget):
+        self.model_adapter = model_adapter
+        self.budget = budget
+
+    def build(
+            self,
+            system_prompt: str,
+            question: str,
+            knowledge: List[Dict],
+            history: List[Dict],
+            render_user_prompt: Callable[[str, List[Dict]], str]
+    ) -> Tuple[List[Dict], Dict[str, int]]:
+        """
+        :param render_user_prompt: 用户提示词渲染函数 (question, knowledge) -> str
+        :return: (消息列表, 各部分token统计)
+        """
+        count = self.model_adapter.count_tokens
+        system_tokens = count(system_prompt)
+        question_tokens = count(render_user_prompt(question, []))
+        available = self.budget.max_context_tokens - self.budget.reserve_output_tokens
+        remaining = max(available - system_tokens - question_tokens, 0)
+
+        history_messages, history_tokens = self._fit_history(history, int(remaining * self.budget.history_ratio))
+        kept_knowledge, dropped, compressed = self._fit_knowledge(knowledge, remaining - history_tokens)
+
+        user_prompt = render_user_prompt(question, kept_knowledge)
+        messages = [{"role": "system", "content": system_prompt}, *history_messages,
+                    {"role": "user", "content": user_prompt}]
+
+        user_tokens = count(user_prompt)
+        section_tokens = {
+            "system": system_tokens,
+            "history": history_tokens,
+            "knowledge": max(user_tokens - question_tokens, 0),
+            "question": question_tokens,
+            "total": system_tokens + history_tokens + user_tokens,
+            "budget": available,
+            "history_messages": len(history_messages),
+            "knowledge_items": len(kept_knowledge),
+            "knowledge_dropped": dropped,
+            "knowledge_compressed": compressed,
+        }
+        return messages, section_tokens
+
+    def _fit_history(self, history: List[Dict], budget: int) -> Tuple[List[Dict], int]:
+        """从最近的历史摘要开始保留，超出预算的更早消息被丢弃"""
+        kept, used = [], 0
+        for msg in reversed(history):
+            content = msg.get("summary", '')
+            tokens = self.model_adapter.count_tokens(content)
+            if used + tokens > budget:
+                break
+            kept.append({"role": msg.get("role"), "content": content})
+            used += tokens
+        kept.reverse()
+        return kept, used
+
+    def _fit_knowledge(self, knowledge: List[Dict], budget: int) -> Tuple[List[Dict], int, int]:
+        """按优先级装入知识条目，放不下时压缩，压缩后仍过短则丢弃"""
+        ranked = sorted(
+            knowledge,
+            key=lambda item: item.get('weight', 1.0) * item.get('score', 1.0),
+            reverse=True
+        )
+        kept, used, dropped, compressed = [], 0, 0, 0
+        for item in ranked:
+            content = item.get('content', '')
+            room = budget - used - self.budget.item_overhead_tokens
+            tokens = self.model_adapter.count_tokens(content)
+            if tokens <= room:
+                kept.append(item)
+            elif room >= self.budget.min_knowledge_tokens:
+                content = self.model_adapter.truncate_tokens(content, room)
+                tokens = self.model_adapter.count_tokens(content)
+                kept.append({**item, 'content': content + "…"})
+                compressed += 1
+            else:
+                dropped += 1
+                continue
+            used += tokens + self.budget.item_overhead_tokens
+        return kept, dropped, compressed
@@ -1,13 +1,16 @@
 
 import asyncio
-from datetime import datetime
-from typing import Dict, List, AsyncGenerator, Any
+import time
+from typing import Dict, List, AsyncGenerator, Any, Tuple
 
 from core.event_bus import EventBus
 from utils.logger import get_logger
-from core.events import EventType
+from core.events import EventType, ResponseChunk, GenerationStartEvent, GenerationCompleteEvent
 from utils.template_manager import TemplateManager
 from adapters.model.base_model_adapter import BaseModelAdapter
+from core.chunk_coalescer import CoalescingConfig, coalesce_chunks
+from core.prompt_builder import PromptBudget, TokenBudgetPromptBuilder
+from utils.tracing import record_span, span
 
 logger = get_logger(__name__)
 
@@ -17,16 +20,22 @@ class QAEngine:
             self,
             model_adapter: BaseModelAdapter,
             template_manager: TemplateManager,
-            event_bus: EventBus
+            event_bus: EventBus,
+            prompt_budget: Dict[str, Any] = None,
+            chunk_coalescing: Dict[str, Any] = None
     ):
         """
         问答引擎服务
         :param model_adapter: 模型适配器实例
         :param template_manager: 模板管理实例
+        :param prompt_budget: 提示词token预算配置（process_config.yaml中的prompt_budget段）
+        :param chunk_coalescing: 响应分片合并配置（当前前端的chunk_coalescing段）
         """
         self.model_adapter = model_adapter
         self.template_manager = template_manager
         self.event_bus = event_bus
+        self.prompt_builder = TokenBudgetPromptBuilder(model_adapter, PromptBudget.from_config(prompt_budget))
+        self.coalescing_config = CoalescingConfig.from_config(chunk_coalescing)
         required_templates = ['system_prompt.jinja', 'user_prompt.jinja']
         for tpl in required_templates:
             if not self.template_manager.template_exists(tpl):
@@ -35,12 +44,9 @@ class QAEngine:
 
     # 添加块处理方法
     @staticmethod
-    def _format_chunk(content: str) -> Dict[str, Any]:
+    def _format_chunk(content: str) -> ResponseChunk:
         """格式化响应块为标准结构"""
-        return {
-            "content": content,
-            "start_time": datetime.now().isoformat()
-        }
+        return ResponseChunk(content=content, start_time=time.time())
     
     async def generate_response(
             self,
@@ -50,95 +56,121 @@ class QAEngine:
             correlation_id: str,
             dialog_history: List[Dict],
             stream: bool = False
-    ) -> AsyncGenerator[Dict, None]:
+    ) -> AsyncGenerator[ResponseChunk, None]:
         """
         生成问答响应（支持流式）
         """
         logger.info(f"开始生成响应: session_id={session_id}, question={question}")  # 新增日志
-        start_time = datetime.now().isoformat()
-        sources = [item.get("source", "unknown") for item in knowledge]
+        start_time = time.time()
+        sources = list({item.get("source", "unknown") for item in knowledge})
+        model_name = self.model_adapter.config.get("model_name")
+        chat_generator = None
+        generated: List[str] = []
         try:
-            
-            self.event_bus.publish(EventType.GENERATION_START, {
-                "question": question,
-                "session_id": session_id,
-                "start_time": start_time,
-                "model_name": self.model_adapter.config.get("model_name"),
-                "sources": list(set(sources)),
-                "correlation_id" : correlation_id,
-            })
+            with span("prompt_render") as attrs:
+                messages, prompt_tokens = self._build_prompt_messages(question, knowledge,dialog_history)
+                attrs["prompt_tokens"] = prompt_tokens.get("total")
+            logger.info(f"提示词token统计: session_id={session_id}, {prompt_tokens}")
 
-            messages = self._build_prompt_messages(question, knowledge,dialog_history)
+            self.event_bus.publish(EventType.GENERATION_START, GenerationStartEvent(
+                question=question,
+                session_id=session_id,
+                start_time=start_time,
+                model_name=model_name,
+                correlation_id=correlation_id,
+                sources=sources,
+                prompt_tokens=prompt_tokens,
+            ))
 
             chat_generator = self.model_adapter.chat(
                 messages=messages,
-                stream=stream
+                stream=stream,
+                session_id=session_id
             )
+            # 合并逐token输出，减少下游过滤/加锁/事件分发次数（须在GENERATION_COMPLETE之前发送完）
+            if stream:
+                chat_generator = coalesce_chunks(chat_generator, self.coalescing_config)
+            request_at = first_at = time.time()
             async for raw_chunk in chat_generator:
+                if not generated:
+                    first_at = time.time()
+                    record_span("ttft", request_at, first_at)
+                generated.append(raw_chunk)
                 formatted_chunk = self._format_chunk(raw_chunk)
                 logger.debug(f"生成响应块: {formatted_chunk}")  # 新增日志
                 yield formatted_chunk
 
             logger.info(f"响应生成完成: session_id={session_id}")  # 新增日志
+            record_span("decode", first_at, time.time(), chunks=len(generated))
 
-            end_time = datetime.now().isoformat()
-            self.event_bus.publish(EventType.GENERATION_COMPLETE, {
-                "session_id": session_id,
-                "status": "success",
-                "start_time": start_time,
-                "model_name": self.model_adapter.config.get("model_name"),
-                "response_time": end_time,
-                "sources": list(set(sources)),
-                "correlation_id" : correlation_id,
-            })
+            self.event_bus.publish(EventType.GENERATION_COMPLETE, GenerationCompleteEvent(
+                session_id=session_id,
+                status="success",
+                start_time=start_time,
+                response_time=time.time(),
+                model_name=model_name,
+                correlation_id=correlation_id,
+                sources=sources,
+            ))
 
         except asyncio.CancelledError:
             logger.info("生成任务被取消")
+            self._record_reclaimed_tokens(generated)
 
-            end_time = datetime.now().isoformat()
-            self.event_bus.publish(EventType.GENERATION_COMPLETE, {
-                "session_id": session_id,
-                "status": "cancelled",
-                "start_time": start_time,
-                "model_name": self.model_adapter.config.get("model_name"),
-                "response_time": end_time,
-                "sources": list(set(sources)),
-                "correlation_id" : correlation_id,
-            })
+            self.event_bus.publish(EventType.GENERATION_COMPLETE, GenerationCompleteEvent(
+                session_id=session_id,
+                status="cancelled",
+                start_time=start_time,
+                response_time=time.time(),
+                model_name=model_name,
+                correlation_id=correlation_id,
+                sources=sources,
+            ))
+            raise  # 继续向上传播，调用方的流水线随之结束
         except Exception as e:
             logger.error(f"生成失败: {str(e)}")  # 新增日志
             self.event_bus.publish(EventType.ERROR, {
                 "stage": "response_generation",
                 "message": str(e),
+                "session_id": session_id
             })
-    def _build_prompt_messages(self, question: str, search_results: List[Dict],dialog_history: List[Dict]) -> List[Dict]:
+        finally:
+            # 立即关闭模型流（停止生成线程/断开HTTP流），不依赖垃圾回收
+            if chat_generator is not None:
+                await chat_generator.aclose()
+    def _record_reclaimed_tokens(self, generated: List[str]):
+        """取消时按剩余生成预算估算回收的解码token数"""
+        config = self.model_adapter.config
+        budget = config.get("generation", {}).get("max_new_tokens") or config.get("max_tokens") or 0
+        used = self.model_adapter.count_tokens("".join(generated))
+        reclaimed = max(budget - used, 0)
+        model_name = config.get("model_name") or "unknown"
+        self.event_bus.metrics.inc("generation_cancelled_total", model=model_name)
+        self.event_bus.metrics.inc("generation_reclaimed_tokens_total", reclaimed, model=model_name)
+        logger.info(f"生成取消: 已生成约{used} tokens, 回收约{reclaimed} tokens")
+
+    def _build_prompt_messages(self, question: str, search_results: List[Dict],dialog_history: List[Dict]) -> Tuple[List[Dict], Dict[str, int]]:
+        """构建提示词消息（按token预算裁剪历史与知识），返回消息列表及各部分token数"""
         try:
-            # 添加知识可信度提示
-            knowledge_with_credibility = [
-                f"[来源：{res.get('source','未知')} 可信度：{res.get('weight',1.0):.1f} 数据：{res.get('content','')}]"
-                for res in search_results
-            ]
-        
-            # 更新模板渲染逻辑
-            user_prompt = self.template_manager.render(
-                "user_prompt.jinja",
-                {
-                    "question": question,
-                    "knowledge": search_results  # 结构化知识
-                }
-            )
-            
-            """构建提示词消息"""
             system_prompt = self.template_manager.render("system_prompt.jinja",context={})
-            messages = [{"role": "system", "content": system_prompt}]
-
-            for msg in dialog_history[:-1]:
-                summary = msg.get("summary",'')
-                messages.append({"role": msg.get("role"), "content": summary})
-            messages.append({"role": "user", "content": user_prompt})
-            
-            return messages
-        
+
+            def render_user_prompt(q: str, knowledge: List[Dict]) -> str:
+                return self.template_manager.render(
+                    "user_prompt.jinja",
+                    {
+                        "question": q,
+                        "knowledge": knowledge  # 结构化知识
+                    }
+                )
+
+            return self.prompt_builder.build(
+                system_prompt=system_prompt,
+                question=question,
+                knowledge=search_results,
+                history=dialog_history,
+                render_user_prompt=render_user_prompt
+            )
+
         except Exception as e:
             logger.error(f"构建提示词时发生错误: {str(e)}")
-            raise e
\ No newline at end of file
+            raise e
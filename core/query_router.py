@@ -0,0 +1,219 @@
+import asyncio
+import math
+import re
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+from core.event_metrics import MetricsSink, NullMetricsSink
+from utils.logger import get_logger
+from utils.jsonl_writer import JsonlWriter
+
+logger = get_logger(__name__)
+
+
+class RouteAction(str, Enum):
+    RETRIEVE = "retrieve"  # 执行检索
+    REUSE = "reuse"        # 复用上一轮的知识（追问）
+    SKIP = "skip"          # 不检索（问候、通用命令问题）
+
+
+# 分类标签对应的检索动作（followup在没有上一轮知识时退化为检索）
+_LABEL_ACTIONS = {
+    "greeting": RouteAction.SKIP,
+    "shell": RouteAction.SKIP,
+    "followup": RouteAction.REUSE,
+    "knowledge": RouteAction.RETRIEVE,
+}
+
+_GREETING_PATTERN = re.compile(
+    r"^(hi|hello|hey|thanks|thank you|thx|ok|okay|bye|good (morning|afternoon|evening)|"
+    r"你好|您好|嗨|谢谢|多谢|好的|再见|早上好|下午好|晚上好)[\s!！.。,，~]*$",
+    re.IGNORECASE
+)
+_FOLLOWUP_PATTERN = re.compile(
+    r"^(explain (it )?more|more detail(s)?|go on|continue|elaborate|why\??|how so\??|example\??|"
+    r"give (me )?an example|what about .{0,30}|and (then|the) .{0,30}|"
+    r"继续|详细(一点|点|说说|解释)?|展开(说说)?|再(说|讲|解释)(一下|一遍)?|为什么|举个例子|还有呢|然后呢)[\s?？!！.。]*$",
+    re.IGNORECASE
+)
+_TERM_PATTERN = re.compile(r"[A-Za-z0-9_]+|[一-鿿]")
+
+
+@dataclass
+class RouterConfig:
+    """提问路由配置"""
+    enabled: bool = True
+    use_embeddings: bool = True         # 规则未命中时使用嵌入最近质心分类
+    embedding_skip: bool = False        # 嵌入分类为问候/命令时是否跳过检索（质心只来自少量示例，默认只有规则能跳过）
+    min_similarity: float = 0.75        # 与最近质心的相似度低于该值时按默认检索处理
+    min_margin: float = 0.1             # 最近与次近质心相似度之差低于该值视为不确定
+    min_top_k: int = 2
+    max_top_k: int = 8
+    long_query_terms: int = 40          # 达到该词数（中文按字计）的提问使用max_top_k
+    decision_log: str = ""              # 路由决策JSONL文件（为空时只写日志），可按correlation_id与回答质量关联
+    examples: Dict[str, List[str]] = field(default_factory=lambda: {
+        "greeting": ["hello", "thanks a lot", "你好", "谢谢你的帮助"],
+        "followup": ["can you explain that in more detail", "what do you mean by that",
+                     "刚才说的能再详细一点吗", "上面那个例子再解释一下"],
+        "shell": ["how do I list files in a directory", "how to kill a process by port",
+                  "怎么查看磁盘占用", "linux下如何解压tar.gz文件"],
+        "knowledge": ["how does the retrieval service rank results", "where is the config for the model loaded",
+                      "这个项目的事件总线是怎么实现的", "会话管理器如何保存历史"],
+    })
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any] = None) -> 'RouterConfig':
+        config = config or {}
+        return cls(**{k: v for k, v in config.items() if k in cls.__dataclass_fields__})
+
+
+@dataclass
+class RouteDecision:
+    action: RouteAction
+    label: str
+    top_k: int
+    source: str               # "rule" / "embedding" / "default"
+    confidence: float = 1.0
+    query_vector: Optional[List[float]] = None  # 分类时计算的提问向量，检索时复用
+
+
+class QueryRouter:
+    """
+    检索前的提问路由：决定是否检索以及检索条数
+    - 先走规则（问候、短追问），命中即返回，开销为几次正则匹配
+    - 规则未命中时用嵌入模型计算与各类示例质心的余弦相似度（最近质心分类），不确定时默认检索；
+      嵌入分类默认不会跳过检索，误判为闲聊的知识问题代价远高于一次多余的检索
+    - 检索条数随提问长度在[min_top_k, max_top_k]之间自适应
+    - 每次决策写日志与指标，用于对比节省的检索次数与回答质量
+    """
+
+    def __init__(self, config: RouterConfig,
+                 embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 metrics: MetricsSink = None):
+        """
+        :param embed: 批量文本向量化函数（同步调用，在线程池中执行）；为None时只使用规则。
+                      应与检索时的查询向量化方式一致，提问向量随决策返回供检索复用
+        """
+        self.config = config
+        self.embed = embed if config.use_embeddings else None
+        self.metrics = metrics or NullMetricsSink()
+        self._centroids: Optional[Dict[str, List[float]]] = None
+        self._centroid_lock = asyncio.Lock()
+        self._decision_log = JsonlWriter(config.decision_log, name="route-decision-log") if config.decision_log else None
+        self._counts: Dict[str, int] = {action.value: 0 for action in RouteAction}
+
+    async def route(self, question: str, has_previous_knowledge: bool = False) -> RouteDecision:
+        """对提问分类并给出检索决策"""
+        if not self.config.enabled:
+            return RouteDecision(RouteAction.RETRIEVE, "knowledge", self.config.max_top_k, "default")
+
+        label, source, confidence = self._match_rules(question)
+        query_vector = None
+        if label is None and self.embed:
+            label, confidence, query_vector = await self._classify(question)
+            source = "embedding"
+        if label is None:
+            label, source = "knowledge", "default"
+
+        action = _LABEL_ACTIONS.get(label, RouteAction.RETRIEVE)
+        if action is RouteAction.REUSE and not has_previous_knowledge:
+            action = RouteAction.RETRIEVE
+        if action is RouteAction.SKIP and source == "embedding" and not self.config.embedding_skip:
+            action = RouteAction.RETRIEVE
+        top_k = self._adaptive_top_k(question) if action is RouteAction.RETRIEVE else 0
+        return RouteDecision(action, label, top_k, source, round(confidence, 4),
+                             query_vector if action is RouteAction.RETRIEVE else None)
+
+    def record(self, decision: RouteDecision, session_id: str, correlation_id: str, question: str):
+        """记录路由决策"""
+        self._counts[decision.action.value] += 1
+        self.metrics.inc("query_route_total", label=decision.label, action=decision.action.value,
+                         source=decision.source)
+        logger.info(f"提问路由: correlation_id={correlation_id}, label={decision.label}, "
+                    f"action={decision.action.value}, top_k={decision.top_k}, source={decision.source}, "
+                    f"confidence={decision.confidence}")
+        if self._decision_log:
+            self._decision_log.write({
+                "time": time.time(),
+                "session_id": session_id,
+                "correlation_id": correlation_id,
+                "question": question,
+                "label": decision.label,
+                "action": decision.action.value,
+                "top_k": decision.top_k,
+                "source": decision.source,
+                "confidence": decision.confidence,
+            })
+
+    def _match_rules(self, question: str):
+        text = question.strip()
+        if _GREETING_PATTERN.match(text):
+            return "greeting", "rule", 1.0
+        if _FOLLOWUP_PATTERN.match(text):
+            return "followup", "rule", 1.0
+        return None, None, 0.0
+
+    async def _classify(self, question: str):
+        """
+        最近质心分类：返回(类别, 相似度, 提问原始向量)
+        相似度不足或与次近类别区分度不够时类别为None
+        """
+        try:
+            centroids = await self._get_centroids()
+            raw_vector = (await asyncio.to_thread(self.embed, [question]))[0]
+        except Exception as e:
+            logger.warning(f"提问向量化失败，按默认检索处理: {str(e)}")
+            return None, 0.0, None
+
+        vector = _normalize(raw_vector)
+        scores = sorted(((_dot(vector, c), label) for label, c in centroids.items()), reverse=True)
+        best, label = scores[0]
+        margin = best - scores[1][0] if len(scores) > 1 else best
+        if best < self.config.min_similarity or margin < self.config.min_margin:
+            return None, best, raw_vector
+        return label, best, raw_vector
+
+    async def _get_centroids(self) -> Dict[str, List[float]]:
+        """首次使用时对示例向量化并计算各类质心"""
+        if self._centroids is not None:
+            return self._centroids
+        async with self._centroid_lock:
+            if self._centroids is None:
+                labels = [label for label, texts in self.config.examples.items() for _ in texts]
+                texts = [text for texts in self.config.examples.values() for text in texts]
+                vectors = await asyncio.to_thread(self.embed, texts)
+                grouped: Dict[str, List[List[float]]] = {}
+                for label, vector in zip(labels, vectors):
+                    grouped.setdefault(label, []).append(_normalize(vector))
+                self._centroids = {
+                    label: _normalize([sum(values) / len(group) for values in zip(*group)])
+                    for label, group in grouped.items()
+                }
+        return self._centroids
+
+    def _adaptive_top_k(self, question: str) -> int:
+        """提问越长（信息需求越多）检索条数越多"""
+        terms = len(_TERM_PATTERN.findall(question))
+        ratio = min(1.0, terms / self.config.long_query_terms)
+        return self.config.min_top_k + round((self.config.max_top_k - self.config.min_top_k) * ratio)
+
+    def close(self):
+        if self._decision_log:
+            self._decision_log.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "decisions": dict(self._counts),
+            "centroids_ready": self._centroids is not None,
+        }
+
+
+def _dot(a: List[float], b: List[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(_dot(vector, vector)) or 1.0
+    return [x / norm for x in vector]
@@ -0,0 +1,229 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Dict, Iterator, Optional
+
+from core.event_bus import EventBus
+from core.events import EventType, StatusUpdateEvent
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class RequestPriority(str, Enum):
+    INTERACTIVE = "interactive"  # 用户交互提问
+    BATCH = "batch"              # 批量/后台任务
+
+
+class SchedulerRejected(Exception):
+    """队列已满，请求被拒绝（负载削减）"""
+    pass
+
+
+@dataclass
+class SchedulerConfig:
+    """请求调度配置"""
+    max_concurrent: int = 5           # 同时执行的请求数
+    max_queue_depth: int = 32         # 所有会话排队请求总数上限
+    max_session_queue_depth: int = 4  # 单个会话排队请求数上限
+    class_weights: Dict[str, int] = field(default_factory=lambda: {
+        RequestPriority.INTERACTIVE.value: 4,
+        RequestPriority.BATCH.value: 1,
+    })
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any] = None) -> 'SchedulerConfig':
+        config = config or {}
+        return cls(**{k: v for k, v in config.items() if k in cls.__dataclass_fields__})
+
+
+@dataclass
+class _Ticket:
+    session_id: str
+    priority: RequestPriority
+    enqueued_at: float
+    future: asyncio.Future
+    position: int = 0
+
+
+class FairRequestScheduler:
+    """
+    按会话公平调度的请求准入控制
+    - 每个会话一个队列，同一优先级内各会话轮询出队，单个会话无法挤占其他会话
+    - 优先级之间按权重平滑加权轮询，批量任务不会被完全饿死
+    - 超出队列上限时立即拒绝，排队中的请求通过STATUS_UPDATE获知当前位置
+    - 会话开始执行时发布processing，其请求全部结束后发布idle
+    - 必须在同一个事件循环中使用
+    """
+
+    def __init__(self, config: SchedulerConfig, event_bus: Optional[EventBus] = None):
+        self.config = config
+        self.event_bus = event_bus
+        self.metrics = event_bus.metrics if event_bus else None
+        self._queues: Dict[RequestPriority, "OrderedDict[str, deque]"] = {p: OrderedDict() for p in RequestPriority}
+        self._current_weights: Dict[RequestPriority, int] = {p: 0 for p in RequestPriority}
+        self._queued = 0
+        self._running = 0
+        self._session_running: Dict[str, int] = {}  # 各会话正在执行的请求数
+
+    @asynccontextmanager
+    async def slot(self, session_id: str, priority: RequestPriority = RequestPriority.INTERACTIVE):
+        """获取执行名额，退出时释放并记录服务时间"""
+        await self.acquire(session_id, priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._observe("scheduler_service_seconds", time.perf_counter() - start, priority)
+            self._release(session_id)
+
+    async def acquire(self, session_id: str, priority: RequestPriority = RequestPriority.INTERACTIVE):
+        """排队等待执行名额；队列已满时抛出SchedulerRejected"""
+        session_queue = self._queues[priority].get(session_id)
+        session_depth = sum(len(q.get(session_id, ())) for q in self._queues.values())
+        if self._queued >= self.config.max_queue_depth or session_depth >= self.config.max_session_queue_depth:
+            reason = "session_queue_full" if session_depth >= self.config.max_session_queue_depth else "queue_full"
+            self._inc("scheduler_rejected_total", priority, reason=reason)
+            raise SchedulerRejected(f"请求过多，请稍后再试（{reason}）")
+
+        ticket = _Ticket(session_id, priority, time.perf_counter(), asyncio.get_running_loop().create_future())
+        if session_queue is None:
+            session_queue = self._queues[priority][session_id] = deque()
+        session_queue.append(ticket)
+        self._queued += 1
+        self._dispatch()
+
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # 已获得名额后才被取消，归还名额
+                self._release(session_id)
+            else:
+                self._remove(ticket)
+                self._dispatch()
+                self._publish_idle(session_id)
+            raise
+        self._observe("scheduler_wait_seconds", time.perf_counter() - ticket.enqueued_at, priority)
+
+    def _dispatch(self):
+        """有空闲名额时按公平顺序出队，并更新其余请求的排队位置"""
+        while self._running < self.config.max_concurrent and self._queued:
+            ticket = self._pop_next()
+            if ticket.future.done():
+                continue  # 等待中被取消，其取消处理尚未运行，名额交给下一个请求
+            ticket.future.set_result(None)
+            self._running += 1
+            self._session_running[ticket.session_id] = self._session_running.get(ticket.session_id, 0) + 1
+            self._publish_state("processing", ticket.session_id)
+        self._publish_positions()
+        if self.metrics:
+            for priority, sessions in self._queues.items():
+                self.metrics.set_gauge("scheduler_queue_depth", sum(len(q) for q in sessions.values()),
+                                       priority=priority.value)
+            self.metrics.set_gauge("scheduler_running", self._running)
+
+    def _release(self, session_id: str):
+        """归还名额并调度下一个请求"""
+        self._running -= 1
+        remaining = self._session_running.get(session_id, 0) - 1
+        if remaining > 0:
+            self._session_running[session_id] = remaining
+        else:
+            self._session_running.pop(session_id, None)
+            for ticket in self._session_tickets(session_id):
+                ticket.position = 0  # 会话回到排队状态，重新发布其排队位置
+        self._dispatch()
+        self._publish_idle(session_id)
+
+    def _session_tickets(self, session_id: str) -> Iterator[_Ticket]:
+        for sessions in self._queues.values():
+            yield from sessions.get(session_id, ())
+
+    def _pop_next(self) -> _Ticket:
+        priority = self._next_priority(self._current_weights, self._queues)
+        sessions = self._queues[priority]
+        session_id, session_queue = next(iter(sessions.items()))
+        ticket = session_queue.popleft()
+        if session_queue:
+            sessions.move_to_end(session_id)  # 轮询：该会话排到本优先级队尾
+        else:
+            del sessions[session_id]
+        self._queued -= 1
+        return ticket
+
+    def _next_priority(self, current_weights: Dict[RequestPriority, int],
+                       queues: Dict[RequestPriority, Dict[str, deque]]) -> RequestPriority:
+        """平滑加权轮询选择下一个出队的优先级"""
+        eligible = [p for p in RequestPriority if queues[p]]
+        total = 0
+        for p in eligible:
+            weight = self.config.class_weights.get(p.value, 1)
+            current_weights[p] += weight
+            total += weight
+        chosen = max(eligible, key=lambda p: current_weights[p])
+        current_weights[chosen] -= total
+        return chosen
+
+    def _dispatch_order(self) -> Iterator[_Ticket]:
+        """在副本上模拟出队顺序，用于计算排队位置"""
+        queues = {p: OrderedDict((s, deque(q)) for s, q in sessions.items()) for p, sessions in self._queues.items()}
+        current_weights = dict(self._current_weights)
+        while any(queues.values()):
+            priority = self._next_priority(current_weights, queues)
+            sessions = queues[priority]
+            session_id, session_queue = next(iter(sessions.items()))
+            yield session_queue.popleft()
+            if session_queue:
+                sessions.move_to_end(session_id)
+            else:
+                del sessions[session_id]
+
+    def _publish_positions(self):
+        if not self.event_bus or not self._queued:
+            return
+        for position, ticket in enumerate(self._dispatch_order(), start=1):
+            if ticket.position != position:
+                ticket.position = position
+                self._publish_state("queued", ticket.session_id, position)
+
+    def _publish_idle(self, session_id: str):
+        """会话没有执行中或排队中的请求时发布idle"""
+        if session_id not in self._session_running and next(self._session_tickets(session_id), None) is None:
+            self._publish_state("idle", session_id)
+
+    def _publish_state(self, state: str, session_id: str, queue_position: int = 0):
+        if self.event_bus:
+            self.event_bus.publish(EventType.STATUS_UPDATE, StatusUpdateEvent(
+                state=state,
+                session_id=session_id,
+                queue_position=queue_position
+            ))
+
+    def _remove(self, ticket: _Ticket):
+        sessions = self._queues[ticket.priority]
+        session_queue = sessions.get(ticket.session_id)
+        if session_queue and ticket in session_queue:
+            session_queue.remove(ticket)
+            self._queued -= 1
+            if not session_queue:
+                del sessions[ticket.session_id]
+
+    def _observe(self, name: str, seconds: float, priority: RequestPriority):
+        if self.metrics:
+            self.metrics.observe(name, seconds, priority=priority.value)
+
+    def _inc(self, name: str, priority: RequestPriority, **labels):
+        if self.metrics:
+            self.metrics.inc(name, priority=priority.value, **labels)
+
+    def stats(self) -> Dict[str, Any]:
+        """调度状态快照"""
+        return {
+            "running": self._running,
+            "queued": {p.value: sum(len(q) for q in sessions.values()) for p, sessions in self._queues.items()},
+            "sessions_waiting": sorted({s for sessions in self._queues.values() for s in sessions}),
+        }
@@ -0,0 +1,141 @@
+import asyncio
+import difflib
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class PrefetchConfig:
+    """输入过程中的检索预取配置"""
+    enabled: bool = False
+    min_chars: int = 6                  # 草稿少于该长度不预取
+    similarity: float = 0.9             # 最终提问与草稿相似度达到该值时复用结果
+    max_inflight_per_session: int = 2   # 单个会话同时进行的预取数，超出时取消最旧的
+    ttl_seconds: float = 30             # 预取结果的有效期
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any] = None) -> 'PrefetchConfig':
+        config = config or {}
+        return cls(**{k: v for k, v in config.items() if k in cls.__dataclass_fields__})
+
+
+@dataclass
+class _Prefetch:
+    text: str
+    task: asyncio.Task
+    created_at: float
+
+
+class RetrievalPrefetcher:
+    """
+    根据输入框草稿(DRAFT_INPUT)在后台提前执行检索
+    - 草稿变化时发起新的预取，超过会话并发上限时取消最旧（已过时）的预取
+    - 提交提问时取与问题足够相似的最新预取：已完成直接复用，进行中则等待其完成
+    - 未命中的预取随即取消，不占用检索资源
+    - 超过有效期的预取在下次提交草稿时清理（草稿后从未提问的会话不会一直占用内存）
+    - 所有方法须在同一事件循环中调用
+    """
+
+    def __init__(self, search: Callable[[str], Awaitable[List[Dict]]], config: PrefetchConfig):
+        """
+        :param search: 检索函数（与正式检索使用相同参数，保证结果可直接复用）
+        """
+        self.search = search
+        self.config = config
+        self._prefetches: Dict[str, List[_Prefetch]] = {}
+        self._hits = 0
+        self._misses = 0
+        self._cancelled = 0
+
+    def submit(self, session_id: str, text: str):
+        """按草稿发起预取"""
+        text = text.strip()
+        if len(text) < self.config.min_chars:
+            return
+        self._prune(time.monotonic())
+        pending = self._prefetches.setdefault(session_id, [])
+        if pending and pending[-1].text == text:
+            return
+        task = asyncio.create_task(self.search(text))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # 未被复用的失败预取不告警
+        pending.append(_Prefetch(text, task, time.monotonic()))
+        while len(pending) > self.config.max_inflight_per_session:
+            self._cancel(pending.pop(0))
+
+    async def take(self, session_id: str, question: str) -> Optional[List[Dict]]:
+        """
+        取出可复用的预取结果，并清空该会话的其它预取
+        :return: 检索结果；没有可复用的预取时返回None
+        """
+        pending = self._prefetches.pop(session_id, [])
+        question = question.strip()
+        now = time.monotonic()
+        match = None
+        for prefetch in reversed(pending):
+            if match is None and now - prefetch.created_at <= self.config.ttl_seconds \
+                    and self._similar(prefetch.text, question):
+                match = prefetch
+            else:
+                self._cancel(prefetch)
+
+        if match is None:
+            self._misses += 1
+            return None
+        try:
+            results = await match.task
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise  # 调用方被取消（取消会一并传递给预取任务）
+            results = None
+        except Exception as e:
+            logger.warning(f"检索预取失败，改为正式检索: {str(e)}")
+            results = None
+        if results is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        logger.info(f"复用检索预取结果: session_id={session_id}, 草稿='{match.text}'")
+        return results
+
+    def discard(self, session_id: str):
+        """本轮不需要检索时取消该会话的全部预取"""
+        for prefetch in self._prefetches.pop(session_id, []):
+            self._cancel(prefetch)
+
+    def _prune(self, now: float):
+        """清理所有会话中已过期的预取（过期结果不会再被复用）"""
+        for session_id, pending in list(self._prefetches.items()):
+            fresh = [p for p in pending if now - p.created_at <= self.config.ttl_seconds]
+            if len(fresh) == len(pending):
+                continue
+            for prefetch in pending:
+                if prefetch not in fresh:
+                    self._cancel(prefetch)
+            if fresh:
+                self._prefetches[session_id] = fresh
+            else:
+                del self._prefetches[session_id]
+
+    def _similar(self, draft: str, question: str) -> bool:
+        if draft == question:
+            return True
+        return difflib.SequenceMatcher(None, draft, question).ratio() >= self.config.similarity
+
+    def _cancel(self, prefetch: _Prefetch):
+        if not prefetch.task.done():
+            prefetch.task.cancel()
+            self._cancelled += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._prefetches),
+            "inflight": sum(1 for group in self._prefetches.values() for p in group if not p.task.done()),
+            "hits": self._hits,
+            "misses": self._misses,
+            "cancelled": self._cancelled,
+        }
@@ -1,9 +1,11 @@
 # core/retrieval_service.py
-from typing import List, Dict
+import asyncio
+from typing import List, Dict, Optional
 from adapters.vectordb.base_vector_db import BaseVectorDBAdapter
 from utils.config_loader import ConfigLoader
 from utils.logger import get_logger
 from core.ranker_factory import RankerFactory
+from utils.tracing import span
 
 logger = get_logger(__name__)
 
@@ -18,17 +20,29 @@ class RetrievalService:
         self.vectordb = vectordb_adapter
         self.strategy = ConfigLoader.load_yaml("retrieval_strategy.yaml")
 
-    async def hybrid_search(self, query: str, top_k: int = 5) -> List[Dict]:
-        
-        # 构建检索请求
-        requests = self._build_search_requests(query, top_k)
+    async def hybrid_search(self, query: str, top_k: int = 5, query_vector: Optional[List[float]] = None) -> List[Dict]:
+        """
+        :param query_vector: 已由embed_queries计算好的查询向量（如提问路由时），为None时在此向量化
+        """
+        # 构建检索请求（查询向量化为CPU密集操作，在线程池中执行）
+        with span("build_search_requests"):
+            requests = await asyncio.to_thread(self._build_search_requests, query, top_k, query_vector)
         # 根据fusion定义的信息动态选择排序器
         fusion = self.strategy.get('fusion', {})
         reranker = RankerFactory.create_ranker(fusion.get('reranker', ""))
-        # 执行检索
-        raw_results = await self.vectordb.async_search(requests,top_k,reranker(fusion.get('weights', {}).get("percent",60)))
-        return self._process_results(raw_results)
+        # 执行检索（向量库客户端为同步调用，避免阻塞事件循环；融合重排在混合检索内完成）
+        with span("search_and_rerank", reranker=fusion.get('reranker', ""), top_k=top_k):
+            raw_results = await asyncio.to_thread(
+                self.vectordb.search, requests, top_k, reranker(fusion.get('weights', {}).get("percent", 60))
+            )
+        with span("process_results"):
+            return self._process_results(raw_results)
     
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """使用知识库的嵌入模型按查询方式向量化（同步调用），结果可直接传给hybrid_search复用"""
+        embeddings = self.vectordb.text_processor.embeddings
+        return [embeddings.embed_query(text) for text in texts]
+
     def _process_results(self, raw_results: list) -> List[Dict]:
         """结果标准化处理"""
         processed = []
@@ -47,12 +61,12 @@ class RetrievalService:
         
         return sorted(processed, key=lambda x: x["score"], reverse=True)
     
-    def _build_search_requests(self, query: str, top_k: int) -> List[any]:
+    def _build_search_requests(self, query: str, top_k: int, query_vector: Optional[List[float]] = None) -> List[any]:
         """构建混合检索请求集合"""
         # 获取预处理后的查询向量
         return [
             # 稠密向量检索
-            self.vectordb.create_dense_search_request(query, top_k),
+            self.vectordb.create_dense_search_request(query, top_k, query_vector),
             self.vectordb.create_sparse_search_request(query, top_k)
         ]
 
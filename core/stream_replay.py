@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class ReplayConfig:
+    """流式输出重放缓冲配置"""
+    enabled: bool = True
+    max_bytes: int = 4 * 1024 * 1024   # 所有流缓冲内容的总上限
+    max_age_seconds: float = 600       # 流最后一次更新超过该时间后淘汰
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any] = None) -> 'ReplayConfig':
+        config = config or {}
+        return cls(**{k: v for k, v in config.items() if k in cls.__dataclass_fields__})
+
+
+@dataclass
+class _Stream:
+    frames: List[Dict[str, Any]] = field(default_factory=list)  # [{"seq", "type", "content"}]
+    last_seq: int = 0
+    nbytes: int = 0
+    updated_at: float = field(default_factory=time.monotonic)
+    finished: bool = False
+
+
+class StreamReplayBuffer:
+    """
+    按correlation_id缓存最近的流式输出帧，供断线重连的客户端续传
+    - 每帧分配递增序号，客户端重连时携带最后确认的序号，只重放其后的帧
+    - 内存按总字节数与流的空闲时间双重限制，超限时淘汰最久未更新的流
+    - 流结束后压缩：相邻同类型帧合并，整个流只保留一个快照帧
+    """
+
+    def __init__(self, config: ReplayConfig):
+        self.config = config
+        self._streams: "OrderedDict[str, _Stream]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._evictions = 0
+        self._replays = 0
+
+    def append(self, correlation_id: str, content_type: str, content: str) -> int:
+        """追加一帧，返回其序号"""
+        nbytes = len(content.encode("utf-8"))
+        with self._lock:
+            stream = self._streams.get(correlation_id)
+            if stream is None:
+                stream = self._streams[correlation_id] = _Stream()
+            else:
+                self._streams.move_to_end(correlation_id)
+            stream.last_seq += 1
+            stream.frames.append({"seq": stream.last_seq, "type": content_type, "content": content})
+            stream.nbytes += nbytes
+            stream.updated_at = time.monotonic()
+            self._total_bytes += nbytes
+            self._evict()
+            return stream.last_seq
+
+    def finish(self, correlation_id: str):
+        """流结束：将所有帧压缩为一个快照帧"""
+        with self._lock:
+            stream = self._streams.get(correlation_id)
+            if stream is None or stream.finished:
+                return
+            segments: List[Dict[str, str]] = []
+            for frame in stream.frames:
+                if segments and segments[-1]["type"] == frame["type"]:
+                    segments[-1]["content"] += frame["content"]
+                else:
+                    segments.append({"type": frame["type"], "content": frame["content"]})
+            stream.frames = [{"seq": stream.last_seq, "type": "snapshot", "segments": segments}]
+            stream.finished = True
+            stream.updated_at = time.monotonic()
+
+    def replay(self, correlation_id: str, last_seq: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """
+        获取序号大于last_seq的帧
+        :return: 帧列表（已压缩的流返回单个快照帧，客户端应整体替换该条回复）；流已被淘汰时返回None
+        """
+        with self._lock:
+            self._evict()
+            stream = self._streams.get(correlation_id)
+            if stream is None:
+                return None
+            self._replays += 1
+            if last_seq >= stream.last_seq:
+                return []
+            if stream.finished:
+                return list(stream.frames)
+            return [f for f in stream.frames if f["seq"] > last_seq]
+
+    def _evict(self):
+        """淘汰空闲超时的流，以及超出字节上限时最久未更新的流；最近更新的流始终保留（需持有锁）"""
+        now = time.monotonic()
+        while self._streams:
+            correlation_id, stream = next(iter(self._streams.items()))
+            expired = now - stream.updated_at > self.config.max_age_seconds
+            over_budget = self._total_bytes > self.config.max_bytes and len(self._streams) > 1
+            if not (expired or over_budget):
+                break
+            self._streams.popitem(last=False)
+            self._total_bytes -= stream.nbytes
+            self._evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """缓冲指标快照"""
+        with self._lock:
+            return {
+                "streams": len(self._streams),
+                "memory_bytes": self._total_bytes,
+                "evictions": self._evictions,
+                "replays": self._replays,
+            }
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from core.event_metrics import MetricsSink, NullMetricsSink
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class RegisteredTask:
+    session_id: str
+    correlation_id: str
+    task: asyncio.Task
+    kind: str                 # "qa" / "command"
+    started_at: float
+    cancel_requested_at: Optional[float] = None
+
+
+class TaskRegistry:
+    """
+    进行中请求的任务登记表（按会话与correlation_id索引）
+    - 取消请求可来自任意线程，实际取消调度到任务所在的事件循环执行
+    - 取消沿await链向下传播：检索、生成流、子进程在各自的CancelledError处理中释放资源
+    - 记录被取消任务已消耗的时间与取消生效延迟，用于评估回收的计算资源
+    """
+
+    def __init__(self, metrics: MetricsSink = None):
+        self.metrics = metrics or NullMetricsSink()
+        self._tasks: Dict[str, RegisteredTask] = {}  # {correlation_id: RegisteredTask}
+        self._lock = threading.Lock()
+        self._cancelled = 0
+
+    def register(self, session_id: str, correlation_id: str, task: asyncio.Task, kind: str = "qa") -> RegisteredTask:
+        """登记任务，任务结束时自动移除"""
+        entry = RegisteredTask(session_id, correlation_id, task, kind, time.perf_counter())
+        with self._lock:
+            self._tasks[correlation_id] = entry
+        task.add_done_callback(lambda _: self._on_done(entry))
+        return entry
+
+    def cancel(self, session_id: Optional[str] = None, correlation_id: Optional[str] = None) -> int:
+        """
+        取消匹配的任务（两个条件都未指定时取消全部）
+        :return: 被请求取消的任务数
+        """
+        with self._lock:
+            targets = [
+                entry for entry in self._tasks.values()
+                if (correlation_id is None or entry.correlation_id == correlation_id)
+                and (session_id is None or entry.session_id == session_id)
+                and entry.cancel_requested_at is None
+            ]
+            now = time.perf_counter()
+            for entry in targets:
+                entry.cancel_requested_at = now
+
+        for entry in targets:
+            # asyncio.Task.cancel不是线程安全的
+            entry.task.get_loop().call_soon_threadsafe(entry.task.cancel)
+            logger.info(f"取消任务: session_id={entry.session_id}, correlation_id={entry.correlation_id}, "
+                        f"kind={entry.kind}")
+        return len(targets)
+
+    def active(self, session_id: Optional[str] = None) -> List[RegisteredTask]:
+        """进行中的任务"""
+        with self._lock:
+            return [e for e in self._tasks.values() if session_id is None or e.session_id == session_id]
+
+    def _on_done(self, entry: RegisteredTask):
+        with self._lock:
+            if self._tasks.get(entry.correlation_id) is entry:
+                del self._tasks[entry.correlation_id]
+        if entry.cancel_requested_at is None:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            self._cancelled += 1
+        self.metrics.inc("tasks_cancelled_total", kind=entry.kind)
+        # 取消前已消耗的时间（被丢弃的计算）与取消生效耗时（资源释放是否及时）
+        self.metrics.observe("cancelled_task_runtime_seconds", entry.cancel_requested_at - entry.started_at,
+                             kind=entry.kind)
+        self.metrics.observe("cancel_latency_seconds", now - entry.cancel_requested_at, kind=entry.kind)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"active": len(self._tasks), "cancelled": self._cancelled}
@@ -1,6 +1,7 @@
 import asyncio
 import os
 
+from adapters.model.model_residency import ModelResidencyManager
 from core.event_bus import EventBus
 from core.process_controller import ProcessController
 from core.retrieval_service import RetrievalService
@@ -10,6 +11,7 @@ from core.qa_engine import QAEngine
 from utils.config_loader import ModelConfig, ProcessConfig, DBConfig
 from utils.template_manager import TemplateManager
 from utils.logger import get_logger
+from utils.tracing import configure_tracing, tracer
 
 logger = get_logger(__name__)
 
@@ -26,8 +28,9 @@ def launch_gui():
 
     # 初始化核心组件
     logger.info("初始化核心组件...")
-    event_bus = EventBus()
-    session_manager = SessionManager(config)
+    configure_tracing(process_config.get("tracing", {}))
+    event_bus = EventBus.from_config(process_config.get("event_bus", {}))
+    session_manager = SessionManager(config, metrics=event_bus.metrics)
     command_processor = CommandProcessor()
     template_manager = TemplateManager()  # 初始化模板管理器
     logger.info("核心组件初始化成功。")
@@ -43,7 +46,11 @@ def launch_gui():
     module_path, class_name = model_adapter_path.rsplit(".", 1)
     module = __import__(module_path, fromlist=[class_name])
     ModelAdapterClass = getattr(module, class_name)
-    model_adapter = ModelAdapterClass(enabled_model, event_bus)
+    if enabled_model.get("residency", {}).get("enabled", False):
+        # 由驻留管理器负责懒加载/预热/空闲卸载，避免在界面出现前阻塞加载模型
+        model_adapter = ModelResidencyManager(ModelAdapterClass, enabled_model, event_bus)
+    else:
+        model_adapter = ModelAdapterClass(enabled_model, event_bus)
     logger.info(f"已选择并初始化模型适配器 {model_adapter_path}。")
 
     # 根据配置选择向量数据库适配器
@@ -65,12 +72,28 @@ def launch_gui():
     retrieval_service = RetrievalService(db_adapter)
     logger.info("检索服务初始化成功。")
 
+    # 动态加载前端类
+    logger.info("加载前端类...")
+    frontend_config = config.get("frontend_providers", {})
+    enabled_frontends = [v for k, v in frontend_config.items() if v.get("enabled")]
+    if not enabled_frontends:
+        logger.error("配置中未找到启用的前端提供者")
+        raise RuntimeError("No enabled frontend provider in config")
+    adapter = enabled_frontends[0]
+    # 动态导入前端类
+    module_path, class_name = adapter['adapter'].rsplit(".", 1)
+    module = __import__(module_path, fromlist=[class_name])
+    FrontendClass = getattr(module, class_name)  # 动态获取类
+    logger.info(f"前端类 {adapter['adapter']} 加载成功。")
+
     # 初始化问答引擎
     logger.info("初始化问答引擎...")
     qa_engine = QAEngine(
         model_adapter=model_adapter,
         template_manager=template_manager,
-        event_bus=event_bus)
+        event_bus=event_bus,
+        prompt_budget=process_config.get("prompt_budget", {}),
+        chunk_coalescing=adapter.get("chunk_coalescing", {}))
     logger.info("问答引擎初始化成功。")
     
     # 创建流程控制器
@@ -85,20 +108,6 @@ def launch_gui():
     )
     logger.info("流程控制器创建成功。")
 
-    # 动态加载前端类
-    logger.info("加载前端类...")
-    frontend_config = config.get("frontend_providers", {})
-    enabled_frontends = [v for k, v in frontend_config.items() if v.get("enabled")]
-    if not enabled_frontends:
-        logger.error("配置中未找到启用的前端提供者")
-        raise RuntimeError("No enabled frontend provider in config")
-    adapter = enabled_frontends[0]
-    # 动态导入前端类
-    module_path, class_name = adapter['adapter'].rsplit(".", 1)
-    module = __import__(module_path, fromlist=[class_name])
-    FrontendClass = getattr(module, class_name)  # 动态获取类
-    logger.info(f"前端类 {adapter['adapter']} 加载成功。")
-
     # 初始化前端
     logger.info("初始化前端...")
     frontend = FrontendClass(
@@ -110,8 +119,15 @@ def launch_gui():
 
     # 启动主循环
     logger.info("启动主循环...")
-    frontend.start()  # 新增异步启动接口
-    logger.info("主循环启动成功。")
+    try:
+        frontend.start()  # 阻塞直到前端退出
+    finally:
+        model_adapter.close()
+        event_bus.shutdown()
+        process_controller.query_router.close()
+        session_manager.close()
+        tracer.close()
+    logger.info("主循环已退出。")
     
 if __name__ == "__main__":
     launch_gui()  # 用事件循环运行异步主函数
\ No newline at end of file
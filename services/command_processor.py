@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 import asyncio
+import contextlib
+import os
 import re
+import signal
 import subprocess
 import platform
 # 常量配置
@@ -36,10 +39,43 @@ class CommandProcessor:
         except Exception as e:
             return f"执行失败: {str(e)}"
 
-    async def execute_async(self, command: str) -> dict:
+    async def execute_async(self, command: str, timeout: float = 30) -> dict:
+        """
+        异步执行命令；任务被取消或超时时终止子进程
+        :raises asyncio.TimeoutError: 超过timeout秒仍未结束（子进程已终止）
+        """
         try:
-            result = await asyncio.to_thread(self.execute_command, command)
-            return {"status": "success", "output": result}
+            if platform.system() == "Windows":
+                command = CommandProcessor._adapt_windows_command(command)
+                args = ['powershell', '-Command', command]
+            else:
+                args = ["bash", "-c", command]
+            windows = platform.system() == "Windows"
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.DEVNULL,  # 等待输入的命令立即读到EOF，不会挂起
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=not windows  # 独立进程组，取消时连同子进程一起终止
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                # 进程可能恰好已退出，终止失败不能覆盖原本的取消/超时异常
+                with contextlib.suppress(ProcessLookupError):
+                    if windows:
+                        process.kill()
+                    else:
+                        os.killpg(process.pid, signal.SIGKILL)
+                await process.wait()
+                raise
+            if process.returncode != 0:
+                error = stderr.decode(errors="replace").strip() or f"退出码 {process.returncode}"
+                return {"status": "error", "error": f"执行失败: {error}"}
+            output = stdout.decode(errors="replace").strip()
+            return {"status": "success", "output": output or "命令执行成功（无输出）"}
+        except asyncio.TimeoutError:
+            raise
         except Exception as e:
             return {"status": "error", "error": str(e)}
     
@@ -0,0 +1,123 @@
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_SESSION_OVERHEAD = 1024   # 会话字典、元数据等的估算开销（字节）
+_MESSAGE_OVERHEAD = 512    # 单条消息字典的估算开销（字节）
+
+
+@dataclass
+class SessionCacheConfig:
+    """活跃会话缓存配置（两个上限任一超出即淘汰）"""
+    max_sessions: int = 1000
+    max_memory_mb: float = 256
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any] = None) -> 'SessionCacheConfig':
+        config = config or {}
+        return cls(**{k: v for k, v in config.items() if k in cls.__dataclass_fields__})
+
+
+class SessionCache:
+    """
+    按最近访问排序的活跃会话缓存（LRU）
+    - 按会话数与估算内存双重限制，超出时从最久未访问的会话开始淘汰
+    - 正在接收流式响应（response_buffer非空）的会话不淘汰
+    - 非线程安全，由SessionManager的会话锁保护
+    """
+
+    def __init__(self, config: SessionCacheConfig, on_evict: Callable[[str, Dict[str, Any]], None]):
+        """
+        :param on_evict: 淘汰前的回调（持久化未落盘的数据）
+        """
+        self.config = config
+        self.on_evict = on_evict
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._max_bytes = int(config.max_memory_mb * 1024 * 1024)
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话并标记为最近访问"""
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def peek(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话，不改变访问顺序"""
+        return self._sessions.get(session_id)
+
+    def put(self, session_id: str, session: Dict[str, Any]):
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        self.resize(session_id)
+
+    def grow(self, session_id: str, nbytes: int):
+        """会话数据增加后更新估算内存"""
+        if session_id in self._sizes:
+            self._sizes[session_id] += nbytes
+            self._total_bytes += nbytes
+            self._evict()
+
+    def resize(self, session_id: str):
+        """重新估算会话内存（会话数据被替换或清空后调用）"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return
+        size = self.estimate(session)
+        self._total_bytes += size - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = size
+        self._evict()
+
+    @staticmethod
+    def estimate(session: Dict[str, Any]) -> int:
+        return _SESSION_OVERHEAD \
+            + sum(message_size(m) for m in session.get("history", [])) \
+            + sum(sys.getsizeof(chunk) for chunk in session.get("response_buffer", []))
+
+    def _evict(self):
+        """淘汰最久未访问的会话；最近访问的会话始终保留"""
+        while len(self._sessions) > 1 and (
+                len(self._sessions) > self.config.max_sessions or self._total_bytes > self._max_bytes):
+            victim = next((sid for sid, s in self._sessions.items() if not s.get("response_buffer")), None)
+            if victim is None or victim == next(reversed(self._sessions)):
+                break
+            session = self._sessions.pop(victim)
+            self._total_bytes -= self._sizes.pop(victim, 0)
+            self.evictions += 1
+            try:
+                self.on_evict(victim, session)
+            except Exception as e:
+                logger.error(f"Failed to persist evicted session {victim}: {str(e)}")
+
+    def most_recent(self) -> Optional[str]:
+        return next(reversed(self._sessions), None)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sessions)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._sessions),
+            "memory_bytes": self._total_bytes,
+            "evictions": self.evictions,
+        }
+
+
+def message_size(message: Dict[str, Any]) -> int:
+    return _MESSAGE_OVERHEAD + sum(
+        sys.getsizeof(message.get(key) or "") for key in ("content", "thought", "summary")
+    )
@@ -1,28 +1,68 @@
-import json
+import re
+import secrets
+import sys
 import threading
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Dict
+from time import perf_counter
+from typing import List, Dict, Optional, Any
 
+from core.event_metrics import Histogram, MetricsSink, NullMetricsSink
 from utils.logger import get_logger
 from utils.config_loader import ModelConfig
+from services.session_cache import SessionCache, SessionCacheConfig, message_size
+from services.session_store import create_session_store
+
+_id_lock = threading.Lock()
+_last_id_micros = 0
+# new_session_id()生成的格式，以及旧版本的 {user_id}_{%Y%m%d%H%M%S}
+_SESSION_ID_PATTERN = re.compile(r'^(?:\d{20}-[0-9a-f]{8}|[A-Za-z0-9_-]+_\d{14})$')
+
+
+def new_session_id() -> str:
+    """
+    生成唯一且按创建时间排序的会话ID：UTC微秒时间戳 + 随机后缀
+    同一进程内时间戳严格递增（同一微秒内顺延），随机后缀避免多进程间冲突
+    """
+    global _last_id_micros
+    with _id_lock:
+        micros = max(time.time_ns() // 1000, _last_id_micros + 1)
+        _last_id_micros = micros
+    seconds, micros_part = divmod(micros, 1_000_000)
+    stamp = datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y%m%d%H%M%S')
+    return f"{stamp}{micros_part:06d}-{secrets.token_hex(4)}"
+
+
+def is_valid_session_id(session_id: Any) -> bool:
+    """会话ID会用作存储文件名，来自客户端的ID必须先校验（防止路径穿越）"""
+    return isinstance(session_id, str) and _SESSION_ID_PATTERN.match(session_id) is not None
+
 
 class SessionManager:
-    def __init__(self, config: ModelConfig = None):
+    def __init__(self, config: ModelConfig = None, metrics: MetricsSink = None):
         """
         对话会话管理服务
         :param config: 配置加载器实例
+        :param metrics: 指标输出（缓存大小、淘汰次数、重新加载耗时）
         """
         self.logger = get_logger(__name__)
         self.config = config or ModelConfig.load()
+        self.metrics = metrics or NullMetricsSink()
         self._lock = threading.RLock()
 
         # 初始化存储路径
         self.storage_path = Path(self.config.get('session.storage_path', './sessions'))
         self._init_storage()
 
-        # 内存会话存储
-        self.active_sessions = {}  # {session_id: SessionData}
+        # 内存会话缓存（LRU，超出数量/内存上限时淘汰，再次访问时从存储重新加载）
+        self.active_sessions = SessionCache(
+            SessionCacheConfig.from_config(self.config.get('session.cache', {})), self._on_evict
+        )
+        self._reloads = 0
+        self._reload_latency = Histogram()
+        # 持久化后端（session.backend: file / sqlite），变更以记录形式异步写入
+        self.store = create_session_store(self.config, self.storage_path, self._lock, self.active_sessions.peek)
 
     def _init_storage(self):
         """初始化会话存储目录"""
@@ -39,10 +79,10 @@ class SessionManager:
         :param user_id: 用户标识符
         :return: 新会话ID
         """
-        session_id = f"{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        session_id = new_session_id()
 
         with self._lock:
-            self.active_sessions[session_id] = {
+            session = {
                 "history": [],
                 "metadata": {
                     "created_at": datetime.now().isoformat(),
@@ -50,8 +90,24 @@ class SessionManager:
                     "user_id": user_id
                 }
             }
+            self.store.append(session_id, {"op": "create", "metadata": session["metadata"]})
+            self.active_sessions.put(session_id, session)
+            self._publish_cache_gauges()
         return session_id
 
+    def _get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话（需持有会话锁）；已被淘汰的会话从存储重新加载"""
+        session = self.active_sessions.get(session_id)
+        if session is None and self.load_session(session_id):
+            session = self.active_sessions.get(session_id)
+        return session
+
+    def _on_evict(self, session_id: str, session: Dict[str, Any]):
+        """会话移出内存前持久化依赖内存数据的部分（变更记录已逐条提交）"""
+        self.store.release(session_id, session)
+        self.metrics.inc("session_cache_evictions_total")
+        self.logger.info(f"Evicted session {session_id} from memory")
+
     def add_message(self, session_id: str, role: str, content: str,thought: str = None, summary:str = None, metadata: dict = None):
         """
         添加消息到指定会话
@@ -62,20 +118,43 @@ class SessionManager:
         :param content: 消息内容
         """
         with self._lock:
-            if session_id not in self.active_sessions:
+            session = self._get_session(session_id)
+            if session is None:
                 raise ValueError(f"Session {session_id} not found")
 
             # 更新会话最后访问时间
-            self.active_sessions[session_id]["metadata"]["last_accessed"] = datetime.now().isoformat()
-            self.active_sessions[session_id]["history"].append({
+            message = {
                 "role": role,
                 "content": content,
                 "thought": thought or "",
                 "metadata": metadata or {},
                 "summary": summary or "",
                 "timestamp": datetime.now().isoformat()
-            })
-            self._auto_save(session_id)
+            }
+            session["metadata"]["last_accessed"] = message["timestamp"]
+            session["history"].append(message)
+            self.store.append(session_id, {"op": "add", "message": message})
+            self.active_sessions.grow(session_id, message_size(message))
+            self._publish_cache_gauges()
+
+    def update_message_summary(self, session_id: str, correlation_id: str, summary: str, role: str = "user"):
+        """
+        回填消息摘要（摘要在后台计算，消息本身先行写入以保证历史顺序）
+        :param correlation_id: 消息metadata中的correlation_id
+        """
+        with self._lock:
+            history = (self._get_session(session_id) or {}).get("history", [])
+            for message in reversed(history):
+                if message["role"] == role and message["metadata"].get("correlation_id") == correlation_id:
+                    message["summary"] = summary or ""
+                    self.active_sessions.grow(session_id, sys.getsizeof(message["summary"]))
+                    self.store.append(session_id, {
+                        "op": "summary",
+                        "role": role,
+                        "correlation_id": correlation_id,
+                        "summary": message["summary"]
+                    })
+                    return
 
     def get_history(self, session_id: str, max_length: int = 10) -> List[Dict]:
         """
@@ -86,10 +165,11 @@ class SessionManager:
         """
         self.logger.info(f"Getting history for session {session_id}")
         with self._lock:
-            if session_id not in self.active_sessions:
+            session = self._get_session(session_id)
+            if session is None:
                 return []
 
-            history = self.active_sessions[session_id]["history"]
+            history = session["history"]
 
             self.logger.info(f"Getting history finish for session {session_id}: {history}")
             return history[-max_length:]
@@ -99,87 +179,116 @@ class SessionManager:
         :param session_id: 会话ID
         """
         with self._lock:
-            if session_id in self.active_sessions:
-                self.active_sessions[session_id]["history"] = []
-                self._delete_session_file(session_id)
-
-    def _auto_save(self, session_id: str):
-        """自动保存会话到文件（当历史记录超过阈值时）"""
-        if len(self.active_sessions[session_id]["history"]) % 5 == 0:
-            self.save_session(session_id)
+            session = self._get_session(session_id)
+            if session is not None:
+                session["history"] = []
+                self.store.append(session_id, {"op": "clear"})
+                self.active_sessions.resize(session_id)
+        # 清空后日志中的历史记录已无意义，立即压缩
+        self.store.compact(session_id)
 
     def save_session(self, session_id: str):
-        # 将文件写入移到后台线程
-        threading.Thread(
-            target=self._save_session_to_disk,
-            args=(session_id,),
-            daemon=True
-        ).start()
-        
-    def _save_session_to_disk(self, session_id: str):
-        """持久化会话到文件"""
-        try:
-            with self._lock:
-                session_data = self.active_sessions.get(session_id)
-            if not session_data:
-                return
-
-            file_path = self.storage_path / f"{session_id}.json"
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(session_data, f, ensure_ascii=False, indent=2)
-
-        except Exception as e:
-            self.logger.error(f"Failed to save session {session_id}: {str(e)}")
+        """在后台整理会话存储（变更已逐条持久化，此操作只用于缩短日志）"""
+        self.store.compact(session_id)
 
     def load_session(self, session_id: str) -> bool:
-        """从文件加载会话"""
+        """从存储加载会话（只加载最近session.load_window条消息，更早的通过get_history_page分页查询）"""
+        if not is_valid_session_id(session_id):
+            self.logger.warning(f"Rejected invalid session id: {session_id!r}")
+            return False
+        start = perf_counter()
         try:
-            file_path = self.storage_path / f"{session_id}.json"
-            if not file_path.exists():
+            session_data = self.store.load(session_id, max_messages=self.config.get('session.load_window', None))
+            if session_data is None:
                 return False
 
-            with open(file_path, 'r', encoding='utf-8') as f:
-                session_data = json.load(f)
-
             with self._lock:
-                self.active_sessions[session_id] = session_data
+                if session_id not in self.active_sessions:
+                    self.active_sessions.put(session_id, session_data)
+                self._reloads += 1
+                self._reload_latency.observe(perf_counter() - start)
+            self.metrics.observe("session_reload_seconds", perf_counter() - start)
+            self._publish_cache_gauges()
             return True
 
         except Exception as e:
             self.logger.error(f"Failed to load session {session_id}: {str(e)}")
             return False
 
-    def _delete_session_file(self, session_id: str):
-        """删除会话文件"""
-        try:
-            file_path = self.storage_path / f"{session_id}.json"
-            if file_path.exists():
-                file_path.unlink()
-        except Exception as e:
-            self.logger.error(f"Failed to delete session file {session_id}: {str(e)}")
-    def append_chunk(self, session_id: str, chunk: Dict):  # 修改参数类型
-        """追加流式响应片段"""
+    def get_history_page(self, session_id: str, limit: int = 50, offset: int = 0) -> List[Dict]:
+        """
+        分页查询持久化的历史（不加载到内存）
+        :param offset: 跳过最近的offset条
+        :return: 按时间正序的消息列表
+        """
+        if not is_valid_session_id(session_id):
+            return []
+        return self.store.get_messages(session_id, limit, offset)
+
+    def list_sessions(self, limit: int = 50, offset: int = 0) -> List[Dict]:
+        """按最后访问时间倒序分页列出已持久化的会话"""
+        return self.store.list_sessions(limit, offset)
+
+    def close(self):
+        """等待存储写入完成并停止写线程"""
+        self.store.close()
+
+    def _publish_cache_gauges(self):
+        stats = self.active_sessions.stats()
+        self.metrics.set_gauge("session_cache_sessions", stats["sessions"])
+        self.metrics.set_gauge("session_cache_memory_bytes", stats["memory_bytes"])
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """活跃会话缓存指标快照"""
+        with self._lock:
+            return {
+                **self.active_sessions.stats(),
+                "reloads": self._reloads,
+                "reload_latency": self._reload_latency.snapshot(),
+            }
+
+    def append_chunk(self, session_id: str, chunk: str):
+        """追加流式响应片段（只保存文本内容）"""
         with self._lock:
-            if session_id not in self.active_sessions:
+            session = self._get_session(session_id)
+            if session is None:
                 return
     
-            if "response_buffer" not in self.active_sessions[session_id]:
-                self.active_sessions[session_id]["response_buffer"] = []
+            if "response_buffer" not in session:
+                session["response_buffer"] = []
     
-            self.active_sessions[session_id]["response_buffer"].append(chunk)
+            session["response_buffer"].append(chunk)
+            self.active_sessions.grow(session_id, sys.getsizeof(chunk))
     
     def get_response_buffer(self, session_id: str) -> list:
         """获取当前响应缓冲区"""
-        return self.active_sessions.get(session_id, {}).get("response_buffer", [])
+        with self._lock:
+            return (self.active_sessions.get(session_id) or {}).get("response_buffer", [])
     
     def clear_response_buffer(self, session_id: str):
         """清空响应缓冲区"""
-        if session_id in self.active_sessions:
-            self.active_sessions[session_id]["response_buffer"] = []
+        with self._lock:
+            session = self.active_sessions.get(session_id)
+            if session is not None:
+                session["response_buffer"] = []
+                self.active_sessions.resize(session_id)
 
     def get_current_session(self) -> str:
-        """获取最近活跃的会话ID"""
+        """
+        获取最近访问的会话ID（缓存按访问顺序排列，O(1)）
+        仅用于未携带session_id的请求，前端应为每个连接/窗口持有自己的会话
+        """
         with self._lock:
-            if not self.active_sessions:
-                return self.create_session()
-            return max(self.active_sessions.keys(), key=lambda k: self.active_sessions[k]["metadata"]["last_accessed"])
\ No newline at end of file
+            return self.active_sessions.most_recent() or self.create_session()
+
+    def open_session(self, session_id: str = None, user_id: str = "default") -> str:
+        """
+        为客户端连接获取会话：指定的会话存在（内存或存储中）时继续使用，否则创建新会话
+        （格式不合法的ID在加载时被拒绝，同样创建新会话）
+        :return: 会话ID
+        """
+        if session_id:
+            with self._lock:
+                if self._get_session(session_id) is not None:
+                    return session_id
+        return self.create_session(user_id)
\ No newline at end of file
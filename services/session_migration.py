@@ -0,0 +1,67 @@
+# services/session_migration.py
+"""
+将文件存储（{session_id}.json 快照 + {session_id}.wal 日志）中的会话迁移到SQLite存储
+    python -m services.session_migration [--source ./sessions] [--db ./sessions/sessions.db]
+同名会话会被覆盖，可重复执行；源文件保持不变
+"""
+import argparse
+import sys
+import threading
+from pathlib import Path
+from typing import List
+
+from services.session_store import FileSessionStore
+from services.session_wal import WALConfig
+from services.sqlite_session_store import SQLiteSessionStore, SQLiteStoreConfig
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def migrate(source: Path, db_path: str) -> int:
+    """
+    :return: 迁移的会话数
+    """
+    # 只读取文件，不需要压缩，快照函数不会被调用
+    file_store = FileSessionStore(source, WALConfig(), threading.RLock(), lambda _: None)
+    sqlite_store = SQLiteSessionStore(SQLiteStoreConfig(path=db_path))
+    session_ids = sorted({p.stem for p in source.glob("*.json")} | {p.stem for p in source.glob("*.wal")})
+    migrated = 0
+    try:
+        for session_id in session_ids:
+            try:
+                session_data = file_store.load(session_id)
+            except Exception as e:
+                logger.error(f"读取会话失败，已跳过 {session_id}: {str(e)}")
+                continue
+            if session_data is None:
+                continue
+            session_data.setdefault("metadata", {})
+            session_data["metadata"].setdefault("user_id", session_id.rsplit("_", 1)[0])  # 旧格式ID为 {user_id}_{时间}
+            sqlite_store.import_session(session_id, session_data)
+            migrated += 1
+        sqlite_store.flush(timeout=60)
+    finally:
+        sqlite_store.close()
+        file_store.close()
+    logger.info(f"已迁移 {migrated}/{len(session_ids)} 个会话到 {db_path}")
+    return migrated
+
+
+def main(argv: List[str]):
+    parser = argparse.ArgumentParser(description="迁移会话文件到SQLite存储")
+    parser.add_argument("--source", default="./sessions", help="会话文件目录")
+    parser.add_argument("--db", default=None, help="SQLite数据库路径（默认 <source>/sessions.db）")
+    args = parser.parse_args(argv)
+
+    source = Path(args.source)
+    if not source.is_dir():
+        print(f"会话目录不存在: {source}")
+        return 1
+    migrated = migrate(source, args.db or str(source / "sessions.db"))
+    print(f"已迁移 {migrated} 个会话")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,200 @@
+import json
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from services.session_wal import SessionWAL, WALConfig
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class BaseSessionStore(ABC):
+    """
+    会话持久化后端
+    变更以记录形式提交（调用方持有会话锁，保证记录顺序与内存变更一致）:
+      {"op": "create", "metadata": {...}}
+      {"op": "add", "message": {...}}
+      {"op": "summary", "role": str, "correlation_id": str, "summary": str}
+      {"op": "clear"}
+    """
+
+    @abstractmethod
+    def append(self, session_id: str, record: Dict[str, Any]):
+        """提交一条变更记录（异步落盘）"""
+        pass
+
+    @abstractmethod
+    def load(self, session_id: str, max_messages: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        加载会话 {"history": [...], "metadata": {...}}
+        :param max_messages: 只加载最近的N条消息（后端不支持时忽略）
+        :return: 会话不存在时返回None
+        """
+        pass
+
+    @abstractmethod
+    def get_messages(self, session_id: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """分页获取历史：跳过最近的offset条后取limit条，按时间正序返回"""
+        pass
+
+    @abstractmethod
+    def list_sessions(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """按最后访问时间倒序分页列出会话 [{"session_id", "user_id", "created_at", "last_accessed"}]"""
+        pass
+
+    def compact(self, session_id: str):
+        """整理指定会话的存储（可选）"""
+        pass
+
+    def release(self, session_id: str, session_data: Dict[str, Any]):
+        """会话移出内存前调用（调用方持有会话锁），持久化依赖内存数据的部分"""
+        pass
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待已提交的记录全部落盘，超时或写入失败时返回False"""
+        return True
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+def apply_record(session_data: Dict[str, Any], record: Dict[str, Any]):
+    """将一条变更记录应用到会话数据（用于日志重放与迁移）"""
+    op = record.get("op")
+    if op == "create":
+        session_data["metadata"] = record["metadata"]
+    elif op == "add":
+        session_data["history"].append(record["message"])
+        session_data["metadata"]["last_accessed"] = record["message"]["timestamp"]
+    elif op == "summary":
+        for message in reversed(session_data["history"]):
+            if message["role"] == record["role"] \
+                    and message["metadata"].get("correlation_id") == record["correlation_id"]:
+                message["summary"] = record["summary"]
+                break
+    elif op == "clear":
+        session_data["history"] = []
+
+
+class FileSessionStore(BaseSessionStore):
+    """
+    每个会话一个目录内文件：追加写日志 {session_id}.wal + 压缩快照 {session_id}.json
+    列表查询需要扫描全部文件，适合会话数量较少的场景
+    """
+
+    def __init__(self, storage_path: Path, config: WALConfig, lock: threading.RLock,
+                 get_session: Callable[[str], Optional[Dict[str, Any]]]):
+        """
+        :param lock: 会话锁，压缩时在锁内序列化快照
+        :param get_session: 获取内存中会话数据的函数
+        """
+        self.storage_path = storage_path
+        self._lock = lock
+        self._get_session = get_session
+        self.wal = SessionWAL(storage_path, config, self._serialize_snapshot)
+
+    def append(self, session_id: str, record: Dict[str, Any]):
+        self.wal.append(session_id, record)
+
+    def _serialize_snapshot(self, session_id: str) -> Optional[str]:
+        """
+        在会话锁内序列化快照，快照与其包含的日志序号一致
+        会话锁被占用（可能正等待本写线程）时放弃本次压缩，避免互相等待
+        """
+        if not self._lock.acquire(timeout=0.1):
+            return None
+        try:
+            session_data = self._get_session(session_id)
+            if not session_data:
+                return None
+            return self._serialize(session_id, session_data)
+        finally:
+            self._lock.release()
+
+    def _serialize(self, session_id: str, session_data: Dict[str, Any]) -> str:
+        return json.dumps({
+            "history": session_data["history"],
+            "metadata": session_data["metadata"],
+            "wal_seq": self.wal.last_seq(session_id)
+        }, ensure_ascii=False)
+
+    def release(self, session_id: str, session_data: Dict[str, Any]):
+        """移出内存后写线程无法再生成快照，此时压缩为快照"""
+        self.wal.compact(session_id, self._serialize(session_id, session_data))
+
+    def load(self, session_id: str, max_messages: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """从快照加载会话并重放其后的日志（快照需要完整历史，忽略max_messages）"""
+        self.flush()
+        return self._recover(session_id)
+
+    def _recover(self, session_id: str) -> Optional[Dict[str, Any]]:
+        session_data, records = self.wal.recover(session_id)
+        if session_data is None and not records:
+            return None
+        session_data = session_data or {"history": [], "metadata": {}}
+        for record in records:
+            apply_record(session_data, record)
+        if records:
+            logger.info(f"Replayed {len(records)} log records for session {session_id}")
+        return session_data
+
+    def get_messages(self, session_id: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        session_data = self.load(session_id)
+        if session_data is None:
+            return []
+        history = session_data["history"]
+        end = len(history) - offset
+        return history[max(0, end - limit):max(0, end)]
+
+    def list_sessions(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        self.flush()
+        session_ids = {p.stem for p in self.storage_path.glob("*.json")} | \
+                      {p.stem for p in self.storage_path.glob("*.wal")}
+        sessions = []
+        for session_id in session_ids:
+            session_data = self._recover(session_id)
+            if session_data is None:
+                continue
+            metadata = session_data.get("metadata", {})
+            sessions.append({
+                "session_id": session_id,
+                "user_id": metadata.get("user_id"),
+                "created_at": metadata.get("created_at"),
+                "last_accessed": metadata.get("last_accessed"),
+            })
+        sessions.sort(key=lambda s: s["last_accessed"] or "", reverse=True)
+        return sessions[offset:offset + limit]
+
+    def compact(self, session_id: str):
+        self.wal.compact(session_id)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        return self.wal.flush(timeout)
+
+    def close(self):
+        self.wal.flush()
+        self.wal.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "file", **self.wal.stats()}
+
+
+def create_session_store(config, storage_path: Path, lock: threading.RLock,
+                         get_session: Callable[[str], Optional[Dict[str, Any]]]) -> BaseSessionStore:
+    """
+    根据session.backend创建存储后端
+    :param config: ModelConfig
+    """
+    backend = config.get('session.backend', 'file')
+    if backend == "sqlite":
+        from services.sqlite_session_store import SQLiteSessionStore, SQLiteStoreConfig
+        sqlite_config = {"path": str(storage_path / "sessions.db"), **(config.get('session.sqlite', {}) or {})}
+        return SQLiteSessionStore(SQLiteStoreConfig.from_config(sqlite_config))
+    if backend == "file":
+        return FileSessionStore(storage_path, WALConfig.from_config(config.get('session.wal', {})), lock, get_session)
+    raise ValueError(f"Unsupported session backend: {backend}")
@@ -0,0 +1,254 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class WALConfig:
+    """会话预写日志配置"""
+    fsync: bool = True
+    group_commit_ms: float = 5      # 收到第一条记录后再等待该时间收集后续记录，合并为一次fsync
+    compact_every: int = 200        # 单个会话累计写入该条数后在后台压缩为快照并截断日志
+    max_open_files: int = 64        # 同时保持打开的日志文件数
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any] = None) -> 'WALConfig':
+        config = config or {}
+        return cls(**{k: v for k, v in config.items() if k in cls.__dataclass_fields__})
+
+
+class SessionWAL:
+    """
+    会话的追加写日志（每个会话一个JSONL文件）
+    - 每次变更序列化为一行追加到 {session_id}.wal，调用方开销与会话长度无关
+    - 写入由单个后台线程完成，同一批次内的记录只fsync一次（组提交）
+    - 日志达到阈值后压缩：写入 {session_id}.json 快照（原子替换）后截断日志
+    - 每条记录带递增序号，快照记录已包含的最大序号，恢复时跳过已并入快照的记录
+    """
+
+    def __init__(self, storage_path: Path, config: WALConfig, snapshot: Callable[[str], Optional[str]]):
+        """
+        :param snapshot: 生成会话快照JSON的函数（须包含wal_seq，会话不存在时返回None）
+        """
+        self.storage_path = storage_path
+        self.config = config
+        self.snapshot = snapshot
+        self._seq: Dict[str, int] = {}
+        self._seq_lock = threading.Lock()
+        self._queue: "queue.SimpleQueue[Optional[Tuple]]" = queue.SimpleQueue()
+        self._files: "OrderedDict[str, Any]" = OrderedDict()  # 仅写线程访问
+        self._since_compaction: Dict[str, int] = {}          # 仅写线程访问
+        self._records = 0
+        self._fsyncs = 0
+        self._compactions = 0
+        self._thread = threading.Thread(target=self._run, name="session-wal", daemon=True)
+        self._thread.start()
+
+    def wal_path(self, session_id: str) -> Path:
+        return self.storage_path / f"{session_id}.wal"
+
+    def snapshot_path(self, session_id: str) -> Path:
+        return self.storage_path / f"{session_id}.json"
+
+    def append(self, session_id: str, record: Dict[str, Any]) -> int:
+        """
+        追加一条记录（调用方应持有会话锁，使序号顺序与内存变更顺序一致）
+        :return: 记录序号
+        """
+        with self._seq_lock:
+            seq = self._seq.get(session_id, 0) + 1
+            self._seq[session_id] = seq
+        line = json.dumps({"seq": seq, **record}, ensure_ascii=False)
+        self._queue.put(("record", session_id, line))
+        return seq
+
+    def last_seq(self, session_id: str) -> int:
+        with self._seq_lock:
+            return self._seq.get(session_id, 0)
+
+    def compact(self, session_id: str, data: Optional[str] = None):
+        """
+        请求在后台压缩指定会话
+        :param data: 已序列化的快照（会话即将移出内存时由调用方提供），为None时在压缩时生成
+        """
+        self._queue.put(("compact", session_id, data))
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待此前的记录全部落盘"""
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def recover(self, session_id: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        读取快照与快照之后的日志记录
+        :return: (快照数据或None, 待重放的记录列表)
+        """
+        snapshot = None
+        snapshot_seq = 0
+        snapshot_path = self.snapshot_path(session_id)
+        if snapshot_path.exists():
+            with open(snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            snapshot_seq = snapshot.pop("wal_seq", 0)
+
+        records = []
+        last_seq = snapshot_seq
+        wal_path = self.wal_path(session_id)
+        if wal_path.exists():
+            valid_bytes = 0
+            with open(wal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("incomplete line")
+                        record = json.loads(line)
+                    except ValueError:
+                        # 崩溃时未写完的末尾记录
+                        logger.warning(f"跳过损坏的会话日志记录: {wal_path}")
+                        break
+                    valid_bytes += len(line)
+                    if record["seq"] > snapshot_seq:
+                        records.append(record)
+                        last_seq = max(last_seq, record["seq"])
+            if valid_bytes < wal_path.stat().st_size:
+                # 截掉损坏的尾部，否则之后追加的记录会接在残行后面，下次恢复时一并丢失
+                os.truncate(wal_path, valid_bytes)
+
+        with self._seq_lock:
+            self._seq[session_id] = max(self._seq.get(session_id, 0), last_seq)
+        return snapshot, records
+
+    # ---------- 写线程 ----------
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # 组提交：在等待窗口内收集更多记录
+            deadline = time.monotonic() + self.config.group_commit_ms / 1000
+            while batch[-1] is not None:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not self._process(batch):
+                return
+
+    def _process(self, batch: List[Optional[Tuple]]) -> bool:
+        touched = set()
+        to_compact: Dict[str, None] = {}
+        waiters = []
+        running = True
+        for item in batch:
+            if item is None:
+                running = False
+                break
+            kind = item[0]
+            if kind == "record":
+                _, session_id, line = item
+                try:
+                    self._file(session_id).write(line + "\n")
+                except Exception as e:
+                    logger.error(f"写入会话日志失败 {session_id}: {str(e)}")
+                    continue
+                touched.add(session_id)
+                self._records += 1
+                count = self._since_compaction.get(session_id, 0) + 1
+                self._since_compaction[session_id] = count
+                if count >= self.config.compact_every:
+                    to_compact.setdefault(session_id, None)
+            elif kind == "compact":
+                _, session_id, data = item
+                if data is None:
+                    to_compact.setdefault(session_id, None)
+                else:
+                    # 调用方提供的快照只包含此前的记录，必须按队列顺序立即压缩
+                    self._sync(session_id)
+                    self._compact(session_id, data)
+                    to_compact.pop(session_id, None)
+            elif kind == "flush":
+                waiters.append(item[1])
+
+        for session_id in touched:
+            self._sync(session_id)
+        for session_id in to_compact:
+            self._compact(session_id)
+        for waiter in waiters:
+            waiter.set()
+        if not running:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+        return running
+
+    def _file(self, session_id: str):
+        f = self._files.get(session_id)
+        if f is not None:
+            self._files.move_to_end(session_id)
+            return f
+        f = self._files[session_id] = open(self.wal_path(session_id), 'a', encoding='utf-8')
+        while len(self._files) > self.config.max_open_files:
+            oldest_id, oldest = self._files.popitem(last=False)
+            self._sync_file(oldest_id, oldest)
+            oldest.close()
+        return f
+
+    def _sync(self, session_id: str):
+        f = self._files.get(session_id)
+        if f is not None:
+            self._sync_file(session_id, f)
+
+    def _sync_file(self, session_id: str, f):
+        try:
+            f.flush()
+            if self.config.fsync:
+                os.fsync(f.fileno())
+                self._fsyncs += 1
+        except Exception as e:
+            logger.error(f"会话日志落盘失败 {session_id}: {str(e)}")
+
+    def _compact(self, session_id: str, data: Optional[str] = None):
+        """写入快照后截断日志；快照生成晚于已写入日志的记录，这些记录都已包含在内"""
+        try:
+            data = data if data is not None else self.snapshot(session_id)
+            if data is None:
+                return  # 会话不在内存或暂时无法获取会话锁，留待下次压缩
+            snapshot_path = self.snapshot_path(session_id)
+            tmp_path = snapshot_path.with_suffix(".json.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                if self.config.fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, snapshot_path)
+
+            f = self._files.pop(session_id, None)
+            if f is not None:
+                f.close()
+            open(self.wal_path(session_id), 'w').close()
+            self._since_compaction[session_id] = 0
+            self._compactions += 1
+        except Exception as e:
+            logger.error(f"压缩会话日志失败 {session_id}: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "records": self._records,
+            "fsyncs": self._fsyncs,
+            "compactions": self._compactions,
+            "open_files": len(self._files),
+        }
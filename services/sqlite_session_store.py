@@ -0,0 +1,289 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.session_store import BaseSessionStore
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id    TEXT PRIMARY KEY,
+    user_id       TEXT,
+    created_at    TEXT,
+    last_accessed TEXT,
+    metadata      TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_accessed ON sessions(last_accessed);
+CREATE TABLE IF NOT EXISTS messages (
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id     TEXT NOT NULL,
+    role           TEXT NOT NULL,
+    content        TEXT NOT NULL,
+    thought        TEXT NOT NULL DEFAULT '',
+    summary        TEXT NOT NULL DEFAULT '',
+    correlation_id TEXT,
+    metadata       TEXT NOT NULL DEFAULT '{}',
+    timestamp      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_correlation ON messages(session_id, correlation_id);
+"""
+
+
+@dataclass
+class SQLiteStoreConfig:
+    """SQLite会话存储配置"""
+    path: str = "./sessions/sessions.db"
+    synchronous: str = "NORMAL"     # WAL模式下NORMAL只在检查点fsync，崩溃不损坏数据库
+    busy_timeout_ms: int = 5000
+    group_commit_ms: float = 5      # 收到第一条记录后再等待该时间收集后续记录，合并为一个事务
+    max_batch: int = 500            # 单个事务最多包含的记录数
+    max_retries: int = 3            # 批次失败后逐条重试时，数据库忙/锁定等暂时性错误的重试次数
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any] = None) -> 'SQLiteStoreConfig':
+        config = config or {}
+        return cls(**{k: v for k, v in config.items() if k in cls.__dataclass_fields__})
+
+
+class SQLiteSessionStore(BaseSessionStore):
+    """
+    SQLite会话存储（WAL日志模式）
+    - sessions表按最后访问时间建索引，列出/查找最近会话不需要扫描
+    - messages表按(session_id, id)建索引，历史按页查询，不必整体加载
+    - 写入由单个后台线程按批次在一个事务中提交；读取使用各线程独立的连接，与写入互不阻塞
+    """
+
+    def __init__(self, config: SQLiteStoreConfig):
+        self.config = config
+        Path(config.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._queue: "queue.SimpleQueue[Optional[Tuple]]" = queue.SimpleQueue()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._records = 0
+        self._transactions = 0
+        self._failed_records = 0
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        self._thread = threading.Thread(target=self._run, name="session-sqlite", daemon=True)
+        self._thread.start()
+        logger.info(f"SQLite session store initialized at: {config.path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.config.path, timeout=self.config.busy_timeout_ms / 1000,
+                               check_same_thread=False)
+        conn.execute(f"PRAGMA synchronous={self.config.synchronous}")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """当前线程的只读连接；读取前先等待已提交的写入落库，保证读到自己的写入"""
+        with self._pending_lock:
+            pending = self._pending
+        if pending:
+            self.flush()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # ---------- 写入 ----------
+    def append(self, session_id: str, record: Dict[str, Any]):
+        # 在调用方线程序列化，之后对内存数据的修改不影响已提交的记录
+        statements = self._to_statements(session_id, record)
+        if statements:
+            self._enqueue(statements)
+
+    def import_session(self, session_id: str, session_data: Dict[str, Any]):
+        """整体写入一个会话（迁移用，覆盖同名会话）"""
+        metadata = session_data.get("metadata", {})
+        self._enqueue([("DELETE FROM messages WHERE session_id = ?", (session_id,))])
+        self.append(session_id, {"op": "create", "metadata": metadata})
+        for message in session_data.get("history", []):
+            self.append(session_id, {"op": "add", "message": message})
+        if metadata.get("last_accessed"):
+            self._enqueue([("UPDATE sessions SET last_accessed = ? WHERE session_id = ?",
+                            (metadata["last_accessed"], session_id))])
+
+    def _enqueue(self, statements: List[Tuple[str, tuple]]):
+        with self._pending_lock:
+            self._pending += 1
+        self._queue.put(("write", statements))
+
+    @staticmethod
+    def _to_statements(session_id: str, record: Dict[str, Any]) -> List[Tuple[str, tuple]]:
+        """变更记录转换为SQL语句（一条记录可能对应多条语句）"""
+        op = record.get("op")
+        if op == "create":
+            metadata = record["metadata"]
+            return [(
+                "INSERT OR REPLACE INTO sessions (session_id, user_id, created_at, last_accessed, metadata) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (session_id, metadata.get("user_id"), metadata.get("created_at"),
+                 metadata.get("last_accessed"), json.dumps(metadata, ensure_ascii=False))
+            )]
+        if op == "add":
+            message = record["message"]
+            metadata = message.get("metadata") or {}
+            return [(
+                "INSERT INTO messages (session_id, role, content, thought, summary, correlation_id, metadata, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, message["role"], message["content"], message.get("thought") or "",
+                 message.get("summary") or "", metadata.get("correlation_id"),
+                 json.dumps(metadata, ensure_ascii=False), message.get("timestamp"))
+            ), (
+                "UPDATE sessions SET last_accessed = ? WHERE session_id = ?",
+                (message.get("timestamp"), session_id)
+            )]
+        if op == "summary":
+            return [(
+                "UPDATE messages SET summary = ? WHERE id = ("
+                "SELECT id FROM messages WHERE session_id = ? AND correlation_id = ? AND role = ? "
+                "ORDER BY id DESC LIMIT 1)",
+                (record["summary"], session_id, record["correlation_id"], record["role"])
+            )]
+        if op == "clear":
+            return [("DELETE FROM messages WHERE session_id = ?", (session_id,))]
+        logger.warning(f"Unknown session record op: {op}")
+        return []
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.config.group_commit_ms / 1000
+            while batch[-1] is not None and len(batch) < self.config.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            running = self._write_batch(conn, batch)
+            if not running:
+                conn.close()
+                return
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Optional[Tuple]]) -> bool:
+        writes = []
+        waiters = []
+        running = True
+        for item in batch:
+            if item is None:
+                running = False
+                break
+            kind, payload = item
+            if kind == "flush":
+                waiters.append(payload)
+            else:
+                writes.append(payload)
+
+        try:
+            if writes:
+                try:
+                    self._execute(conn, writes)  # 整批一个事务
+                except Exception as e:
+                    # 整批已回滚：逐条重试，一条记录的错误不连累同批次其他会话的记录
+                    logger.warning(f"批量写入会话数据库失败，逐条重试（{len(writes)}条记录）: {str(e)}")
+                    for statements in writes:
+                        self._write_one(conn, statements)
+        finally:
+            with self._pending_lock:
+                self._pending -= len(writes)
+            for waiter in waiters:
+                waiter.set()
+        return running
+
+    def _execute(self, conn: sqlite3.Connection, writes: List[List[Tuple[str, tuple]]]):
+        with conn:
+            for statements in writes:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+        self._transactions += 1
+        self._records += len(writes)
+
+    def _write_one(self, conn: sqlite3.Connection, statements: List[Tuple[str, tuple]]):
+        """单条记录独立事务写入，暂时性错误退避重试，最终失败计入failed_records"""
+        error = None
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                self._execute(conn, [statements])
+                return
+            except sqlite3.OperationalError as e:
+                error = e  # 数据库忙/锁定
+                if attempt < self.config.max_retries:
+                    time.sleep(min(0.05 * 2 ** attempt, 1.0))
+            except Exception as e:
+                error = e
+                break
+        self._failed_records += 1
+        logger.error(f"写入会话数据库失败，记录已丢弃: {str(error)}, statements={statements}")
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待已提交的写入落库；超时或期间有记录最终写入失败时返回False"""
+        failed = self._failed_records
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout) and self._failed_records == failed
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join(5.0)
+
+    # ---------- 查询 ----------
+    def load(self, session_id: str, max_messages: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        conn = self._reader()
+        row = conn.execute("SELECT metadata, last_accessed FROM sessions WHERE session_id = ?",
+                           (session_id,)).fetchone()
+        if row is None:
+            return None
+        metadata = json.loads(row["metadata"])
+        if row["last_accessed"]:
+            metadata["last_accessed"] = row["last_accessed"]
+        history = self.get_messages(session_id, limit=max_messages if max_messages is not None else -1)
+        return {"history": history, "metadata": metadata}
+
+    def get_messages(self, session_id: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """limit为-1时不限条数"""
+        rows = self._reader().execute(
+            "SELECT role, content, thought, summary, metadata, timestamp FROM messages "
+            "WHERE session_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (session_id, limit, offset)
+        ).fetchall()
+        return [{
+            "role": row["role"],
+            "content": row["content"],
+            "thought": row["thought"],
+            "metadata": json.loads(row["metadata"]),
+            "summary": row["summary"],
+            "timestamp": row["timestamp"],
+        } for row in reversed(rows)]
+
+    def list_sessions(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        rows = self._reader().execute(
+            "SELECT session_id, user_id, created_at, last_accessed FROM sessions "
+            "ORDER BY last_accessed DESC LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._pending_lock:
+            pending = self._pending
+        return {
+            "backend": "sqlite",
+            "records": self._records,
+            "transactions": self._transactions,
+            "failed_records": self._failed_records,
+            "pending": pending,
+        }
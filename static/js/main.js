@@ -1,76 +1,115 @@
-// WebSocket连接
-const socket = new WebSocket(`ws://${window.location.host}/ws`);
+// WebSocket连接（断线后自动重连，并按最后收到的序号续传未完成的回复）
+let socket = null;
+let reconnectDelay = 500;
+const MAX_RECONNECT_DELAY = 10000;
 
-// 页面加载完成后初始化
-document.addEventListener("DOMContentLoaded", () => {
-    const userInput = document.getElementById("user-input");
-    const sendButton = document.getElementById("send-button");
-    const displayArea = document.getElementById("display-area");
+// 按correlation_id记录每条回复的显示元素与最后收到的序号
+const streams = {};
+let currentStreamId = null;
 
-    // 发送按钮点击事件
-    sendButton.addEventListener("click", () => {
-        const message = userInput.value.trim();
-        if (message) {
-            socket.send(JSON.stringify({ input: message }));
-            addMessage(message, "user-message");
-            userInput.value = "";
-        }
-    });
+// 服务端为每个连接分配的会话，保存在当前标签页，重连时继续原会话
+const SESSION_KEY = "smart-terminal-session";
 
-    // 监听WebSocket消息
-    socket.onmessage = (event) => {
-        const data = JSON.parse(event.data);
-        
-        if (data.type === "output") {
-            addMessage(data.data.content, "bot-message");
-        } else if (data.type === "status") {
-            // 处理状态更新
-            updateStatus(data.data);
-        } else if (data.type === "error") {
-            // 处理错误消息
-            showError(data.data);
-        } else if (data.type === "think") {
-            // 处理思考状态
-            updateThinkStatus(data.data);
+function connect() {
+    const sessionId = sessionStorage.getItem(SESSION_KEY);
+    const query = sessionId ? `?session_id=${encodeURIComponent(sessionId)}` : "";
+    socket = new WebSocket(`ws://${window.location.host}/ws${query}`);
+
+    socket.onopen = () => {
+        reconnectDelay = 500;
+        // 重连后续传最近一条回复
+        if (currentStreamId && streams[currentStreamId]) {
+            socket.send(JSON.stringify({
+                resume: { correlation_id: currentStreamId, last_seq: streams[currentStreamId].lastSeq }
+            }));
         }
     };
-    
-    // 更新状态显示
-    function updateStatus(statusData) {
-        const statusElement = document.getElementById("status-area") || 
-            createStatusElement();
-        statusElement.textContent = statusData.message;
-    }
-    
-    // 显示错误消息
-    function showError(errorData) {
-        const errorElement = document.createElement("div");
-        errorElement.className = "error-message";
-        errorElement.textContent = `错误: ${errorData.message}`;
-        document.getElementById("display-area").appendChild(errorElement);
+
+    socket.onmessage = (event) => handleMessage(JSON.parse(event.data));
+
+    socket.onclose = () => {
+        setTimeout(connect, reconnectDelay);
+        reconnectDelay = Math.min(reconnectDelay * 2, MAX_RECONNECT_DELAY);
+    };
+}
+
+function handleMessage(data) {
+    if (data.type === "session") {
+        sessionStorage.setItem(SESSION_KEY, data.session_id);
+        draftInputEnabled = Boolean(data.draft_input);
+        return;
     }
-    
-    // 更新思考状态
-    function updateThinkStatus(thinkData) {
-        let thinkElement = document.getElementById("think-indicator");
-        if (!thinkElement) {
-            thinkElement = document.createElement("div");
-            thinkElement.id = "think-indicator";
-            thinkElement.className = "think-message";
-            document.getElementById("display-area").appendChild(thinkElement);
+    if (data.correlation_id) {
+        const stream = getStream(data.correlation_id);
+        if (data.seq !== undefined) {
+            // 跳过重放时可能重复收到的帧
+            if (data.seq <= stream.lastSeq) {
+                return;
+            }
+            stream.lastSeq = data.seq;
         }
-        thinkElement.textContent = thinkData.message;
+        if (data.type === "snapshot") {
+            // 已结束的回复被压缩为快照，整体替换
+            stream.element.textContent = "";
+            data.segments.forEach((segment) => appendSegment(stream, segment.type, segment.content));
+        } else if (data.type === "resume_expired") {
+            updateStatus("回复缓冲已过期，部分内容可能缺失");
+        } else {
+            appendSegment(stream, data.type, data.content);
+        }
+        return;
     }
-    
-    // 创建状态显示区域
-    function createStatusElement() {
-        const statusElement = document.createElement("div");
-        statusElement.id = "status-area";
-        statusElement.className = "status-message";
-        document.body.insertBefore(statusElement, document.querySelector("footer"));
-        return statusElement;
+
+    if (data.type === "status") {
+        updateStatus(data.content);
+    } else if (data.type === "error") {
+        showError(data.content);
+    } else {
+        addMessage(data.content, "bot-message");
     }
-});
+}
+
+function getStream(correlationId) {
+    if (!streams[correlationId]) {
+        const element = document.createElement("div");
+        element.className = "message bot-message";
+        document.getElementById("display-area").appendChild(element);
+        streams[correlationId] = { element: element, lastSeq: 0 };
+    }
+    currentStreamId = correlationId;
+    return streams[correlationId];
+}
+
+function appendSegment(stream, type, content) {
+    const span = document.createElement("span");
+    span.className = type === "think" ? "think-message" : "response-message";
+    span.textContent = content;
+    stream.element.appendChild(span);
+}
+
+// 更新状态显示
+function updateStatus(message) {
+    const statusElement = document.getElementById("status-area") ||
+        createStatusElement();
+    statusElement.textContent = message;
+}
+
+// 显示错误消息
+function showError(message) {
+    const errorElement = document.createElement("div");
+    errorElement.className = "error-message";
+    errorElement.textContent = message;
+    document.getElementById("display-area").appendChild(errorElement);
+}
+
+// 创建状态显示区域
+function createStatusElement() {
+    const statusElement = document.createElement("div");
+    statusElement.id = "status-area";
+    statusElement.className = "status-message";
+    document.body.insertBefore(statusElement, document.querySelector("footer"));
+    return statusElement;
+}
 
 // 添加消息到显示区域
 function addMessage(content, className) {
@@ -78,4 +117,42 @@ function addMessage(content, className) {
     messageElement.className = `message ${className}`;
     messageElement.textContent = content;
     document.getElementById("display-area").appendChild(messageElement);
-}
\ No newline at end of file
+}
+
+// 输入停顿后发送草稿，服务端据此提前检索
+const DRAFT_DEBOUNCE_MS = 400;
+let draftTimer = null;
+// 服务端在会话帧中告知是否接收草稿（frontend.web.draft_input.enabled）
+let draftInputEnabled = false;
+
+// 页面加载完成后初始化
+document.addEventListener("DOMContentLoaded", () => {
+    const userInput = document.getElementById("user-input");
+    const sendButton = document.getElementById("send-button");
+
+    connect();
+
+    userInput.addEventListener("input", () => {
+        clearTimeout(draftTimer);
+        if (!draftInputEnabled) {
+            return;
+        }
+        draftTimer = setTimeout(() => {
+            const draft = userInput.value.trim();
+            if (draft && socket.readyState === WebSocket.OPEN) {
+                socket.send(JSON.stringify({ draft: draft }));
+            }
+        }, DRAFT_DEBOUNCE_MS);
+    });
+
+    // 发送按钮点击事件
+    sendButton.addEventListener("click", () => {
+        const message = userInput.value.trim();
+        if (message && socket.readyState === WebSocket.OPEN) {
+            clearTimeout(draftTimer);
+            socket.send(JSON.stringify({ input: message }));
+            addMessage(message, "user-message");
+            userInput.value = "";
+        }
+    });
+});
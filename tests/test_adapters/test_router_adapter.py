@@ -0,0 +1,160 @@
+import asyncio
+import json
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from adapters.model.router_adapter import ModelRouterAdapter
+from core.event_bus import EventBus
+
+
+class FakeOllama:
+    """本地假Ollama后端：/api/chat 返回固定内容，/api/tags 用于健康检查"""
+
+    def __init__(self, name: str, delay: float = 0.0, fail: bool = False, healthy: bool = True):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.healthy = healthy
+        self.chat_calls = 0
+        self.server = None
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/api/chat", self._chat)
+        app.router.add_get("/api/tags", self._tags)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        return str(self.server.make_url(""))
+
+    async def close(self):
+        await self.server.close()
+
+    async def _chat(self, request: web.Request) -> web.StreamResponse:
+        self.chat_calls += 1
+        payload = await request.json()
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            return web.Response(status=500)
+        done = {"done": True, "eval_count": 10, "eval_duration": 10 ** 9}
+        if not payload.get("stream"):
+            return web.json_response({"message": {"content": self.name}, **done})
+
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for piece in (self.name, "!"):
+            await response.write((json.dumps({"message": {"content": piece}, "done": False}) + "\n").encode())
+        await response.write((json.dumps({"message": {"content": ""}, **done}) + "\n").encode())
+        await response.write_eof()
+        return response
+
+    async def _tags(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": []}, status=200 if self.healthy else 503)
+
+
+@pytest.fixture
+def event_bus():
+    bus = EventBus()
+    yield bus
+    bus.shutdown()
+
+
+def run_on_bus(bus: EventBus, coro):
+    """适配器的连接池与健康检查都绑定在总线事件循环上，测试也在该循环中执行"""
+    return bus.submit(coro).result(timeout=10)
+
+
+async def start_router(bus: EventBus, backends, **config) -> ModelRouterAdapter:
+    endpoints = [await b.start() for b in backends]
+    return ModelRouterAdapter({
+        "model_name": "fake",
+        "backends": endpoints,
+        "health_check_interval": 0,
+        "hedge_delay": 0,
+        **config
+    }, bus)
+
+
+async def collect(router: ModelRouterAdapter, stream: bool = False) -> str:
+    chunks = []
+    async for chunk in router.chat([{"role": "user", "content": "hi"}], stream=stream):
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+async def shutdown(router: ModelRouterAdapter, backends):
+    router.close()
+    for b in backends:
+        await b.close()
+
+
+def test_routes_to_backend_with_fewest_outstanding_requests(event_bus):
+    async def scenario():
+        a, b = FakeOllama("A", delay=0.3), FakeOllama("B")
+        router = await start_router(event_bus, [a, b])
+        try:
+            first = asyncio.create_task(collect(router))
+            await asyncio.sleep(0.1)  # A上有一个未完成请求
+            assert await collect(router) == "B"
+            assert await first == "A"
+            assert (a.chat_calls, b.chat_calls) == (1, 1)
+            assert all(s["outstanding"] == 0 for s in router.stats().values())
+        finally:
+            await shutdown(router, [a, b])
+
+    run_on_bus(event_bus, scenario())
+
+
+def test_fails_over_to_next_backend(event_bus):
+    async def scenario():
+        a, b = FakeOllama("A", fail=True), FakeOllama("B")
+        router = await start_router(event_bus, [a, b], failure_threshold=1)
+        try:
+            assert await collect(router, stream=True) == "B!"
+            stats = router.stats()
+            assert a.chat_calls == 1
+            assert stats[router.backends[0].endpoint]["errors"] == 1
+            assert stats[router.backends[0].endpoint]["available"] is False
+            # 被摘除的后端不再接收请求
+            assert await collect(router) == "B"
+            assert a.chat_calls == 1
+        finally:
+            await shutdown(router, [a, b])
+
+    run_on_bus(event_bus, scenario())
+
+
+def test_health_check_readmits_recovered_backend(event_bus):
+    async def scenario():
+        a, b = FakeOllama("A", fail=True, healthy=False), FakeOllama("B")
+        router = await start_router(event_bus, [a, b], failure_threshold=1, eject_seconds=60,
+                                    health_check_interval=0.05)
+        try:
+            assert await collect(router) == "B"
+            await asyncio.sleep(0.2)
+            assert router.backends[0].ejected
+
+            a.fail, a.healthy = False, True
+            await asyncio.sleep(0.2)
+            assert not router.backends[0].ejected
+            assert await collect(router) == "A"
+        finally:
+            await shutdown(router, [a, b])
+
+    run_on_bus(event_bus, scenario())
+
+
+def test_close_stops_health_checks(event_bus):
+    async def scenario():
+        a = FakeOllama("A")
+        router = await start_router(event_bus, [a], health_check_interval=0.05)
+        await collect(router)
+        router.close()
+        await asyncio.sleep(0.2)
+        assert router._session is None
+        await a.close()
+
+    run_on_bus(event_bus, scenario())
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+import pytest
+
+from core.event_bus import EventBus, QueuePolicy
+from core.events import EventType, StatusUpdateEvent
+
+
+class SlowSubscriber:
+    """慢速协程订阅者：记录收到的事件序号，同时在执行的处理器个数"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.received = []
+        self.running = 0
+        self.max_running = 0
+        self.done = threading.Event()
+
+    async def handle(self, data):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.received.append(data)
+        self.running -= 1
+        if data == "last":
+            self.done.set()
+
+
+def counter(bus: EventBus, name: str) -> float:
+    return sum(s["value"] for s in bus.metrics.snapshot().get(name, []))
+
+
+@pytest.fixture
+def make_bus():
+    buses = []
+
+    def make(**kwargs) -> EventBus:
+        buses.append(EventBus(**kwargs))
+        return buses[-1]
+
+    yield make
+    for bus in buses:
+        bus.shutdown()
+
+
+def test_slow_async_subscriber_overflows_its_queue(make_bus):
+    bus = make_bus(queue_size=4, policies={EventType.USER_INPUT: QueuePolicy.DROP_OLDEST})
+    subscriber = SlowSubscriber(delay=0.02)
+    bus.subscribe(EventType.USER_INPUT, subscriber.handle)
+
+    for i in range(30):
+        bus.publish(EventType.USER_INPUT, i)
+    bus.publish(EventType.USER_INPUT, "last")
+    assert subscriber.done.wait(5)
+
+    numbers = subscriber.received[:-1]
+    assert numbers == sorted(numbers)
+    assert len(numbers) < 30
+    assert counter(bus, "eventbus_queue_overflow_total") == 30 + 1 - len(subscriber.received)
+    assert subscriber.max_running == 1
+
+
+def test_block_policy_backpressures_async_subscriber(make_bus):
+    bus = make_bus(queue_size=2, block_timeout=5.0)
+    subscriber = SlowSubscriber(delay=0.01)
+    bus.subscribe(EventType.USER_INPUT, subscriber.handle)
+
+    for i in range(10):
+        bus.publish(EventType.USER_INPUT, i)
+    bus.publish(EventType.USER_INPUT, "last")
+    assert subscriber.done.wait(5)
+
+    assert subscriber.received == [*range(10), "last"]
+    assert counter(bus, "eventbus_queue_overflow_total") == 0
+
+
+class BlockedStatusSubscriber:
+    """第一条状态事件处理时阻塞，使后续事件在队列中等待合并"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.done = threading.Event()
+        self.states = []
+
+    def handle(self, data: StatusUpdateEvent):
+        self.started.set()
+        self.release.wait(5)
+        self.states.append((data.session_id, data.state))
+        if data.session_id == "last":
+            self.done.set()
+
+
+def test_status_updates_coalesce_per_session(make_bus):
+    bus = make_bus()
+    subscriber = BlockedStatusSubscriber()
+    bus.subscribe(EventType.STATUS_UPDATE, subscriber.handle)
+
+    bus.publish(EventType.STATUS_UPDATE, StatusUpdateEvent(state="idle", session_id="first"))
+    assert subscriber.started.wait(5)
+    for state in ("queued", "processing"):
+        for session_id in ("a", "b"):
+            bus.publish(EventType.STATUS_UPDATE, StatusUpdateEvent(state=state, session_id=session_id))
+    bus.publish(EventType.STATUS_UPDATE, StatusUpdateEvent(state="idle", session_id="last"))
+    subscriber.release.set()
+    assert subscriber.done.wait(5)
+
+    assert subscriber.states == [("first", "idle"), ("a", "processing"), ("b", "processing"), ("last", "idle")]
+    assert counter(bus, "eventbus_coalesced_total") == 2
@@ -0,0 +1,55 @@
+import asyncio
+import re
+import zlib
+
+import pytest
+
+from core.query_router import QueryRouter, RouteAction, RouterConfig
+
+
+def bag_of_words(texts):
+    """按词哈希的词袋向量：共享词越多越相似，足以模拟示例与提问的最近质心分类"""
+    vectors = []
+    for text in texts:
+        vector = [0.0] * 64
+        for word in re.findall(r"[a-z]+|[一-鿿]", text.lower()):
+            vector[zlib.crc32(word.encode()) % 64] += 1.0
+        vectors.append(vector)
+    return vectors
+
+
+# 关于本项目的知识问题，用词却与命令类示例接近
+KNOWLEDGE_QUESTIONS = [
+    "how to kill a process started by the event bus",
+    "how to kill the event bus worker thread",
+    "linux下如何解压模型文件",
+]
+
+
+def route(router: QueryRouter, question: str):
+    return asyncio.run(router.route(question))
+
+
+@pytest.mark.parametrize("question", KNOWLEDGE_QUESTIONS)
+def test_knowledge_questions_are_not_skipped_by_default(question):
+    router = QueryRouter(RouterConfig(), embed=bag_of_words)
+    decision = route(router, question)
+    assert decision.action is RouteAction.RETRIEVE
+    assert decision.query_vector == bag_of_words([question])[0]
+
+
+def test_embedding_skip_must_be_enabled_explicitly():
+    # 宽松阈值下这类问题会被判为命令
+    config = RouterConfig(embedding_skip=True, min_similarity=0.3, min_margin=0.0)
+    decision = route(QueryRouter(config, embed=bag_of_words), KNOWLEDGE_QUESTIONS[0])
+    assert (decision.label, decision.action) == ("shell", RouteAction.SKIP)
+    assert decision.query_vector is None
+
+    config = RouterConfig(min_similarity=0.3, min_margin=0.0)
+    decision = route(QueryRouter(config, embed=bag_of_words), KNOWLEDGE_QUESTIONS[0])
+    assert (decision.label, decision.action) == ("shell", RouteAction.RETRIEVE)
+
+
+def test_rule_matched_greeting_still_skips():
+    decision = route(QueryRouter(RouterConfig(), embed=bag_of_words), "thanks!")
+    assert (decision.source, decision.action, decision.top_k) == ("rule", RouteAction.SKIP, 0)
@@ -0,0 +1,69 @@
+import asyncio
+
+from core.event_metrics import InMemoryMetricsSink
+from core.request_scheduler import FairRequestScheduler, SchedulerConfig
+
+
+class RecordingBus:
+    """记录调度器发布的状态事件（调度器只用到publish与metrics）"""
+
+    def __init__(self):
+        self.metrics = InMemoryMetricsSink()
+        self.states = []
+
+    def publish(self, event_type, data=None, async_exec=True):
+        self.states.append((data.session_id, data.state, data.queue_position))
+
+
+async def hold(scheduler: FairRequestScheduler, session_id: str, release: asyncio.Event):
+    async with scheduler.slot(session_id):
+        await release.wait()
+
+
+def test_publishes_session_states_in_order():
+    async def scenario():
+        bus = RecordingBus()
+        scheduler = FairRequestScheduler(SchedulerConfig(max_concurrent=1), bus)
+        release_a, release_b = asyncio.Event(), asyncio.Event()
+        a = asyncio.create_task(hold(scheduler, "a", release_a))
+        await asyncio.sleep(0)
+        b = asyncio.create_task(hold(scheduler, "b", release_b))
+        await asyncio.sleep(0)
+
+        release_a.set()
+        await a
+        release_b.set()
+        await b
+        return bus.states
+
+    assert asyncio.run(scenario()) == [
+        ("a", "processing", 0),
+        ("b", "queued", 1),
+        ("b", "processing", 0),
+        ("a", "idle", 0),
+        ("b", "idle", 0),
+    ]
+
+
+def test_cancelled_queued_request_returns_session_to_idle():
+    async def scenario():
+        bus = RecordingBus()
+        scheduler = FairRequestScheduler(SchedulerConfig(max_concurrent=1), bus)
+        release = asyncio.Event()
+        a = asyncio.create_task(hold(scheduler, "a", release))
+        await asyncio.sleep(0)
+        b = asyncio.create_task(hold(scheduler, "b", release))
+        await asyncio.sleep(0)
+
+        b.cancel()
+        await asyncio.gather(b, return_exceptions=True)
+        release.set()
+        await a
+        return bus.states
+
+    assert asyncio.run(scenario()) == [
+        ("a", "processing", 0),
+        ("b", "queued", 1),
+        ("b", "idle", 0),
+        ("a", "idle", 0),
+    ]
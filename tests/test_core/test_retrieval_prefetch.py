@@ -0,0 +1,36 @@
+import asyncio
+
+from core.retrieval_prefetch import PrefetchConfig, RetrievalPrefetcher
+
+
+async def search(text: str):
+    return [{"text": text}]
+
+
+def test_expired_prefetches_of_idle_sessions_are_pruned():
+    async def scenario():
+        prefetcher = RetrievalPrefetcher(search, PrefetchConfig(enabled=True, ttl_seconds=0.05))
+        for i in range(100):
+            prefetcher.submit(f"idle-{i}", "how is the event bus implemented")
+        await asyncio.sleep(0.1)  # 这些会话只输入了草稿，从未提问
+
+        prefetcher.submit("active", "where is the session history stored")
+        assert prefetcher.stats()["sessions"] == 1
+        assert await prefetcher.take("active", "where is the session history stored?") == [
+            {"text": "where is the session history stored"}
+        ]
+        assert prefetcher.stats()["sessions"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_fresh_prefetches_of_other_sessions_are_kept():
+    async def scenario():
+        prefetcher = RetrievalPrefetcher(search, PrefetchConfig(enabled=True, ttl_seconds=30))
+        prefetcher.submit("a", "how is the event bus implemented")
+        await asyncio.sleep(0)
+        prefetcher.submit("b", "where is the session history stored")
+        assert prefetcher.stats()["sessions"] == 2
+        assert await prefetcher.take("a", "how is the event bus implemented") is not None
+
+    asyncio.run(scenario())
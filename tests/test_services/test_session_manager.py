@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from services.session_manager import SessionManager, is_valid_session_id, new_session_id
+
+
+class DictConfig:
+    """按点分键读取的最小配置（对应ModelConfig.get）"""
+
+    def __init__(self, values: dict):
+        self.values = values
+
+    def get(self, key: str, default=None):
+        return self.values.get(key, default)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    m = SessionManager(DictConfig({"session.storage_path": str(tmp_path / "sessions")}))
+    yield m
+    m.close()
+
+
+def test_session_ids_are_unique_and_time_ordered():
+    ids = [new_session_id() for _ in range(1000)]
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert all(is_valid_session_id(i) for i in ids)
+
+
+@pytest.mark.parametrize("session_id", [
+    "../outside/secret", "..", "a/b_20250101120000", "20250101120000000000-zzzzzzzz", "", None, 42
+])
+def test_rejects_malformed_session_ids(session_id):
+    assert not is_valid_session_id(session_id)
+
+
+def test_accepts_legacy_session_ids():
+    assert is_valid_session_id("default_20250101120000")
+
+
+def test_open_session_does_not_escape_storage_path(tmp_path, manager):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (outside / "secret.json").write_text(json.dumps({"history": [], "metadata": {}, "wal_seq": 0}))
+
+    session_id = manager.open_session("../outside/secret")
+    assert session_id != "../outside/secret"
+    manager.add_message(session_id, "user", "hi")
+    manager.store.flush()
+    assert sorted(p.name for p in outside.iterdir()) == ["secret.json"]
+
+
+def test_open_session_resumes_existing_session(manager):
+    first = manager.create_session()
+    second = manager.create_session()
+    assert manager.get_current_session() == second
+    assert manager.open_session(first) == first
+    assert manager.open_session(new_session_id()) not in (first, second)
@@ -0,0 +1,154 @@
+import json
+import threading
+
+import pytest
+
+from services.session_store import apply_record
+from services.session_wal import SessionWAL, WALConfig
+
+
+def add(i: int) -> dict:
+    return {"op": "add", "message": {"role": "user", "content": f"m{i}", "metadata": {}, "timestamp": f"t{i}"}}
+
+
+class WALHarness:
+    """模拟SessionManager：在锁内修改内存会话并追加日志，压缩时在锁内生成快照"""
+
+    def __init__(self, path, **config):
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.wal = SessionWAL(path, WALConfig(fsync=False, **config), self.snapshot)
+        self.closed = False
+
+    def write(self, session_id: str, record: dict):
+        with self.lock:
+            apply_record(self.sessions.setdefault(session_id, {"history": [], "metadata": {}}), record)
+            self.wal.append(session_id, record)
+
+    def snapshot(self, session_id: str):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            return json.dumps({**session, "wal_seq": self.wal.last_seq(session_id)})
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.wal.flush()
+            self.wal.close()
+
+
+def reload(path, session_id: str):
+    """模拟进程重启后恢复会话：(重建的会话, 快照, 重放的记录)"""
+    wal = SessionWAL(path, WALConfig(fsync=False), lambda _: None)
+    try:
+        snapshot, records = wal.recover(session_id)
+        session = json.loads(json.dumps(snapshot)) if snapshot else {"history": [], "metadata": {}}
+        for record in records:
+            apply_record(session, record)
+        return session, snapshot, records
+    finally:
+        wal.close()
+
+
+def contents(session: dict) -> list:
+    return [m["content"] for m in session["history"]]
+
+
+@pytest.fixture
+def harness(tmp_path):
+    h = WALHarness(tmp_path, compact_every=1000)
+    yield h
+    h.close()
+
+
+def test_replays_log_after_restart(tmp_path, harness):
+    harness.write("s1", {"op": "create", "metadata": {"user_id": "u"}})
+    for i in range(3):
+        harness.write("s1", add(i))
+    harness.close()
+
+    session, snapshot, records = reload(tmp_path, "s1")
+    assert snapshot is None
+    assert [r["seq"] for r in records] == [1, 2, 3, 4]
+    assert contents(session) == ["m0", "m1", "m2"]
+    assert session["metadata"]["user_id"] == "u"
+
+
+def test_recovery_skips_records_already_in_snapshot(tmp_path):
+    # 快照已写入但日志未截断时崩溃：日志中序号不大于wal_seq的记录不能重复应用
+    (tmp_path / "s1.json").write_text(json.dumps({
+        "history": [add(0)["message"], add(1)["message"]], "metadata": {}, "wal_seq": 2
+    }))
+    (tmp_path / "s1.wal").write_text("".join(json.dumps({"seq": i + 1, **add(i)}) + "\n" for i in range(4)))
+
+    session, snapshot, records = reload(tmp_path, "s1")
+    assert [r["seq"] for r in records] == [3, 4]
+    assert contents(session) == ["m0", "m1", "m2", "m3"]
+
+
+def test_torn_final_line_is_dropped_and_truncated(tmp_path, harness):
+    for i in range(3):
+        harness.write("s1", add(i))
+    harness.close()
+    with open(tmp_path / "s1.wal", "a", encoding="utf-8") as f:
+        f.write('{"seq": 4, "op": "add", "mess')  # 崩溃时写了一半的记录
+
+    session, _, records = reload(tmp_path, "s1")
+    assert contents(session) == ["m0", "m1", "m2"]
+
+    # 恢复后继续写入：新记录不能接在残行后面
+    restarted = WALHarness(tmp_path, compact_every=1000)
+    restarted.sessions["s1"] = session
+    restarted.wal.recover("s1")
+    restarted.write("s1", add(3))
+    restarted.close()
+
+    session, _, records = reload(tmp_path, "s1")
+    assert contents(session) == ["m0", "m1", "m2", "m3"]
+    assert [r["seq"] for r in records] == [1, 2, 3, 4]
+
+
+def test_compaction_with_records_still_queued(tmp_path):
+    # 较长的组提交窗口使压缩请求与前后的记录落在同一批次
+    harness = WALHarness(tmp_path, compact_every=3, group_commit_ms=100)
+    for i in range(5):
+        harness.write("s1", add(i))
+    harness.wal.compact("s1")
+    for i in range(5, 8):
+        harness.write("s1", add(i))
+    harness.close()
+    assert harness.wal.stats()["compactions"] >= 1
+
+    session, snapshot, records = reload(tmp_path, "s1")
+    assert snapshot is not None
+    assert contents(session) == [f"m{i}" for i in range(8)]
+    assert contents(session) == contents(harness.sessions["s1"])
+
+
+def test_eviction_snapshot_keeps_later_records(tmp_path):
+    harness = WALHarness(tmp_path, compact_every=1000, group_commit_ms=100)
+    for i in range(3):
+        harness.write("s1", add(i))
+    # 会话移出内存时由调用方提供快照，之后的记录在同一批次内排在其后
+    harness.wal.compact("s1", harness.snapshot("s1"))
+    for i in range(3, 5):
+        harness.write("s1", add(i))
+    harness.close()
+
+    session, snapshot, records = reload(tmp_path, "s1")
+    assert contents(snapshot) == ["m0", "m1", "m2"]
+    assert [r["seq"] for r in records] == [4, 5]
+    assert contents(session) == ["m0", "m1", "m2", "m3", "m4"]
+
+
+def test_clear_is_replayed(tmp_path, harness):
+    for i in range(3):
+        harness.write("s1", add(i))
+    harness.write("s1", {"op": "clear"})
+    harness.write("s1", add(9))
+    harness.close()
+
+    session, _, _ = reload(tmp_path, "s1")
+    assert contents(session) == ["m9"]
@@ -0,0 +1,49 @@
+import sqlite3
+import threading
+
+import pytest
+
+from services.sqlite_session_store import SQLiteSessionStore, SQLiteStoreConfig
+
+
+def add(content: str) -> dict:
+    return {"op": "add", "message": {"role": "user", "content": content, "timestamp": content}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = SQLiteSessionStore(SQLiteStoreConfig(path=str(tmp_path / "sessions.db"), group_commit_ms=50,
+                                             busy_timeout_ms=100))
+    yield s
+    s.close()
+
+
+def test_failing_record_does_not_roll_back_its_batch(store):
+    store.append("a", {"op": "create", "metadata": {"user_id": "u"}})
+    store.append("a", add("m0"))
+    store._enqueue([("INSERT INTO missing_table VALUES (1)", ())])
+    store.append("b", {"op": "create", "metadata": {"user_id": "v"}})
+
+    assert store.flush() is False
+    assert [m["content"] for m in store.get_messages("a")] == ["m0"]
+    assert {s["session_id"] for s in store.list_sessions()} == {"a", "b"}
+    assert store.stats()["failed_records"] == 1
+    assert store.flush() is True
+
+
+def test_retries_while_database_is_locked(store, tmp_path):
+    store.append("a", {"op": "create", "metadata": {}})
+    assert store.flush()
+
+    blocker = sqlite3.connect(str(tmp_path / "sessions.db"), check_same_thread=False)
+    blocker.execute("BEGIN EXCLUSIVE")
+    timer = threading.Timer(0.2, blocker.rollback)
+    timer.start()
+    try:
+        store.append("a", add("m0"))
+        assert store.flush()
+    finally:
+        timer.join()
+        blocker.close()
+    assert [m["content"] for m in store.get_messages("a")] == ["m0"]
+    assert store.stats()["failed_records"] == 0
@@ -0,0 +1,45 @@
+# utils/jsonl_writer.py
+import json
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+class JsonlWriter:
+    """后台线程将记录批量追加写入JSONL文件（链路追踪span、路由决策等）"""
+
+    def __init__(self, path: str, name: str = "jsonl-writer"):
+        """
+        :param name: 写入线程名，便于区分不同用途的写入器
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def write(self, record: Dict[str, Any]):
+        self._queue.put(record)
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                item = self._queue.get()
+                batch = [item]
+                # 取出当前已排队的全部记录，一次写入
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                for record in batch:
+                    if record is None:
+                        f.flush()
+                        return
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+
+    def close(self, timeout: float = 2.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
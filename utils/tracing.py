@@ -0,0 +1,173 @@
+# utils/tracing.py
+"""
+轻量级请求链路追踪
+- span以correlation_id作为trace_id，父子关系通过contextvars在协程/线程池间自动传递
+- 关闭时span()只做一次布尔判断并返回共享的空上下文管理器，开销可忽略
+- span写入本地JSONL文件（后台线程批量写入），可用命令行查看单个请求的瀑布图:
+    python -m utils.tracing logs/traces.jsonl [correlation_id]
+"""
+import contextvars
+import itertools
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.jsonl_writer import JsonlWriter
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# (trace_id, 当前span_id)
+_current: contextvars.ContextVar[Optional[Tuple[str, Optional[int]]]] = contextvars.ContextVar(
+    "trace_context", default=None
+)
+_span_ids = itertools.count(1)
+# 关闭时共享的空span；as得到的属性字典写入后直接丢弃
+_NOOP = nullcontext({})
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self._exporter: Optional[JsonlWriter] = None
+
+    def configure(self, config: Dict[str, Any] = None):
+        """
+        :param config: process_config.tracing 配置 {"enabled": bool, "path": str}
+        """
+        config = config or {}
+        self.close()
+        if config.get("enabled", False):
+            self._exporter = JsonlWriter(config.get("path", "logs/traces.jsonl"), name="trace-exporter")
+            self.enabled = True
+            logger.info(f"链路追踪已启用: {self._exporter.path}")
+
+    def close(self):
+        self.enabled = False
+        if self._exporter:
+            self._exporter.close()
+            self._exporter = None
+
+    def _emit(self, trace_id: str, span_id: int, parent_id: Optional[int], name: str,
+              start: float, end: float, attrs: Dict[str, Any]):
+        exporter = self._exporter
+        if exporter is None:
+            return
+        exporter.write({
+            "trace_id": trace_id,
+            "span_id": span_id,
+            "parent_id": parent_id,
+            "name": name,
+            "start": start,
+            "duration_ms": round((end - start) * 1000, 3),
+            "thread": threading.current_thread().name,
+            **({"attrs": attrs} if attrs else {}),
+        })
+
+
+tracer = Tracer()
+
+
+def configure_tracing(config: Dict[str, Any] = None):
+    tracer.configure(config)
+
+
+def start_trace(correlation_id: str):
+    """在当前上下文（任务）中开始以correlation_id为trace_id的链路"""
+    if tracer.enabled:
+        _current.set((correlation_id, None))
+
+
+def span(name: str, **attrs):
+    """
+    记录一个span（同步与异步代码均可使用: with span("search"): ...）
+    未启用或当前上下文没有trace时返回空上下文管理器
+    """
+    if not tracer.enabled or _current.get() is None:
+        return _NOOP
+    return _span(name, attrs)
+
+
+@contextmanager
+def _span(name: str, attrs: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    trace_id, parent_id = _current.get()
+    span_id = next(_span_ids)
+    token = _current.set((trace_id, span_id))
+    start = time.time()
+    try:
+        yield attrs  # 允许在span内补充属性
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        tracer._emit(trace_id, span_id, parent_id, name, start, time.time(), attrs)
+
+
+def record_span(name: str, start: float, end: float, **attrs):
+    """记录一段已测量的区间（time.time()时间戳），如首token延迟"""
+    if not tracer.enabled:
+        return
+    context = _current.get()
+    if context is None:
+        return
+    trace_id, parent_id = context
+    tracer._emit(trace_id, next(_span_ids), parent_id, name, start, end, attrs)
+
+
+# ---------- 瀑布图 ----------
+def load_traces(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                span_data = json.loads(line)
+                traces.setdefault(span_data["trace_id"], []).append(span_data)
+    return traces
+
+
+def render_waterfall(spans: List[Dict[str, Any]], width: int = 60) -> str:
+    """按开始时间排列span，缩进表示父子关系，横条表示时间区间"""
+    if not spans:
+        return ""
+    by_id = {s["span_id"]: s for s in spans}
+
+    def depth(s: Dict[str, Any]) -> int:
+        d, parent = 0, s.get("parent_id")
+        while parent in by_id:
+            d, parent = d + 1, by_id[parent].get("parent_id")
+        return d
+
+    origin = min(s["start"] for s in spans)
+    total = max(s["start"] + s["duration_ms"] / 1000 for s in spans) - origin or 1e-9
+    lines = [f"trace {spans[0]['trace_id']}  total {total * 1000:.1f} ms"]
+    for s in sorted(spans, key=lambda s: (s["start"], -s["duration_ms"])):
+        offset = int((s["start"] - origin) / total * width)
+        length = max(1, int(s["duration_ms"] / 1000 / total * width))
+        label = ("  " * depth(s) + s["name"])[:32]
+        lines.append(f"{label:<32} {' ' * offset}{'█' * length:<{width - offset}} {s['duration_ms']:>10.1f} ms")
+    return "\n".join(lines)
+
+
+def main(argv: List[str]):
+    if not argv:
+        print("用法: python -m utils.tracing <traces.jsonl> [correlation_id]")
+        return 1
+    traces = load_traces(argv[0])
+    if len(argv) > 1:
+        print(render_waterfall(traces.get(argv[1], [])) or f"未找到trace: {argv[1]}")
+        return 0
+    # 未指定时列出最近的请求及其总耗时
+    for trace_id, spans in list(traces.items())[-20:]:
+        start = min(s["start"] for s in spans)
+        end = max(s["start"] + s["duration_ms"] / 1000 for s in spans)
+        print(f"{trace_id}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start))}  "
+              f"{(end - start) * 1000:>10.1f} ms  {len(spans)} spans")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))